@@ -0,0 +1,87 @@
+#! /usr/bin/env python
+"""Reading a file line by line while other greenthreads serve sockets: with
+the builtin file object the reader blocks the hub until it's done, while a
+greenfile.GreenFile gives the hub a turn each time it reads ahead.  Reports
+how long reading the file took and how the socket traffic fared meanwhile.
+
+The file is in the page cache, so this is the best case for blocking reads; a
+cold cache or a network filesystem makes them block for longer."""
+
+import os
+import sys
+import tempfile
+import time
+import eventlet
+from eventlet import greenfile
+
+LINES = 500000
+CONCURRENCY = 10
+
+if len(sys.argv) >= 2:
+    LINES = int(sys.argv[1])
+
+def echo(sock, addr):
+    while True:
+        data = sock.recv(64)
+        if not data:
+            break
+        sock.sendall(data)
+    sock.close()
+
+def ping(addr, latencies, done):
+    sock = eventlet.connect(addr)
+    while not done:
+        start = time.time()
+        sock.sendall('ping')
+        sock.recv(64)
+        latencies.append(time.time() - start)
+    sock.close()
+
+def count_lines(f):
+    count = 0
+    for line in f:
+        count += 1
+    f.close()
+    return count
+
+def run(opener, path):
+    listener = eventlet.listen(('127.0.0.1', 0))
+    server = eventlet.spawn(eventlet.serve, listener, echo)
+    addr = listener.getsockname()
+    latencies = []
+    done = []
+    pool = eventlet.GreenPool()
+    for i in xrange(CONCURRENCY):
+        pool.spawn(ping, addr, latencies, done)
+    eventlet.sleep(0.1)
+    del latencies[:]
+    start = time.time()
+    count = count_lines(opener(path))
+    elapsed = time.time() - start
+    # let the pings that the reader held up finish
+    eventlet.sleep(0.05)
+    rate = len(latencies) / (time.time() - start)
+    worst = max(latencies + [0])
+    done.append(True)
+    pool.waitall()
+    server.kill()
+    assert count == LINES
+    return elapsed, rate, worst
+
+if __name__ == '__main__':
+    fd, path = tempfile.mkstemp('_greenfile_benchmark')
+    try:
+        f = os.fdopen(fd, 'w')
+        for i in xrange(LINES):
+            f.write('%08d %s\n' % (i, 'x' * 60))
+        f.close()
+        # get it into the page cache
+        count_lines(open(path))
+        for opener, name in ((open, 'builtin file'),
+                             (greenfile.open, 'greenfile')):
+            elapsed, rate, worst = run(opener, path)
+            print "%d lines, %s: read in %.3fs, %.0f pings/s, " \
+                  "slowest %.1f ms" % (LINES, name, elapsed, rate,
+                                       worst * 1000)
+    finally:
+        os.remove(path)
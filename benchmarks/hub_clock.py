@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+"""Cost of reading the hub's clock, and how accurately timers fire."""
+
+import sys
+import time
+import random
+import eventlet
+import benchmarks
+from eventlet.hubs import get_hub, hub as hubmod
+
+sleeper_count = 1000
+rounds = 5
+
+if len(sys.argv) >= 2:
+    sleeper_count = int(sys.argv[1])
+
+hub = get_hub()
+# the main greenlet runs as a callback of the hub's, where hub.now() is the
+# reading cached at the start of the iteration
+eventlet.sleep(0)
+
+iters = 100000
+best = benchmarks.measure_best(5, iters, 'pass', lambda: None,
+    time.time, hubmod.monotonic, hub.now)
+print "time.time: %.3f usec" % (best[time.time] / iters * 1e6)
+print "monotonic: %.3f usec" % (best[hubmod.monotonic] / iters * 1e6)
+print "hub.now: %.3f usec" % (best[hub.now] / iters * 1e6)
+
+# what scheduling costs, hub included: most timers are timeouts that get
+# cancelled, with the hub getting a turn every so often
+def schedule(make, n=100000):
+    start = time.time()
+    for i in xrange(n):
+        make().cancel()
+        if not i % 100:
+            eventlet.sleep(0)
+    eventlet.sleep(0)
+    return (time.time() - start) / n
+
+best = min([schedule(lambda: hub.schedule_call_global(60, int))
+            for i in xrange(5)])
+print "schedule and cancel a timer: %.3f usec" % (best * 1e6)
+best = min([schedule(lambda: eventlet.Timeout(60)) for i in xrange(5)])
+print "start and cancel a Timeout: %.3f usec" % (best * 1e6)
+print "timers left in the hub: %d" % (hub.get_timers_count(),)
+
+def sleeper(results):
+    for i in xrange(rounds):
+        seconds = random.uniform(0, 0.05)
+        start = hubmod.monotonic()
+        eventlet.sleep(seconds)
+        results.append(hubmod.monotonic() - start - seconds)
+        # keep the hub a little busy, so that each iteration takes a while
+        sum(xrange(random.randint(0, 2000)))
+
+def measure(clock):
+    hub.clock = clock
+    results = []
+    pool = eventlet.GreenPool(sleeper_count)
+    for i in xrange(sleeper_count):
+        pool.spawn_n(sleeper, results)
+    pool.waitall()
+    results.sort()
+    early = len([r for r in results if r < 0])
+    print "%s: %d sleeps, %d woke early (worst %.3f ms), " \
+          "late by %.3f ms on average, %.3f ms at the median, %.3f ms at most" % (
+        clock.__name__, len(results), early, min(min(results), 0) * 1000,
+        sum(results) / len(results) * 1000,
+        results[len(results) // 2] * 1000, results[-1] * 1000)
+
+for clock in (time.time, hubmod.monotonic):
+    measure(clock)
+hub.clock = hubmod.monotonic
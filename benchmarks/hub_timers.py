@@ -7,6 +7,7 @@ import eventlet
 import random
 import time
 from eventlet.hubs import timer, get_hub
+from eventlet.timeout import Timeout
 
 timer_count = 100000
 
@@ -22,20 +23,76 @@ timeouts = [random.uniform(0, 10) for x in xrange(timer_count)]
 
 hub = get_hub()
 
-start = time.time()
+def run_expire(backend):
+    hub.set_timer_backend(backend)
+    start = time.time()
 
-scheduled = []
+    scheduled = []
 
-for timeout in timeouts:
-    t = timer.Timer(timeout, work, timeout)
-    t.schedule()
+    for timeout in timeouts:
+        t = timer.Timer(timeout, work, timeout)
+        t.schedule()
 
-    scheduled.append(t)
+        scheduled.append(t)
 
-hub.prepare_timers()
-hub.fire_timers(time.time()+11)
-hub.prepare_timers()
+    # the deadlines are only set once the hub files the timers
+    hub.prepare_timers()
+    clock = hub.clock
+    now = clock()+11
+    hub.clock = lambda: now
+    hub.prepare_timers()
+    hub.fire_timers(now)
+    hub.clock = clock
+    assert not hub.get_timers_count()
 
-end = time.time()
+    end = time.time()
+    return end-start
 
-print "Duration: %f" % (end-start,)
+# most timers in real code are Timeouts that get cancelled long before they
+# would fire; what matters is the cost of adding and cancelling them, and
+# how many dead entries the hub is left carrying
+def run_cancel(backend, keep_every=100):
+    hub.set_timer_backend(backend)
+    start = time.time()
+
+    for i, timeout in enumerate(timeouts):
+        t = hub.schedule_call_global(30 + timeout, work, timeout)
+        hub.prepare_timers()
+        if i % keep_every:
+            t.cancel()
+
+    end = time.time()
+    leftover = hub.get_timers_count()
+    del hub.timers[:]
+    del hub.next_timers[:]
+    if hub.wheel is not None:
+        hub.wheel.clear()
+    return end-start, leftover
+
+# the common case for timeouts: the guarded block finishes without ever
+# blocking, so the timer is only ever cancelled
+def run_timeouts(lazy):
+    start = time.time()
+
+    for i in xrange(timer_count):
+        t = Timeout(5, lazy=lazy)
+        t.cancel()
+
+    end = time.time()
+    # the hub's next iteration files whatever was scheduled
+    hub.prepare_timers()
+    leftover = hub.get_timers_count()
+    del hub.timers[:]
+    del hub.next_timers[:]
+    return end-start, leftover
+
+for backend in ('heap', 'wheel'):
+    print "%s expire duration: %f" % (backend, run_expire(backend))
+    duration, leftover = run_cancel(backend)
+    print "%s cancel duration: %f, timers left in hub: %d" % (
+        backend, duration, leftover)
+hub.set_timer_backend('heap')
+for lazy in (False, True):
+    duration, leftover = run_timeouts(lazy)
+    print "lazy=%s timeout duration: %f, timers left in hub: %d" % (
+        lazy, duration, leftover)
@@ -82,11 +82,23 @@ if __name__ == "__main__":
                       default=SIZE)
     parser.add_option('-c', '--concurrency', type='int', dest='concurrency', 
                       default=CONCURRENCY)
+    parser.add_option('--persistent', action='store_true', dest='persistent',
+                      default=False)
+    parser.add_option('--edge-triggered', action='store_true',
+                      dest='edge_triggered', default=False)
     
     opts, args = parser.parse_args()
     BYTES=opts.bytes
     SIZE=opts.size
     CONCURRENCY=opts.concurrency
+
+    from eventlet import hubs
+    hub = hubs.get_hub()
+    if opts.persistent or opts.edge_triggered:
+        hub.set_persistent(True, edge_triggered=opts.edge_triggered)
+    if hasattr(hub, 'syscall_stats'):
+        # starts the window that the saved-per-second rate covers
+        hub.syscall_stats()
     
     funcs = [launch_green_threads]
     if opts.threading:
@@ -95,6 +107,10 @@ if __name__ == "__main__":
                                       lambda: None, lambda: None,
                                       *funcs)
     print "green:", results[launch_green_threads]
+    if hasattr(hub, 'syscall_stats'):
+        stats = hub.syscall_stats()
+        print "registration syscalls: %(ctl_calls)d made, %(ctl_saved)d " \
+              "saved (%(saved_per_second).0f/s)" % stats
     if opts.threading:
         print "threads:", results[launch_heavy_threads]
         print "%", (results[launch_green_threads]-results[launch_heavy_threads])/results[launch_heavy_threads] * 100
\ No newline at end of file
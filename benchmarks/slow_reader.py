@@ -0,0 +1,65 @@
+#! /usr/bin/env python
+"""Sends 10MB payloads to a localhost reader that drains its socket slowly,
+comparing GreenSocket.sendall, which resumes partial writes from a buffer,
+with resending the unsent tail as a fresh string every time."""
+
+import sys
+import time
+import socket as _socket
+import eventlet
+from eventlet import greenio
+from eventlet.green import socket
+from eventlet.hubs import trampoline
+
+payload_size = 10 * 1024 * 1024
+if len(sys.argv) >= 2:
+    payload_size = int(sys.argv[1])
+
+payload = 'x' * payload_size
+
+def reader(sock):
+    # slow: small reads, and a short nap after each
+    total = 0
+    while total < payload_size:
+        data = sock.recv(16384)
+        if not data:
+            break
+        total += len(data)
+        eventlet.sleep(0.0002)
+    return total
+
+def sendall_copying(sock, data):
+    # what GreenSocket.sendall used to do
+    fd = sock.fd
+    total_sent = 0
+    while total_sent < len(data):
+        try:
+            total_sent += fd.send(data[total_sent:])
+        except _socket.error, e:
+            if e[0] not in greenio.SOCKET_BLOCKING:
+                raise
+        if total_sent < len(data):
+            trampoline(fd, write=True)
+
+def run(send):
+    listener = eventlet.listen(('127.0.0.1', 0))
+    client = eventlet.connect(listener.getsockname())
+    client.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 64 * 1024)
+    server, addr = listener.accept()
+    gt = eventlet.spawn(reader, server)
+    start = time.time()
+    cpu = time.clock()
+    send(client, payload)
+    received = gt.wait()
+    cpu = time.clock() - cpu
+    elapsed = time.time() - start
+    assert received == payload_size, received
+    client.close()
+    server.close()
+    listener.close()
+    return elapsed, cpu
+
+for name, send in (('copying', sendall_copying),
+                   ('zero-copy', greenio.GreenSocket.sendall)):
+    elapsed, cpu = run(send)
+    print "%s sendall: %.3f s elapsed, %.3f s cpu" % (name, elapsed, cpu)
@@ -0,0 +1,46 @@
+#! /usr/bin/env python
+"""Cost of many small blocking calls made through tpool: os.stat() on the
+same file, executed one by one and sent to the pool in batches."""
+
+import os
+import sys
+import time
+from eventlet import tpool
+
+CALLS = 2000
+
+if len(sys.argv) >= 2:
+    CALLS = int(sys.argv[1])
+
+path = os.path.abspath(__file__)
+paths = [path] * CALLS
+
+def one_by_one():
+    for p in paths:
+        tpool.execute(os.stat, p)
+
+def batched():
+    tpool.map(os.stat, paths)
+
+def one_batch():
+    tpool.map(os.stat, paths, chunksize=CALLS)
+
+def measure(func):
+    best = None
+    for i in xrange(3):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+if __name__ == '__main__':
+    # start the pool's threads before measuring
+    tpool.map(os.stat, paths)
+    for func, name in ((one_by_one, 'one by one'),
+                       (batched, 'batched over the pool'),
+                       (one_batch, 'in a single batch')):
+        elapsed = measure(func)
+        print "%d stat calls, %s: %.1f us per call" % (
+            CALLS, name, elapsed / CALLS * 1e6)
@@ -0,0 +1,74 @@
+#! /usr/bin/env python
+"""Requests per second that eventlet.wsgi serves to a hello world app, with
+keep-alive clients running in the same process."""
+
+import sys
+import time
+import eventlet
+from eventlet import wsgi
+
+CONCURRENCY = 10
+REQUESTS = 2000
+
+if len(sys.argv) >= 2:
+    REQUESTS = int(sys.argv[1])
+
+request = ('GET /hello?name=world HTTP/1.1\r\n'
+           'Host: localhost\r\n'
+           'User-Agent: benchmark\r\n'
+           'Accept: text/html,application/xhtml+xml,*/*;q=0.8\r\n'
+           'Accept-Language: en-us,en;q=0.5\r\n'
+           'Accept-Encoding: gzip,deflate\r\n'
+           'Cookie: session=0123456789abcdef; theme=dark\r\n'
+           '\r\n')
+
+def hello_world(env, start_response):
+    start_response('200 OK', [('content-type', 'text/plain'),
+                              ('x-powered-by', 'eventlet')])
+    return ['Hello, world!\n']
+
+class NullLog(object):
+    def write(self, data):
+        pass
+
+def client(addr, count):
+    sock = eventlet.connect(addr)
+    buf = ''
+    for i in xrange(count):
+        sock.sendall(request)
+        while True:
+            end = buf.find('\r\n\r\n')
+            if end >= 0:
+                head = buf[:end].lower()
+                start = head.find('content-length:') + len('content-length:')
+                length = int(head[start:head.find('\r\n', start)])
+                end += 4 + length
+                if len(buf) >= end:
+                    buf = buf[end:]
+                    break
+            data = sock.recv(65536)
+            assert data, "connection closed"
+            buf += data
+    sock.close()
+
+def run():
+    listener = eventlet.listen(('127.0.0.1', 0))
+    server = eventlet.spawn(wsgi.server, listener, hello_world, log=NullLog())
+    addr = listener.getsockname()
+    pool = eventlet.GreenPool(CONCURRENCY)
+    start = time.time()
+    cpu = time.clock()
+    for i in xrange(CONCURRENCY):
+        pool.spawn(client, addr, REQUESTS // CONCURRENCY)
+    pool.waitall()
+    cpu = time.clock() - cpu
+    elapsed = time.time() - start
+    server.kill()
+    return elapsed, cpu
+
+if __name__ == '__main__':
+    total = (REQUESTS // CONCURRENCY) * CONCURRENCY
+    best = min(run() for i in xrange(3))
+    elapsed, cpu = best
+    print "%d requests: %.0f requests/s, %.1f usec cpu per request" % (
+        total, total / elapsed, cpu / total * 1e6)
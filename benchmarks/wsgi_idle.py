@@ -0,0 +1,79 @@
+#! /usr/bin/env python
+"""Memory that eventlet.wsgi spends on idle keep-alive connections: opens
+many connections, makes one request on each, leaves them idle and reports
+how much the process grew per connection.  Compares connections parked with
+the hub, which hold no greenthread while idle, with connections that wait for
+their next request in a greenthread of their own.
+
+Each mode runs in a fresh process; the client ends of the connections live in
+the same process, which adds the same amount to both."""
+
+import gc
+import os
+import sys
+import eventlet
+from eventlet import wsgi
+
+CONNECTIONS = 5000
+
+request = 'GET / HTTP/1.1\r\nHost: localhost\r\n\r\n'
+
+def hello_world(env, start_response):
+    start_response('200 OK', [('Content-type', 'text/plain'),
+                              ('Content-Length', '13')])
+    return ['Hello, world!']
+
+class NullLog(object):
+    def write(self, data):
+        pass
+
+def rss():
+    # resident set size in kB, from /proc on Linux
+    for line in open('/proc/self/status'):
+        if line.startswith('VmRSS:'):
+            return int(line.split()[1])
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def client(addr):
+    sock = eventlet.connect(addr)
+    sock.sendall(request)
+    data = ''
+    while not data.endswith('Hello, world!'):
+        data += sock.recv(4096)
+    return sock
+
+def measure(park, count):
+    listener = eventlet.listen(('127.0.0.1', 0), backlog=1024)
+    eventlet.spawn_n(wsgi.server, listener, hello_world, log=NullLog(),
+                     max_size=count + 10, park_idle=park)
+    addr = listener.getsockname()
+    # warm up, so that the measurement doesn't include one-off costs
+    client(addr).close()
+    eventlet.sleep(0.1)
+    gc.collect()
+    before = rss()
+    pool = eventlet.GreenPool(100)
+    socks = list(pool.imap(client, [addr] * count))
+    eventlet.sleep(0.1)
+    gc.collect()
+    grown = rss() - before
+    if park:
+        mode = 'parked with the hub'
+    else:
+        mode = 'one greenthread each'
+    print "%d idle connections, %s: %.0f kB, %.2f kB per connection" % (
+        count, mode, grown, float(grown) / count)
+    for sock in socks:
+        sock.close()
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if args and args[0] in ('--park', '--no-park'):
+        measure(args[0] == '--park', int(args[1]))
+    else:
+        if args:
+            CONNECTIONS = int(args[0])
+        for mode in ('--park', '--no-park'):
+            os.spawnl(os.P_WAIT, sys.executable, sys.executable,
+                      os.path.abspath(__file__), mode, str(CONNECTIONS))
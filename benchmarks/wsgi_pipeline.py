@@ -0,0 +1,85 @@
+#! /usr/bin/env python
+"""Throughput of eventlet.wsgi for clients that pipeline their requests,
+sending a batch of them at once and then reading all the responses, with the
+responses to pipelined requests sent together and sent one by one."""
+
+import sys
+import time
+import eventlet
+from eventlet import greenio
+from eventlet import wsgi
+
+CONCURRENCY = 10
+DEPTH = 16
+REQUESTS = 20000
+
+if len(sys.argv) >= 2:
+    DEPTH = int(sys.argv[1])
+
+request = ('GET /hello HTTP/1.1\r\n'
+           'Host: localhost\r\n'
+           'User-Agent: benchmark\r\n'
+           '\r\n')
+
+def hello_world(env, start_response):
+    start_response('200 OK', [('Content-type', 'text/plain')])
+    return ['Hello, world!\n']
+
+class NullLog(object):
+    def write(self, data):
+        pass
+
+def client(addr, count):
+    sock = eventlet.connect(addr)
+    batch = request * DEPTH
+    buf = ''
+    for i in xrange(count // DEPTH):
+        sock.sendall(batch)
+        left = DEPTH
+        while left:
+            end = buf.find('\r\n\r\n')
+            if end >= 0:
+                head = buf[:end].lower()
+                start = head.find('content-length:') + len('content-length:')
+                length = int(head[start:head.find('\r\n', start)])
+                end += 4 + length
+                if len(buf) >= end:
+                    buf = buf[end:]
+                    left -= 1
+                    continue
+            data = sock.recv(65536)
+            assert data, "connection closed"
+            buf += data
+    sock.close()
+
+sends = [0]
+orig_sendall = greenio.GreenSocket.sendall
+def counting_sendall(self, data, *args):
+    sends[0] += 1
+    return orig_sendall(self, data, *args)
+greenio.GreenSocket.sendall = counting_sendall
+
+def run(batch_size):
+    wsgi.HttpProtocol.pipeline_batch_size = batch_size
+    listener = eventlet.listen(('127.0.0.1', 0))
+    server = eventlet.spawn(wsgi.server, listener, hello_world, log=NullLog())
+    addr = listener.getsockname()
+    pool = eventlet.GreenPool(CONCURRENCY)
+    sends[0] = 0
+    start = time.time()
+    for i in xrange(CONCURRENCY):
+        pool.spawn(client, addr, REQUESTS // CONCURRENCY)
+    pool.waitall()
+    elapsed = time.time() - start
+    server.kill()
+    return elapsed, sends[0]
+
+if __name__ == '__main__':
+    total = (REQUESTS // CONCURRENCY // DEPTH) * DEPTH * CONCURRENCY
+    for batch_size, name in ((0, 'one by one'), (65536, 'batched')):
+        elapsed, sent = min([run(batch_size) for i in xrange(3)])
+        # the clients' own sendall calls are counted too
+        sent -= total // DEPTH
+        print "depth %d, responses %s: %.0f requests/s, %.2f sends " \
+              "per request" % (DEPTH, name, total / elapsed,
+                               float(sent) / total)
@@ -0,0 +1,80 @@
+#! /usr/bin/env python
+"""Throughput of eventlet.wsgi for an application that writes its response
+through the write() callable in many small pieces, with the writes coalesced
+into one send and sent one by one."""
+
+import sys
+import time
+import eventlet
+from eventlet import greenio
+from eventlet import wsgi
+
+CONCURRENCY = 10
+WRITES = 50
+REQUESTS = 2000
+
+if len(sys.argv) >= 2:
+    WRITES = int(sys.argv[1])
+
+request = ('GET /rows HTTP/1.1\r\n'
+           'Host: localhost\r\n'
+           'User-Agent: benchmark\r\n'
+           '\r\n')
+
+def rows(env, start_response):
+    write = start_response('200 OK', [('Content-type', 'text/plain'),
+                                      ('Content-Length', str(WRITES * 8))])
+    for i in xrange(WRITES):
+        write('row %03d\n' % (i % 1000))
+    return []
+
+class NullLog(object):
+    def write(self, data):
+        pass
+
+def client(addr, count):
+    sock = eventlet.connect(addr)
+    buf = ''
+    for i in xrange(count):
+        sock.sendall(request)
+        while True:
+            end = buf.find('\r\n\r\n')
+            if end >= 0 and len(buf) >= end + 4 + WRITES * 8:
+                buf = buf[end + 4 + WRITES * 8:]
+                break
+            data = sock.recv(65536)
+            assert data, "connection closed"
+            buf += data
+    sock.close()
+
+sends = [0]
+orig_sendall = greenio.GreenSocket.sendall
+def counting_sendall(self, data, *args):
+    sends[0] += 1
+    return orig_sendall(self, data, *args)
+greenio.GreenSocket.sendall = counting_sendall
+
+def run(coalesce_size):
+    wsgi.HttpProtocol.coalesce_size = coalesce_size
+    listener = eventlet.listen(('127.0.0.1', 0))
+    server = eventlet.spawn(wsgi.server, listener, rows, log=NullLog())
+    addr = listener.getsockname()
+    pool = eventlet.GreenPool(CONCURRENCY)
+    sends[0] = 0
+    start = time.time()
+    for i in xrange(CONCURRENCY):
+        pool.spawn(client, addr, REQUESTS // CONCURRENCY)
+    pool.waitall()
+    elapsed = time.time() - start
+    server.kill()
+    return elapsed, sends[0]
+
+if __name__ == '__main__':
+    total = (REQUESTS // CONCURRENCY) * CONCURRENCY
+    for coalesce_size, name in ((0, 'one by one'), (65536, 'coalesced')):
+        elapsed, sent = min([run(coalesce_size) for i in xrange(3)])
+        # the clients' own sendall calls are counted too
+        sent -= total
+        print "%d writes per response, %s: %.0f requests/s, %.2f sends " \
+              "per response" % (WRITES, name, total / elapsed,
+                                float(sent) / total)
@@ -156,7 +156,7 @@ class Queue(object):
             exc = (exc, )
         self.items.append((result, exc))
         if self._waiters:
-            hubs.get_hub().schedule_call_global(0, self._do_send)
+            hubs.get_hub().call_soon(self._do_send)
 
     def send_exception(self, *args):
         # the arguments are the same as for greenlet.throw
@@ -232,13 +232,13 @@ class Channel(object):
         if eventlet.getcurrent() is hubs.get_hub().greenlet:
             self.items.append((result, exc))
             if self._waiters:
-                hubs.get_hub().schedule_call_global(0, self._do_switch)
+                hubs.get_hub().call_soon(self._do_switch)
         else:
             self.items.append((result, exc))
             # note that send() does not work well with timeouts. if your timeout fires
             # after this point, the item will remain in the queue
             if self._waiters:
-                hubs.get_hub().schedule_call_global(0, self._do_switch)
+                hubs.get_hub().call_soon(self._do_switch)
             if len(self.items) > self.max_size:
                 self._senders.add(eventlet.getcurrent())
                 try:
@@ -272,14 +272,14 @@ class Channel(object):
         if self.items:
             result, exc = self.items.popleft()
             if len(self.items) <= self.max_size:
-                hubs.get_hub().schedule_call_global(0, self._do_switch)
+                hubs.get_hub().call_soon(self._do_switch)
             if exc is None:
                 return result
             else:
                 eventlet.getcurrent().throw(*exc)
         else:
             if self._senders:
-                hubs.get_hub().schedule_call_global(0, self._do_switch)
+                hubs.get_hub().call_soon(self._do_switch)
             self._waiters.add(eventlet.getcurrent())
             try:
                 result, exc = hubs.get_hub().switch()
@@ -236,25 +236,50 @@ class BaseConnectionPool(Pool):
         self.clear()
 
 
+_timed_out = object()
+
+def _close_connection(conn):
+    conn.close()
+
+
 class TpooledConnectionPool(BaseConnectionPool):
     """A pool which gives out :class:`~eventlet.tpool.Proxy`-based database
     connections.
+
+    The connections' calls go to the default tpool executor, or to the
+    :class:`~eventlet.tpool.Executor` passed as the *executor* keyword
+    argument, which keeps slow queries from holding up other users of tpool.
     """
+    def __init__(self, db_module, *args, **kwargs):
+        self.executor = kwargs.pop('executor', None)
+        super(TpooledConnectionPool, self).__init__(db_module, *args, **kwargs)
+
     def create(self):
+        kwargs = dict(self._kwargs)
+        kwargs['executor'] = self.executor
         return self.connect(self._db_module,
                                     self.connect_timeout,
                                     *self._args,
-                                    **self._kwargs)
+                                    **kwargs)
 
     @classmethod
     def connect(cls, db_module, connect_timeout, *args, **kw):
-        t = timeout.Timeout(connect_timeout, ConnectTimeout())
-        try:
-            from eventlet import tpool
-            conn = tpool.execute(db_module.connect, *args, **kw)
-            return tpool.Proxy(conn, autowrap_names=('cursor',))
-        finally:
-            t.cancel()
+        from eventlet import tpool
+        executor = kw.pop('executor', None)
+        if executor is None:
+            execute_with_timeout = tpool.execute_with_timeout
+        else:
+            execute_with_timeout = executor.execute_with_timeout
+        # a connection that turns up after the timeout is closed, rather
+        # than left open until it's garbage collected
+        kw['timeout_value'] = _timed_out
+        kw['discard'] = _close_connection
+        conn = execute_with_timeout(connect_timeout, db_module.connect,
+                                    *args, **kw)
+        if conn is _timed_out:
+            raise ConnectTimeout()
+        return tpool.Proxy(conn, autowrap_names=('cursor',),
+                           executor=executor)
 
 
 class RawConnectionPool(BaseConnectionPool):
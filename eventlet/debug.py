@@ -6,9 +6,18 @@ import sys
 import linecache
 import string
 import inspect
+import collections
+import traceback
+import weakref
+
+from eventlet import patcher
+from eventlet.support import greenlets as greenlet
+threading = patcher.original('threading')
+time = patcher.original('time')
 
 __all__ = ['spew', 'unspew', 'format_hub_listeners', 'hub_listener_stacks', 
-'hub_exceptions', 'tpool_exceptions']
+'hub_exceptions', 'tpool_exceptions', 'hub_stall_detection',
+'format_hub_stalls', 'StallDetector']
 
 class Spew(object):
     """
@@ -90,6 +99,13 @@ def format_hub_timers():
     result = ['TIMERS:']
     for l in hub.timers:
         result.append(repr(l))
+    for l in getattr(hub, 'ready', ()):
+        result.append(repr(l))
+    if getattr(hub, 'wheel', None) is not None:
+        for l in hub.expired:
+            result.append(repr(l))
+        for timer, when in hub.wheel:
+            result.append(repr((when, timer)))
     return os.linesep.join(result)
     
 def hub_listener_stacks(state):
@@ -125,3 +141,149 @@ def tpool_exceptions(state):
     it normally does."""
     from eventlet import tpool
     tpool.QUIET = not state
+
+
+class StallDetector(object):
+    """Watches a hub from a native thread and records every time the hub
+    greenlet is kept away for longer than *threshold* seconds, which means
+    that no I/O was serviced and no timers fired meanwhile.  Typically that
+    is a greenthread running CPU-bound code without yielding.
+
+    The hub only bumps a counter when it gets control back and after each
+    timer or callback it runs, so leaving the detector on costs next to
+    nothing, and a stall is always one callback or greenthread that ran
+    too long rather than many short ones that happened to run in a row.  The watchdog thread compares that
+    counter every *interval* seconds (a quarter of *threshold* by default),
+    so measured durations are accurate to about *interval*.  Once a stall
+    crosses the threshold, the stack of whatever is running in the hub's
+    thread is captured, along with the greenthread's spawn site if spawn
+    sites are being recorded.  The last *keep* stalls are kept in
+    :attr:`stalls`, and :attr:`histogram` maps power-of-two multiples of
+    *threshold* to the number of stalls no longer than that.
+
+    Create it in the hub's thread; use :func:`hub_stall_detection` rather
+    than creating one directly.
+    """
+    def __init__(self, hub, threshold=0.1, interval=None, keep=100):
+        self.hub = weakref.ref(hub)
+        self.threshold = threshold
+        self.interval = interval or threshold / 4.0
+        self.keep = keep
+        self.stalls = collections.deque()
+        self.histogram = {}
+        self.count = 0
+        self.total = 0.0
+        self.ident = threading._get_ident()
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._watch,
+                                       name='eventlet stall detector')
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _watch(self):
+        mark = None
+        since = None
+        stall = None
+        while self.running:
+            time.sleep(self.interval)
+            hub = self.hub()
+            if hub is None:
+                break
+            now = time.time()
+            if hub.switches != mark or hub.waiting or not hub.running:
+                if stall is not None:
+                    self._finish(stall, now - since)
+                    stall = None
+                mark = hub.switches
+                since = now
+                del hub
+                continue
+            del hub
+            if stall is None and now - since >= self.threshold:
+                stall = self._record(since, now)
+
+    def _record(self, since, now):
+        frame = sys._current_frames().get(self.ident)
+        stall = {'started': since, 'duration': now - since,
+                 'stack': [], 'greenlet': None, 'spawn_site': None}
+        if frame is None:
+            return stall
+        stall['stack'] = traceback.extract_stack(frame)
+        # the bottom frame belongs to the run function of the greenlet that
+        # is hogging the loop, which is GreenThread.main for greenthreads
+        while frame.f_back is not None:
+            frame = frame.f_back
+        glet = frame.f_locals.get('self')
+        if isinstance(glet, greenlet.greenlet):
+            stall['greenlet'] = repr(glet)
+            stall['spawn_site'] = getattr(glet, 'spawn_site', None)
+        del frame, glet
+        self.stalls.append(stall)
+        if len(self.stalls) > self.keep:
+            self.stalls.popleft()
+        return stall
+
+    def _finish(self, stall, duration):
+        stall['duration'] = duration
+        self.count += 1
+        self.total += duration
+        bound = self.threshold
+        while duration > bound:
+            bound *= 2
+        self.histogram[bound] = self.histogram.get(bound, 0) + 1
+
+
+def hub_stall_detection(state, threshold=0.1, spawn_sites=False):
+    """Toggles a :class:`StallDetector` on the current hub, which records
+    every time some greenthread keeps the hub from running for longer than
+    *threshold* seconds.  Stalls can be inspected with
+    :func:`format_hub_stalls`.  If *spawn_sites* is true, every greenthread
+    also records where it was spawned from, which costs a stack walk per
+    :func:`~eventlet.greenthread.spawn`.  Returns the detector, if any.
+    The pyevent and twisted hubs can't tell running callbacks from waiting
+    for events, so no stalls are ever recorded on them.
+    """
+    from eventlet import hubs
+    from eventlet import greenthread
+    hub = hubs.get_hub()
+    greenthread._record_spawn_sites = bool(state and spawn_sites)
+    if not state:
+        hub.set_stall_detector(None)
+        return None
+    detector = StallDetector(hub, threshold)
+    hub.set_stall_detector(detector)
+    detector.start()
+    return detector
+
+def format_hub_stalls():
+    """ Returns a formatted string describing the stalls recorded on the
+    current hub since :func:`hub_stall_detection` was turned on, most recent
+    last.
+    """
+    from eventlet import hubs
+    detector = hubs.get_hub().stall_detector
+    if detector is None:
+        return 'STALLS: stall detection is off'
+    result = ['STALLS: %d, %.3fs in total' % (detector.count, detector.total)]
+    for bound in sorted(detector.histogram):
+        result.append('  <= %.3fs: %d' % (bound, detector.histogram[bound]))
+    for stall in list(detector.stalls):
+        result.append('%.3fs stall in %s:' % (
+            stall['duration'], stall['greenlet'] or 'unknown greenlet'))
+        result.extend(line.rstrip() for line in
+                      traceback.format_list(stall['stack']))
+        if stall['spawn_site']:
+            result.append('spawned at:')
+            result.extend(line.rstrip() for line in
+                          traceback.format_list(stall['spawn_site']))
+    return os.linesep.join(result)
@@ -154,8 +154,8 @@ class Event(object):
         self._exc = exc
         hub = hubs.get_hub()
         if self._waiters:
-            hub.schedule_call_global(
-                0, self._do_send, self._result, self._exc, self._waiters.copy())
+            hub.call_soon(
+                self._do_send, self._result, self._exc, self._waiters.copy())
 
     def _do_send(self, result, exc, waiters):
         while waiters:
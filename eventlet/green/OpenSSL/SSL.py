@@ -120,6 +120,10 @@ class GreenConnection(greenio.GreenSocket):
                            timeout_exc=socket.timeout)
                            
     send = write
+
+    def sendfile(self, file, offset=0, count=None):
+        # the data has to go through the SSL connection
+        return self._sendfile_use_send(file, offset, count)
     
     def sendall(self, data):
         """Send "all" data on the connection. This calls send() repeatedly until
@@ -43,9 +43,16 @@ def _gethostbyname_twisted(name):
     from eventlet.twistedutil import block_on as _block_on
     return _block_on(reactor.resolve(name))
 
+_resolver = None
+
 def _gethostbyname_tpool(name):
-    from eventlet import tpool
-    return tpool.execute(
+    global _resolver
+    if _resolver is None:
+        from eventlet import tpool
+        # lookups get threads of their own, so that a slow DNS server
+        # doesn't hold up the other users of tpool
+        _resolver = tpool.Executor('gethostbyname')
+    return _resolver.execute(
         __original_gethostbyname__, name)
 
 #     def getaddrinfo(*args, **kw):
@@ -9,6 +9,7 @@ import time
 from eventlet.hubs import trampoline
 from thread import get_ident
 from eventlet.greenio import set_nonblocking, GreenSocket, SOCKET_CLOSED, CONNECT_ERR, CONNECT_SUCCESS
+from eventlet.greenio import unsent_tail
 orig_socket = __import__('socket')
 socket = orig_socket.socket
 timeout_exc = orig_socket.timeout
@@ -145,23 +146,31 @@ class GreenSSLSocket(__ssl.SSLSocket):
                     self.__class__)
             amount = len(data)
             count = 0
+            pending = data
             while (count < amount):
-                v = self.send(data[count:])
+                v = self.send(pending)
                 count += v
+                pending = unsent_tail(data, count)
             return amount
         else:
-            while True:
+            amount = len(data)
+            count = 0
+            pending = data
+            while (count < amount):
                 try:
-                    return socket.sendall(self, buflen, flags)
+                    count += socket.send(self, pending, flags)
                 except orig_socket.error, e:
                     if self.act_non_blocking:
                         raise
                     if e[0] == errno.EWOULDBLOCK:
                         trampoline(self.fileno(), write=True, 
                                    timeout=self.gettimeout(), timeout_exc=timeout_exc('timed out'))
-                    if e[0] in SOCKET_CLOSED:
+                    elif e[0] in SOCKET_CLOSED:
                         return ''
-                    raise
+                    else:
+                        raise
+                pending = unsent_tail(data, count)
+            return amount
 
     def recv(self, buflen=1024, flags=0):
         # *NOTE: gross, copied code from ssl.py becase it's not factored well enough to be used as-is
@@ -0,0 +1,279 @@
+"""Regular files whose I/O doesn't block the hub.
+
+Reading or writing a file on disk never returns ``EAGAIN``, so the
+trampolining that :mod:`~eventlet.greenio` does for sockets and pipes can't
+help with it: a slow disk, or a file on a network filesystem, blocks every
+greenthread in the process.  :class:`GreenFile` does its system calls in
+:mod:`~eventlet.tpool` threads instead.  It reads ahead and buffers writes in
+large blocks, so iterating over the lines of a file costs one round trip to a
+thread per block rather than one per line::
+
+    from eventlet import greenfile
+    f = greenfile.open('/var/log/big.log')
+    for line in f:
+        ...
+"""
+
+import __builtin__
+import os
+from cStringIO import StringIO
+
+from eventlet import tpool
+
+__all__ = ['GreenFile', 'open']
+
+DEFAULT_BUFSIZE = 262144
+
+
+class GreenFile(object):
+    """
+    A file object for the file *name*, opened with *mode* as by the builtin
+    :func:`open`, whose reads, writes, seeks and the like run in
+    :mod:`~eventlet.tpool` threads, as does opening the file.  Reads fetch at
+    least *bufsize* bytes at a time, and writes are buffered until there are
+    *bufsize* bytes of them, or until :meth:`flush`, :meth:`seek` or
+    :meth:`close`.  The calls go to *executor*, an
+    :class:`~eventlet.tpool.Executor`, or to the default one if it's None.
+
+    Newlines aren't translated, whatever the mode.  Like other file objects,
+    a GreenFile shouldn't be used by several greenthreads at once.
+    """
+    def __init__(self, name, mode='r', bufsize=DEFAULT_BUFSIZE,
+                 executor=None):
+        if executor is None:
+            self._execute = tpool.execute
+        else:
+            self._execute = executor.execute
+        self.bufsize = bufsize
+        # the file itself is unbuffered; the buffering is done here, where
+        # it doesn't cost a trip to a thread
+        self._file = self._execute(__builtin__.open, name, mode, 0)
+        self.name = name
+        self.mode = mode
+        # data read ahead, and how much of it has been read
+        self._rbuf = ''
+        self._rpos = 0
+        # the lines that an iteration is going through, and where they
+        # start in the data read ahead
+        self._lines = None
+        self._wbuf = []
+        self._wbuf_len = 0
+
+    def __repr__(self):
+        if self.closed:
+            state = 'closed'
+        else:
+            state = 'open'
+        return '<%s %s %r, mode %r at 0x%x>' % (
+            type(self).__name__, state, self.name, self.mode, id(self))
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def isatty(self):
+        return False
+
+    def _check_open(self):
+        if self._file.closed:
+            raise ValueError("I/O operation on closed file")
+        if self._lines is not None:
+            # another read method is used in the middle of an iteration:
+            # the reader is where the iteration got to, and the iteration
+            # goes on from wherever the other method leaves it
+            lines, start = self._lines
+            self._rpos = start + lines.tell()
+            lines.seek(0, 2)
+            self._lines = None
+
+    def _drop_readahead(self):
+        # moves the file's position back to where the reader is, before the
+        # data read ahead
+        unread = len(self._rbuf) - self._rpos
+        self._rbuf = ''
+        self._rpos = 0
+        if unread:
+            self._execute(self._file.seek, -unread, 1)
+
+    def _fill(self, size):
+        # reads at least size more bytes, if there are that many, and
+        # returns False at the end of the file
+        data = self._execute(self._file.read, max(size, self.bufsize))
+        if not data:
+            return False
+        if self._rpos:
+            self._rbuf = self._rbuf[self._rpos:] + data
+            self._rpos = 0
+        else:
+            self._rbuf += data
+        return True
+
+    def read(self, size=-1):
+        self._check_open()
+        if self._wbuf:
+            self.flush()
+        buf = self._rbuf
+        pos = self._rpos
+        if size is None or size < 0:
+            rest = self._execute(self._file.read)
+            self._rbuf = ''
+            self._rpos = 0
+            return buf[pos:] + rest
+        if len(buf) - pos < size:
+            self._fill(size - (len(buf) - pos))
+            buf = self._rbuf
+            pos = self._rpos
+        self._rpos = pos + size
+        if self._rpos >= len(buf):
+            self._rbuf = ''
+            self._rpos = 0
+        return buf[pos:pos + size]
+
+    def readline(self, size=-1):
+        self._check_open()
+        if self._wbuf:
+            self.flush()
+        if size is not None and size < 0:
+            size = None
+        # how much of what's read ahead has been searched for a newline
+        searched = 0
+        while True:
+            buf = self._rbuf
+            pos = self._rpos
+            avail = len(buf) - pos
+            end = buf.find('\n', pos + searched)
+            if end >= 0:
+                end += 1
+            if size is not None and size <= avail and \
+                    (end < 0 or end - pos > size):
+                end = pos + size
+            if end >= 0:
+                self._rpos = end
+                return buf[pos:end]
+            searched = avail
+            if size is None:
+                more = 0
+            else:
+                more = size - avail
+            if not self._fill(more):
+                self._rbuf = ''
+                self._rpos = 0
+                return buf[pos:]
+
+    def readlines(self, sizehint=0):
+        if not sizehint:
+            return list(self)
+        lines = []
+        total = 0
+        while True:
+            line = self.readline()
+            if not line:
+                break
+            lines.append(line)
+            total += len(line)
+            if sizehint and total >= sizehint:
+                break
+        return lines
+
+    def __iter__(self):
+        # splits the data read ahead into lines a block at a time, in C,
+        # which is much faster than a readline() per line
+        self._check_open()
+        if self._wbuf:
+            self.flush()
+        while True:
+            buf = self._rbuf
+            pos = self._rpos
+            end = buf.rfind('\n', pos) + 1
+            if end:
+                lines = StringIO(buf[pos:end])
+                self._rpos = end
+                self._lines = (lines, pos)
+                for line in lines:
+                    yield line
+                self._lines = None
+            elif not self._fill(0):
+                self._rbuf = ''
+                self._rpos = 0
+                if pos < len(buf):
+                    yield buf[pos:]
+                return
+
+    def next(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    xreadlines = __iter__
+
+    def write(self, data):
+        self._check_open()
+        if self._rbuf:
+            self._drop_readahead()
+        self._wbuf.append(data)
+        self._wbuf_len += len(data)
+        if self._wbuf_len >= self.bufsize:
+            self.flush()
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        self._check_open()
+        if self._wbuf:
+            data = ''.join(self._wbuf)
+            self._wbuf = []
+            self._wbuf_len = 0
+            self._execute(self._file.write, data)
+
+    def seek(self, offset, whence=0):
+        self._check_open()
+        if self._wbuf:
+            self.flush()
+        if whence == 1:
+            # relative to where the reader is, not to the end of the data
+            # read ahead
+            offset -= len(self._rbuf) - self._rpos
+        self._rbuf = ''
+        self._rpos = 0
+        self._execute(self._file.seek, offset, whence)
+
+    def tell(self):
+        self._check_open()
+        return self._execute(self._file.tell) + self._wbuf_len - \
+            (len(self._rbuf) - self._rpos)
+
+    def truncate(self, size=None):
+        self._check_open()
+        if self._wbuf:
+            self.flush()
+        if self._rbuf:
+            self._drop_readahead()
+        if size is None:
+            self._execute(self._file.truncate)
+        else:
+            self._execute(self._file.truncate, size)
+
+    def fsync(self):
+        """Writes out the buffered data and waits for the operating system
+        to put it on disk."""
+        self.flush()
+        self._execute(os.fsync, self._file.fileno())
+
+    def close(self):
+        if self._file.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self._execute(self._file.close)
+
+
+def open(name, mode='r', bufsize=DEFAULT_BUFSIZE, executor=None):
+    """Opens the file *name* as a :class:`GreenFile`."""
+    return GreenFile(name, mode, bufsize, executor)
@@ -1,15 +1,18 @@
-from eventlet.hubs import trampoline
+from eventlet.hubs import trampoline, forget_descriptor
+from eventlet import greenthread
+from eventlet import semaphore
 BUFFER_SIZE = 4096
 
 import errno
 import os
 import socket
 from socket import socket as _original_socket
+import stat
 import sys
 import time
 import warnings
 
-__all__ = ['GreenSocket', 'GreenPipe', 'shutdown_safe']
+__all__ = ['GreenSocket', 'GreenSocketFile', 'GreenPipe', 'shutdown_safe']
 
 CONNECT_ERR = set((errno.EINPROGRESS, errno.EALREADY, errno.EWOULDBLOCK))
 CONNECT_SUCCESS = set((0, errno.EISCONN))
@@ -52,6 +55,49 @@ else:
     SOCKET_CLOSED = set((errno.ECONNRESET, errno.ESHUTDOWN, errno.EPIPE))
 
 
+def unsent_tail(data, offset):
+    """
+    Returns the part of *data* that follows *offset*, without copying it if
+    *data* is a string or buffer, so that retrying a partial write of a large
+    string costs nothing.
+    """
+    if isinstance(data, (str, buffer)):
+        return buffer(data, offset)
+    return data[offset:]
+
+
+def _get_sendfile():
+    """ Returns a function with the signature of Python 3's os.sendfile, or
+    None if the platform has no usable sendfile(2). """
+    sendfile = getattr(os, 'sendfile', None)
+    if sendfile is not None:
+        return sendfile
+    if not sys.platform.startswith('linux'):
+        # the BSDs have a sendfile with a different signature
+        return None
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        _sendfile = libc.sendfile64
+    except (ImportError, OSError, AttributeError):
+        return None
+    _sendfile.argtypes = [ctypes.c_int, ctypes.c_int,
+                          ctypes.POINTER(ctypes.c_int64), ctypes.c_size_t]
+    _sendfile.restype = ctypes.c_ssize_t
+
+    def sendfile(out_fd, in_fd, offset, count):
+        offset = ctypes.c_int64(offset)
+        sent = _sendfile(out_fd, in_fd, ctypes.byref(offset), count)
+        if sent < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        return sent
+    return sendfile
+
+_sendfile = _get_sendfile()
+SENDFILE_CHUNK = 1024 * 1024
+
+
 def set_nonblocking(fd):
     """
     Sets the descriptor to be nonblocking.  Works on many file-like
@@ -114,6 +160,7 @@ class GreenSocket(object):
         set_nonblocking(fd)
         self.fd = fd
         self.closed = False
+        forget_descriptor(fd.fileno())
         # when client calls setblocking(0) or settimeout(0) the socket must
         # act non-blocking
         self.act_non_blocking = False
@@ -155,6 +202,10 @@ class GreenSocket(object):
         if self.closed:
             return
         self.closed = True
+        try:
+            forget_descriptor(self.fd.fileno())
+        except socket.error:
+            pass
         res = self.fd.close()
         return res
 
@@ -278,10 +329,11 @@ class GreenSocket(object):
         # blocking socket behavior - sends all, blocks if the buffer is full
         total_sent = 0
         len_data = len(data)
+        pending = data
 
         while 1:
             try:
-                total_sent += fd.send(data[total_sent:], flags)
+                total_sent += fd.send(pending, flags)
             except socket.error, e:
                 if e[0] not in SOCKET_BLOCKING:
                     raise
@@ -289,6 +341,7 @@ class GreenSocket(object):
             if total_sent == len_data:
                 break
 
+            pending = unsent_tail(data, total_sent)
             trampoline(self.fd, write=True, timeout=self.gettimeout(),
                     timeout_exc=socket.timeout("timed out"))
 
@@ -298,7 +351,66 @@ class GreenSocket(object):
         tail = self.send(data, flags)
         len_data = len(data)
         while tail < len_data:
-            tail += self.send(data[tail:], flags)
+            tail += self.send(unsent_tail(data, tail), flags)
+
+    def sendfile(self, file, offset=0, count=None):
+        """ Sends *count* bytes of *file*, or all of it, starting at
+        *offset*, and returns the number of bytes sent.  For regular files,
+        this uses sendfile(2) where available, so the data never passes
+        through Python; otherwise the file is read and sent in blocks.  The
+        file position is left after the last byte sent."""
+        if _sendfile is not None:
+            try:
+                fileno = file.fileno()
+                regular = stat.S_ISREG(os.fstat(fileno).st_mode)
+            except (AttributeError, ValueError, OSError, IOError):
+                regular = False
+            if regular:
+                return self._sendfile_use_sendfile(file, fileno, offset, count)
+        return self._sendfile_use_send(file, offset, count)
+
+    def _sendfile_use_sendfile(self, file, fileno, offset, count):
+        if count is None:
+            count = max(os.fstat(fileno).st_size - offset, 0)
+        out_fd = self.fd.fileno()
+        total_sent = 0
+        try:
+            while total_sent < count:
+                try:
+                    sent = _sendfile(out_fd, fileno, offset + total_sent,
+                                     min(count - total_sent, SENDFILE_CHUNK))
+                except OSError, e:
+                    if e.args[0] not in SOCKET_BLOCKING:
+                        raise socket.error(*e.args)
+                    if self.act_non_blocking:
+                        if total_sent:
+                            break
+                        raise socket.error(*e.args)
+                    trampoline(self.fd, write=True, timeout=self.gettimeout(),
+                            timeout_exc=socket.timeout("timed out"))
+                    continue
+                if not sent:
+                    # the file is shorter than we were told
+                    break
+                total_sent += sent
+        finally:
+            if total_sent:
+                file.seek(offset + total_sent)
+        return total_sent
+
+    def _sendfile_use_send(self, file, offset, count):
+        file.seek(offset)
+        total_sent = 0
+        while count is None or total_sent < count:
+            blocksize = SENDFILE_CHUNK
+            if count is not None:
+                blocksize = min(count - total_sent, blocksize)
+            data = file.read(blocksize)
+            if not data:
+                break
+            self.sendall(data)
+            total_sent += len(data)
+        return total_sent
 
     def sendto(self, *args):
         trampoline(self.fd, write=True)
@@ -340,6 +452,315 @@ class GreenSocket(object):
         return self.timeout
 
 
+def _blank_line_end(buf, start, searched):
+    """ Returns the index just past the first empty line in buf[start:], or
+    -1.  buf[start:searched] has been searched already."""
+    if searched == start:
+        if buf.startswith('\n', start):
+            return start + 1
+        if buf.startswith('\r\n', start):
+            return start + 2
+    end = buf.find('\n\n', searched)
+    if end >= 0:
+        end += 2
+    crlf = buf.find('\n\r\n', searched)
+    if crlf >= 0 and (end < 0 or crlf + 3 < end):
+        end = crlf + 3
+    return end
+
+
+class GreenSocketFile(object):
+    """ Buffered file object over a socket, for reading lines and writing
+    responses, like the one :meth:`GreenSocket.makefile` returns.  Unlike
+    that one, it shares the socket instead of working on a dup() of it, so it
+    costs no extra file descriptor, and closing it leaves the socket open
+    unless *close* is true.  Written data is held until :meth:`flush` or
+    until *bufsize* bytes have accumulated, and then sent with a single
+    sendall(); a *bufsize* of 0 flushes every write, 1 flushes on newlines.
+
+    Setting :attr:`coalesce_size` holds writes back until that many bytes
+    have accumulated or the writing greenthread yields to the hub, whatever
+    the buffer size, so that a burst of small writes goes out in one send.
+    """
+    default_bufsize = 8192
+    name = "<socket>"
+    softspace = False
+    # when nonzero, writes are held back until this many bytes have been
+    # buffered or flush() is called, whatever the buffer size
+    batch_size = 0
+    # when nonzero, writes are held back until this many bytes have been
+    # buffered or the writing greenthread yields
+    coalesce_size = 0
+    # how many sendall() calls the file has made
+    sends = 0
+
+    def __init__(self, sock, mode='rb', bufsize=-1, close=False):
+        self._sock = sock
+        self.mode = mode
+        if bufsize < 0:
+            bufsize = self.default_bufsize
+        self.bufsize = bufsize
+        if bufsize == 0:
+            # don't read past what the caller asks for
+            self._rbufsize = 1
+        elif bufsize == 1:
+            self._rbufsize = self.default_bufsize
+        else:
+            self._rbufsize = bufsize
+        self._wbufsize = bufsize
+        self._close = close
+        # unread data is self._rbuf[self._rpos:]
+        self._rbuf = ''
+        self._rpos = 0
+        self._wbuf = []
+        self._wbuf_len = 0
+        self._flush_scheduled = False
+        self._flush_error = None
+        # serializes flushes once a background flush may run alongside the
+        # writer
+        self._wlock = None
+
+    @property
+    def closed(self):
+        return self._sock is None
+
+    def close(self):
+        try:
+            if self._sock is not None:
+                self.flush()
+        finally:
+            if self._close and self._sock is not None:
+                self._sock.close()
+            self._sock = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except:
+            # close() may fail if __init__ didn't complete
+            pass
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def pending(self):
+        """ Returns how many bytes have been received on the socket but not
+        read from the file yet."""
+        return len(self._rbuf) - self._rpos
+
+    def flush(self):
+        lock = self._wlock
+        if lock is None:
+            if self._wbuf:
+                self._send_buffer()
+            return
+        # even with nothing buffered, wait for a background flush to finish
+        # sending, so that what was written is sent when this returns
+        lock.acquire()
+        try:
+            error = self._flush_error
+            if error is not None:
+                self._flush_error = None
+                raise error
+            if self._wbuf:
+                self._send_buffer()
+        finally:
+            lock.release()
+
+    def _send_buffer(self):
+        if len(self._wbuf) == 1:
+            data = self._wbuf[0]
+        else:
+            data = "".join(self._wbuf)
+        self._wbuf = []
+        self._wbuf_len = 0
+        self.sends += 1
+        self._sock.sendall(data)
+
+    def _coalesce(self):
+        if self._wbuf_len >= self.coalesce_size:
+            self.flush()
+        elif not self._flush_scheduled:
+            if self._wlock is None:
+                self._wlock = semaphore.Semaphore()
+            self._flush_scheduled = True
+            # runs as soon as the writer yields to the hub
+            greenthread.spawn_n(self._flush_coalesced)
+
+    def _flush_coalesced(self):
+        self._flush_scheduled = False
+        if self.batch_size or self._sock is None:
+            # the owner of the batch flushes it
+            return
+        try:
+            self.flush()
+        except socket.error, e:
+            # the data is lost; make sure the writer finds out
+            self._flush_error = e
+
+    def write(self, data):
+        data = str(data) # XXX Should really reject non-string non-buffers
+        if not data:
+            return
+        self._wbuf.append(data)
+        self._wbuf_len += len(data)
+        if self.batch_size:
+            if self._wbuf_len >= self.batch_size:
+                self.flush()
+        elif self.coalesce_size:
+            self._coalesce()
+        elif (self._wbufsize == 0 or
+            self._wbufsize == 1 and '\n' in data or
+            self._wbuf_len >= self._wbufsize):
+            self.flush()
+
+    def writelines(self, list):
+        # XXX We could do better here for very long lists
+        # XXX Should really reject non-string non-buffers
+        lines = filter(None, map(str, list))
+        self._wbuf.extend(lines)
+        self._wbuf_len += sum(map(len, lines))
+        if self.batch_size:
+            if self._wbuf_len >= self.batch_size:
+                self.flush()
+        elif self.coalesce_size:
+            self._coalesce()
+        elif (self._wbufsize <= 1 or
+            self._wbuf_len >= self._wbufsize):
+            self.flush()
+
+    def _take_buffer(self):
+        # returns what is left in the read buffer, and empties it
+        buf = self._rbuf
+        if self._rpos:
+            buf = buf[self._rpos:]
+        self._rbuf = ''
+        self._rpos = 0
+        return buf
+
+    def read(self, size=-1):
+        buf = self._rbuf
+        pos = self._rpos
+        if size >= 0 and len(buf) - pos >= size:
+            # fast path: all of it is buffered already
+            self._rpos = pos + size
+            return buf[pos:pos + size]
+        chunks = [self._take_buffer()]
+        if size < 0:
+            recv_size = max(self._rbufsize, self.default_bufsize)
+            while True:
+                data = self._sock.recv(recv_size)
+                if not data:
+                    break
+                chunks.append(data)
+            return ''.join(chunks)
+        left = size - len(chunks[0])
+        while left > 0:
+            data = self._sock.recv(max(left, self._rbufsize))
+            if not data:
+                break
+            if len(data) > left:
+                self._rbuf = data
+                self._rpos = left
+                chunks.append(data[:left])
+                break
+            chunks.append(data)
+            left -= len(data)
+        return ''.join(chunks)
+
+    def readline(self, size=-1):
+        buf = self._rbuf
+        pos = self._rpos
+        end = buf.find('\n', pos)
+        if end >= 0 and (size < 0 or end - pos < size):
+            # fast path: the whole line is buffered already
+            end += 1
+            self._rpos = end
+            return buf[pos:end]
+        if size >= 0 and len(buf) - pos >= size:
+            self._rpos = pos + size
+            return buf[pos:pos + size]
+        chunks = [self._take_buffer()]
+        collected = len(chunks[0])
+        while True:
+            data = self._sock.recv(self._rbufsize)
+            if not data:
+                break
+            end = data.find('\n')
+            if size >= 0:
+                limit = size - collected
+            else:
+                limit = len(data) + 1
+            if end >= 0 and end < limit:
+                end += 1
+                chunks.append(data[:end])
+                self._rbuf = data
+                self._rpos = end
+                break
+            if len(data) >= limit:
+                chunks.append(data[:limit])
+                self._rbuf = data
+                self._rpos = limit
+                break
+            chunks.append(data)
+            collected += len(data)
+        return ''.join(chunks)
+
+    def readheaders(self, size=-1):
+        """ Reads lines up to and including the first empty one, which is how
+        an RFC 822 header block ends, and returns them as one string.  Stops
+        early after *size* bytes, or at the end of the stream; the caller can
+        tell by the returned block not ending in an empty line. """
+        buf = self._rbuf
+        pos = self._rpos
+        searched = pos
+        while True:
+            end = _blank_line_end(buf, pos, searched)
+            if end >= 0:
+                break
+            if size >= 0 and len(buf) - pos >= size:
+                end = pos + size
+                break
+            # a blank line can straddle what we have and what comes next
+            searched = max(pos, len(buf) - 2)
+            data = self._sock.recv(self._rbufsize)
+            if not data:
+                end = len(buf)
+                break
+            if pos:
+                buf = buf[pos:]
+                searched -= pos
+                pos = 0
+            buf += data
+        if size >= 0 and end - pos > size:
+            end = pos + size
+        self._rbuf = buf
+        self._rpos = end
+        return buf[pos:end]
+
+    def readlines(self, sizehint=0):
+        total = 0
+        lines = []
+        while True:
+            line = self.readline()
+            if not line:
+                break
+            lines.append(line)
+            total += len(line)
+            if sizehint and total >= sizehint:
+                break
+        return lines
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+
 class GreenPipe(object):
     """ GreenPipe is a cooperatively-yielding wrapper around OS pipes.
     """
@@ -349,8 +770,11 @@ class GreenPipe(object):
         self.fd = fd
         self.closed = False
         self.recvbuffer = ''
+        forget_descriptor(fd.fileno())
 
     def close(self):
+        if not getattr(self.fd, 'closed', False):
+            forget_descriptor(self.fd.fileno())
         self.fd.close()
         self.closed = True
 
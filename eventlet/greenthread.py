@@ -1,4 +1,5 @@
 import sys
+import traceback
 
 from eventlet import event
 from eventlet import hubs
@@ -11,6 +12,9 @@ __all__ = ['getcurrent', 'sleep', 'spawn', 'spawn_n', 'spawn_after', 'spawn_afte
 
 getcurrent = greenlet.getcurrent
 
+# toggled by eventlet.debug.hub_stall_detection
+_record_spawn_sites = False
+
 def sleep(seconds=0):
     """Yield control to another eligible coroutine until at least *seconds* have
     elapsed.
@@ -23,8 +27,12 @@ def sleep(seconds=0):
     occasionally; otherwise nothing else will run.
     """
     hub = hubs.get_hub()
-    assert hub.greenlet is not greenlet.getcurrent(), 'do not call blocking functions from the mainloop'
-    timer = hub.schedule_call_global(seconds, greenlet.getcurrent().switch)
+    current = greenlet.getcurrent()
+    assert hub.greenlet is not current, 'do not call blocking functions from the mainloop'
+    if seconds:
+        timer = hub.schedule_call_global(seconds, current.switch)
+    else:
+        timer = hub.call_soon(current.switch)
     try:
         hub.switch()
     finally:
@@ -43,7 +51,7 @@ def spawn(func, *args, **kwargs):
     """
     hub = hubs.get_hub()
     g = GreenThread(hub.greenlet)
-    hub.schedule_call_global(0, g.switch, func, args, kwargs)
+    hub.call_soon(g.switch, func, args, kwargs)
     return g
     
     
@@ -144,10 +152,13 @@ def _spawn_n(seconds, func, args, kwargs):
     hub = hubs.get_hub()
     if kwargs:
         g = greenlet.greenlet(_main_wrapper, parent=hub.greenlet)
-        t = hub.schedule_call_global(seconds, g.switch, func, args, kwargs)
+        args = (func, args, kwargs)
     else:
         g = greenlet.greenlet(func, parent=hub.greenlet)
+    if seconds:
         t = hub.schedule_call_global(seconds, g.switch, *args)
+    else:
+        t = hub.call_soon(g.switch, *args)
     return t, g
 
 
@@ -156,9 +167,14 @@ class GreenThread(greenlet.greenlet):
     property of being able to retrieve the return value of the main function.  
     Do not construct GreenThread objects directly; call :func:`spawn` to get one.
     """
+    spawn_site = None
+
     def __init__(self, parent):
         greenlet.greenlet.__init__(self, self.main, parent)
         self._exit_event = event.Event()
+        if _record_spawn_sites:
+            # skip this frame and the spawn function's
+            self.spawn_site = traceback.extract_stack(sys._getframe(2), 8)
 
     def wait(self):
         """ Returns the result of the main function of this GreenThread.  If the   
@@ -258,6 +274,6 @@ def kill(g, *throw_args):
                 g.main(just_raise, (), {})
             except:
                 pass
-    hub.schedule_call_global(0, g.throw, *throw_args)
+    hub.call_soon(g.throw, *throw_args)
     if getcurrent() is not hub.greenlet:
         sleep(0)
@@ -3,7 +3,8 @@ import os
 from eventlet.support import greenlets as greenlet
 from eventlet import patcher
 
-__all__ = ["use_hub", "get_hub", "get_default_hub", "trampoline"]
+__all__ = ["use_hub", "get_hub", "get_default_hub", "trampoline",
+           "forget_descriptor"]
 
 threading = patcher.original('threading')
 _threadlocal = threading.local()
@@ -88,6 +89,19 @@ def get_hub():
         hub = _threadlocal.hub = _threadlocal.Hub()
     return hub
 
+def forget_descriptor(fileno):
+    """Tell the current thread's hub, if it has one, that *fileno* is being
+    closed or has just been created, so that it doesn't keep using a
+    registration that belonged to an earlier file with the same number.
+
+    .. note :: |internal|
+    """
+    hub = getattr(_threadlocal, 'hub', None)
+    if hub is not None:
+        forget = getattr(hub, 'forget', None)
+        if forget is not None:
+            forget(fileno)
+
 from eventlet import timeout
 def trampoline(fd, read=None, write=None, timeout=None, 
                timeout_exc=timeout.Timeout):
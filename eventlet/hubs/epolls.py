@@ -27,12 +27,16 @@ from eventlet.hubs.hub import BaseHub
 from eventlet.hubs import poll
 from eventlet.hubs.poll import READ, WRITE
 
+# only select.epoll knows about edge-triggered notification
+EPOLLET = getattr(select, 'EPOLLET', None)
+
 # NOTE: we rely on the fact that the epoll flag constants
 # are identical in value to the poll constants
 
 class Hub(poll.Hub):
     WAIT_MULTIPLIER = 1.0  # epoll.poll's timeout is measured in seconds
-    def __init__(self, clock=time.time):
+    EDGE_TRIGGERED = EPOLLET
+    def __init__(self, clock=None):
         BaseHub.__init__(self, clock)
         self.poll = epoll()
         try:
@@ -40,8 +44,11 @@ class Hub(poll.Hub):
             self.modify = self.poll.modify
         except AttributeError:
             self.modify = self.poll.register
+        self.init_registrations()
 
     def add(self, evtype, fileno, cb):
+        if self.persistent:
+            return super(Hub, self).add(evtype, fileno, cb)
         oldlisteners = bool(self.listeners[READ].get(fileno) or
                             self.listeners[WRITE].get(fileno))
         listener = BaseHub.add(self, evtype, fileno, cb)
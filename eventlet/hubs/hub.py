@@ -1,11 +1,18 @@
+import collections
+import errno
 import heapq
+import itertools
+import struct
 import sys
 import traceback
 
 from eventlet.support import greenlets as greenlet
 from eventlet.hubs import timer
+from eventlet.hubs import timerwheel
 from eventlet import patcher
+os = patcher.original('os')
 time = patcher.original('time')
+thread = patcher.original('thread')
 
 READ="read"
 WRITE="write"
@@ -39,6 +46,174 @@ class DebugListener(FdListener):
     __str__ = __repr__
 
 
+def _monotonic():
+    """ Returns a function that reads the system's monotonic clock, in
+    seconds, or None if it can't be read. """
+    monotonic = getattr(time, 'monotonic', None)
+    if monotonic is not None:
+        return monotonic
+    if sys.platform.startswith('linux'):
+        CLOCK_MONOTONIC = 1
+    elif sys.platform.startswith('freebsd'):
+        CLOCK_MONOTONIC = 4
+    elif sys.platform == 'darwin':
+        CLOCK_MONOTONIC = 6
+    else:
+        return None
+    try:
+        import ctypes
+    except ImportError:
+        return None
+
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    # older glibcs only have clock_gettime in librt; ctypes.util.find_library
+    # is no use here, as it runs subprocesses
+    for name in (None, 'librt.so.1'):
+        try:
+            clock_gettime = ctypes.CDLL(name, use_errno=True).clock_gettime
+            break
+        except (OSError, AttributeError):
+            pass
+    else:
+        return None
+    # no argtypes: converting the arguments through them doubles the cost of
+    # a call, and the hub reads the clock for every timer it schedules
+    byref = ctypes.byref
+
+    def monotonic():
+        # a fresh struct per call; hubs in other threads read the clock too
+        ts = timespec()
+        if clock_gettime(CLOCK_MONOTONIC, byref(ts)):
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+    try:
+        monotonic()
+    except OSError:
+        return None
+    return monotonic
+
+monotonic = _monotonic() or time.time
+
+
+def _eventfd():
+    """ Returns a new non-blocking Linux eventfd, or None if the platform
+    doesn't have them. """
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        eventfd = libc.eventfd
+    except (ImportError, OSError, AttributeError):
+        return None
+    EFD_NONBLOCK = os.O_NONBLOCK
+    EFD_CLOEXEC = 02000000 # O_CLOEXEC, which the os module doesn't have
+    fd = eventfd(0, EFD_NONBLOCK | EFD_CLOEXEC)
+    if fd < 0:
+        return None
+    return fd
+
+
+class Waker(object):
+    """ A descriptor that other threads write to in order to interrupt the
+    hub's wait().  Uses an eventfd where available, and a pipe (or a pair of
+    localhost sockets on Windows) otherwise.  Writes are cheap and never
+    block, and any number of them is cleared by a single drain(). """
+    def __init__(self):
+        self.sock = None
+        fd = _eventfd()
+        if fd is not None:
+            self.rfd = self.wfd = fd
+            self.token = struct.pack('Q', 1)
+        elif sys.platform[:3] != "win":
+            import fcntl
+            self.rfd, self.wfd = os.pipe()
+            for fd in (self.rfd, self.wfd):
+                flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+                fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+            self.token = ' '
+        else:
+            socket = patcher.original('socket')
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.bind(('127.0.0.1', 0))
+            listener.listen(1)
+            csock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            csock.connect(listener.getsockname())
+            nsock, addr = listener.accept()
+            listener.close()
+            csock.setblocking(0)
+            nsock.setblocking(0)
+            self.sock = (csock, nsock)
+            self.rfd = csock.fileno()
+            self.wfd = nsock.fileno()
+            self.token = ' '
+        self.wakes = 0
+
+    def fileno(self):
+        return self.rfd
+
+    def wake(self):
+        self.wakes += 1
+        try:
+            if self.sock is not None:
+                self.sock[1].send(self.token)
+            else:
+                os.write(self.wfd, self.token)
+        except (OSError, IOError), e:
+            # a full pipe already guarantees a wakeup
+            if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+    def drain(self):
+        try:
+            if self.sock is not None:
+                while self.sock[0].recv(4096):
+                    pass
+            else:
+                while os.read(self.rfd, 4096):
+                    pass
+        except (OSError, IOError), e:
+            if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+    def close(self):
+        if self.sock is not None:
+            for sock in self.sock:
+                sock.close()
+        else:
+            os.close(self.rfd)
+            if self.wfd != self.rfd:
+                os.close(self.wfd)
+
+
+class CallbackBudget(object):
+    """ What is left of one runloop iteration's allowance for callbacks. """
+    __slots__ = ['count', 'deadline', 'clock', 'exhausted']
+
+    def __init__(self, count, seconds, clock):
+        self.count = count
+        self.clock = clock
+        if seconds is None:
+            self.deadline = None
+        else:
+            self.deadline = clock() + seconds
+        self.exhausted = False
+
+    def spend(self):
+        """ Takes one callback out of the budget; returns False, and marks
+        the budget exhausted, if there is nothing left. """
+        if self.count is not None:
+            if self.count <= 0:
+                self.exhausted = True
+                return False
+            self.count -= 1
+        if self.deadline is not None and self.clock() >= self.deadline:
+            self.exhausted = True
+            return False
+        return True
+
+
 class BaseHub(object):
     """ Base hub class for easing the implementation of subclasses that are
     specific to a particular underlying event architecture. """
@@ -48,17 +223,45 @@ class BaseHub(object):
     READ = READ
     WRITE = WRITE
 
-    def __init__(self, clock=time.time):
+    def __init__(self, clock=None):
         self.listeners = {READ:{}, WRITE:{}}
 
+        if clock is None:
+            clock = monotonic
         self.clock = clock
+        # see now()
+        self.cached_now = None
+        # orders timers that share a deadline by when they were scheduled
+        self.timer_seq = itertools.count().next
         self.greenlet = greenlet.greenlet(self.run)
         self.stopping = False
         self.running = False
         self.timers = []
         self.next_timers = []
+        self.wheel = None
+        # timers the wheel has handed back, in the order they are due
+        self.expired = collections.deque()
+        self.ready = collections.deque()
+        self.threadsafe = collections.deque()
+        self.waker = None
+        self.waker_listener = None
+        self.waker_lock = thread.allocate_lock()
+        self.wakeup_pending = False
         self.lclass = FdListener
         self.debug_exceptions = True
+        self.budget_count = None
+        self.budget_time = None
+        self.budget_hits = 0
+        self.budget_ready_first = False
+        # bumped whenever the hub greenlet regains control, and after every
+        # callback it runs, since a greenthread that finishes or runs a
+        # timer returns to the hub without switching; see set_stall_detector
+        self.switches = 0
+        self.waiting = False
+        self.stall_detector = None
+        timers = os.environ.get('EVENTLET_HUB_TIMERS', None)
+        if timers:
+            self.set_timer_backend(timers)
 
     def add(self, evtype, fileno, cb):
         """ Signals an intent to or write a particular file descriptor.
@@ -89,6 +292,12 @@ class BaseHub(object):
         self.listeners[READ].pop(fileno, None)
         self.listeners[WRITE].pop(fileno, None)
 
+    def forget(self, fileno):
+        """ Drop whatever the hub remembers about *fileno* apart from its
+        listeners, because the descriptor is being closed or the number has
+        just been handed out again.  For internal use only."""
+        pass
+
     def stop(self):
         self.abort()
         if self.greenlet is not greenlet.getcurrent():
@@ -97,6 +306,7 @@ class BaseHub(object):
     def switch(self):
         cur = greenlet.getcurrent()
         assert cur is not self.greenlet, 'Cannot switch to MAINLOOP from MAINLOOP'
+        self.switches += 1
         switch_out = getattr(cur, 'switch_out', None)
         if switch_out is not None:
             try:
@@ -104,6 +314,11 @@ class BaseHub(object):
             except:
                 self.squelch_generic_exception(sys.exc_info())
                 sys.exc_clear()
+        lazy_timeouts = getattr(cur, 'lazy_timeouts', None)
+        if lazy_timeouts:
+            for timeout in lazy_timeouts:
+                timeout.arm()
+            del lazy_timeouts[:]
         if self.greenlet.dead:
             self.greenlet = greenlet.greenlet(self.run)
         try:
@@ -132,6 +347,15 @@ class BaseHub(object):
 
     def sleep_until(self):
         t = self.timers
+        if self.wheel is not None:
+            if self.expired:
+                # nothing in the wheel is due before these
+                when = self.expired[0][0]
+            else:
+                when = self.wheel.next_deadline()
+            if t and (when is None or t[0][0] < when):
+                return t[0][0]
+            return when
         if not t:
             return None
         return t[0][0]
@@ -144,23 +368,64 @@ class BaseHub(object):
         try:
             self.running = True
             self.stopping = False
+            self.setup_waker()
             while not self.stopping:
+                if self.threadsafe:
+                    self.prepare_threadsafe()
+                now = self.update_now()
                 self.prepare_timers()
-                self.fire_timers(self.clock())
+                ready = len(self.ready)
+                if self.budget_count is None and self.budget_time is None:
+                    self.fire_timers(now)
+                    self.fire_ready(ready)
+                else:
+                    budget = CallbackBudget(
+                        self.budget_count, self.budget_time, self.clock)
+                    if self.budget_ready_first:
+                        self.fire_ready(ready, budget)
+                        self.fire_timers(now, budget)
+                    else:
+                        self.fire_timers(now, budget)
+                        self.fire_ready(ready, budget)
+                    if budget.exhausted:
+                        # what is left over is due, so the wait below polls
+                        # without blocking and the next iteration resumes;
+                        # whichever queue went second may have got nothing,
+                        # so it goes first next time
+                        self.budget_hits += 1
+                        self.budget_ready_first = not self.budget_ready_first
+                # the callbacks may have run for a while; timers they
+                # scheduled count from now, not from the top of the iteration
+                now = self.update_now()
                 self.prepare_timers()
                 wakeup_when = self.sleep_until()
-                if wakeup_when is None:
+                if self.ready or self.threadsafe:
+                    sleep_time = 0
+                elif wakeup_when is None:
                     sleep_time = self.default_sleep()
                 else:
-                    sleep_time = wakeup_when - self.clock()
+                    sleep_time = wakeup_when - now
+                # the wait can take arbitrarily long; subclasses that refresh
+                # the cached time once it is over call update_now()
+                self.cached_now = None
+                self.waiting = True
                 if sleep_time > 0:
                     self.wait(sleep_time)
                 else:
                     self.wait(0)
+                self.waiting = False
+                self.switches += 1
             else:
                 del self.timers[:]
                 del self.next_timers[:]
+                self.expired.clear()
+                self.ready.clear()
+                if self.wheel is not None:
+                    self.wheel.clear()
         finally:
+            self.teardown_waker()
+            self.cached_now = None
+            self.waiting = False
             self.running = False
             self.stopping = False
 
@@ -182,26 +447,96 @@ class BaseHub(object):
             sys.stderr.flush()
 
     def _add_absolute_timer(self, when, info):
-        # the 0 placeholder makes it easy to bisect_right using (now, 1)
-        self.next_timers.append((when, 0, info))
+        seq = self.timer_seq()
+        if self.wheel is not None and self.wheel.add(when, info, seq):
+            return
+        heapq.heappush(self.timers, (when, seq, info))
+
+    def update_now(self):
+        """ Reads the clock for this iteration of the runloop and returns
+        the reading; see :meth:`now`. """
+        now = self.cached_now = self.clock()
+        return now
+
+    def now(self, exact=False):
+        """ Returns the time according to :attr:`clock`, the system's
+        monotonic clock by default, so that stepping the wall clock doesn't
+        make timers fire early or late.  While the runloop runs callbacks,
+        this is the reading taken at the start of the iteration, which is
+        much cheaper than reading the clock again; callers that need a
+        reading straight from the clock can pass *exact*."""
+        now = self.cached_now
+        if now is None or exact:
+            return self.clock()
+        return now
 
     def add_timer(self, timer):
-        scheduled_time = self.clock() + timer.seconds
-        self._add_absolute_timer(scheduled_time, timer)
-        return scheduled_time
+        # only filed under a deadline by prepare_timers(), which reads the
+        # clock first; a deadline taken from the cached reading would fire
+        # early by however long the iteration had been running
+        seconds = timer.seconds
+        self.next_timers.append((seconds, timer))
+        now = self.cached_now
+        if now is None:
+            now = self.clock()
+        return now + seconds
 
     def timer_finished(self, timer):
         pass
 
     def timer_canceled(self, timer):
+        if self.wheel is not None:
+            self.wheel.remove(timer)
         self.timer_finished(timer)
 
     def prepare_timers(self):
         heappush = heapq.heappush
         t = self.timers
-        for item in self.next_timers:
-            heappush(t, item)
-        del self.next_timers[:]
+        seq = self.timer_seq
+        next_timers = self.next_timers
+        wheel = self.wheel
+        if not next_timers and wheel is None:
+            return
+        now = self.now()
+        if next_timers:
+            # timers cancelled before they were ever filed are dropped
+            entries = [(now + seconds, seq(), info)
+                       for seconds, info in next_timers if not info.called]
+            del next_timers[:]
+            if wheel is not None:
+                entries = wheel.add_entries(entries)
+            for entry in entries:
+                heappush(t, entry)
+        if wheel is not None and now >= wheel.tick_ends:
+            # these all come after the ones expired earlier, and are fired
+            # from there rather than pushed back into the heap
+            self.expired.extend(wheel.expire(now))
+
+    def set_timer_backend(self, name, **kw):
+        """Selects how the hub stores its timers.  *name* is either
+        ``'heap'`` (the default), a binary heap in which cancelled timers
+        linger until their deadline, or ``'wheel'``, a hierarchical timing
+        wheel (see :mod:`eventlet.hubs.timerwheel`) with O(1) add and cancel
+        that drops cancelled timers immediately.  Keyword arguments are passed
+        on to the wheel's constructor.  Timers that are already scheduled are
+        carried over.  The EVENTLET_HUB_TIMERS environment variable selects
+        the backend for newly created hubs.
+        """
+        if name not in ('heap', 'wheel'):
+            raise ValueError("Unknown timer backend %r" % (name,))
+        # timers in next_timers have no deadline yet, and stay where they are
+        pending = self.timers + list(self.expired)
+        if self.wheel is not None:
+            pending.extend((when, 0, info) for info, when in self.wheel)
+        del self.timers[:]
+        self.expired.clear()
+        if name == 'wheel':
+            self.wheel = timerwheel.TimerWheel(self.clock(), **kw)
+        else:
+            self.wheel = None
+        for when, _, info in pending:
+            if not info.called:
+                self._add_absolute_timer(when, info)
 
     def schedule_call_local(self, seconds, cb, *args, **kw):
         """Schedule a callable to be called after 'seconds' seconds have
@@ -228,12 +563,127 @@ class BaseHub(object):
         self.add_timer(t)
         return t
 
-    def fire_timers(self, when):
+    def call_soon(self, cb, *args, **kw):
+        """Schedule a callable to be called on the next iteration of the
+        runloop, in the order in which it was scheduled.  This is the same as
+        schedule_call_global(0, ...), but it skips the clock and the timer
+        queue entirely.  The returned timer can be cancelled.
+            cb: The callable to call.
+            *args: Arguments to pass to the callable when called.
+            **kw: Keyword arguments to pass to the callable when called.
+        """
+        t = timer.Timer(0, cb, *args, **kw)
+        self.ready.append(t)
+        return t
+
+    def call_soon_threadsafe(self, cb, *args, **kw):
+        """Like :meth:`call_soon`, but may be called from any native thread.
+        The hub is woken up if it is waiting for I/O; however many calls
+        arrive while a wakeup is pending, they cost a single wakeup.  The
+        returned timer may only be cancelled from the hub's own thread.
+        """
+        t = timer.Timer(0, cb, *args, **kw)
+        self.threadsafe.append(t)
+        if not self.wakeup_pending:
+            self.wakeup_pending = True
+            self.waker_lock.acquire()
+            try:
+                # a hub that isn't running yet has no waker, and picks the
+                # call up when it starts
+                if self.waker is not None:
+                    self.waker.wake()
+            finally:
+                self.waker_lock.release()
+        return t
+
+    def setup_waker(self):
+        if self.waker is not None:
+            return
+        self.waker_lock.acquire()
+        try:
+            self.waker = Waker()
+        finally:
+            self.waker_lock.release()
+        self.forget(self.waker.fileno())
+        self.waker_listener = self.add(READ, self.waker.fileno(), self.wakeup)
+        self.wakeup_pending = False
+
+    def teardown_waker(self):
+        if self.waker is None:
+            return
+        if self.waker_listener is not None:
+            self.remove(self.waker_listener)
+            self.waker_listener = None
+        self.waker_lock.acquire()
+        try:
+            self.waker.close()
+            self.waker = None
+        finally:
+            self.waker_lock.release()
+
+    def close(self):
+        """ Releases the file descriptors that the hub holds, for a hub that
+        is being thrown away, as in a forked child that starts a hub of its
+        own.  The hub can't be used afterwards.
+
+        Nothing is unregistered first: after a fork, an epoll instance and
+        the registrations in it are shared with the parent's hub. """
+        if self.waker is not None:
+            self.waker.close()
+            self.waker = None
+            self.waker_listener = None
+
+    def wakeup(self, fileno):
+        self.waker.drain()
+        self.wakeup_pending = False
+
+    def prepare_threadsafe(self):
+        # the flag is cleared before the queue is emptied, so that anything
+        # added after this point triggers another wakeup
+        self.wakeup_pending = False
+        threadsafe = self.threadsafe
+        popleft = threadsafe.popleft
+        append = self.ready.append
+        while threadsafe:
+            append(popleft())
+
+    def fire_ready(self, count=None, budget=None):
+        ready = self.ready
+        popleft = ready.popleft
+        # callbacks scheduled after the iteration started wait for the next
+        # one, just like timers staged in next_timers, so that a greenthread
+        # looping on sleep(0) can't starve the I/O poll
+        if count is None:
+            count = len(ready)
+        while count and ready:
+            if budget is not None and not budget.spend():
+                break
+            count -= 1
+            timer = popleft()
+            try:
+                try:
+                    timer()
+                except self.SYSTEM_EXCEPTIONS:
+                    raise
+                except:
+                    self.squelch_timer_exception(timer, sys.exc_info())
+                    sys.exc_clear()
+            finally:
+                self.switches += 1
+                self.timer_finished(timer)
+
+    def fire_timers(self, when, budget=None):
         t = self.timers
+        expired = self.expired
         heappop = heapq.heappop
 
-        while t:
-            next = t[0]
+        while t or expired:
+            # the heap and the timers expired from the wheel are merged by
+            # (deadline, sequence), which is never a tie
+            if expired and (not t or expired[0] < t[0]):
+                next = expired[0]
+            else:
+                next = t[0]
 
             exp = next[0]
             timer = next[2]
@@ -241,7 +691,13 @@ class BaseHub(object):
             if when < exp:
                 break
 
-            heappop(t)
+            if budget is not None and not budget.spend():
+                break
+
+            if expired and next is expired[0]:
+                expired.popleft()
+            else:
+                heappop(t)
 
             try:
                 try:
@@ -252,18 +708,27 @@ class BaseHub(object):
                     self.squelch_timer_exception(timer, sys.exc_info())
                     sys.exc_clear()
             finally:
+                self.switches += 1
                 self.timer_finished(timer)
 
     # for debugging:
 
     def get_readers(self):
-        return self.listeners[READ].values()
+        readers = self.listeners[READ]
+        if self.waker is not None:
+            return [l for fileno, l in readers.iteritems()
+                    if fileno != self.waker.fileno()]
+        return readers.values()
 
     def get_writers(self):
         return self.listeners[WRITE].values()
 
     def get_timers_count(hub):
-        return max(len(hub.timers), len(hub.next_timers))
+        count = max(len(hub.timers), len(hub.next_timers))
+        count += len(hub.ready) + len(hub.threadsafe)
+        if hub.wheel is not None:
+            count += len(hub.wheel) + len(hub.expired)
+        return count
 
     def set_debug_listeners(self, value):
         if value:
@@ -273,3 +738,27 @@ class BaseHub(object):
 
     def set_timer_exceptions(self, value):
         self.debug_exceptions = value
+
+    def set_callback_budget(self, count=None, seconds=None):
+        """ Limits how many timer and ready callbacks one iteration of the
+        runloop runs to *count*, and how long it spends running them to
+        *seconds*; None means no limit.  Whatever does not fit rolls over to
+        the next iteration, after the hub has polled for I/O without
+        blocking, so that a flood of spawns or expiring timeouts can't delay
+        accepts and reads until all of it has run.  Timers and ready
+        callbacks take turns going first after an iteration runs out, so
+        neither can starve the other.  :attr:`budget_hits` counts the
+        iterations that ran out of budget."""
+        if count is not None and count < 1:
+            raise ValueError("count must be at least 1")
+        if seconds is not None and seconds <= 0:
+            raise ValueError("seconds must be positive")
+        self.budget_count = count
+        self.budget_time = seconds
+
+    def set_stall_detector(self, detector):
+        """ Installs *detector* (see :class:`eventlet.debug.StallDetector`),
+        stopping the one installed before, if any.  Pass None to remove it."""
+        if self.stall_detector is not None:
+            self.stall_detector.stop()
+        self.stall_detector = detector
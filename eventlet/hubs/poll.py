@@ -13,8 +13,9 @@ WRITE_MASK = select.POLLOUT
 
 class Hub(BaseHub):
     WAIT_MULTIPLIER=1000.0 # poll.poll's timeout is measured in milliseconds
+    EDGE_TRIGGERED = None # poll has no edge-triggered mode
 
-    def __init__(self, clock=time.time):
+    def __init__(self, clock=None):
         super(Hub, self).__init__(clock)
         self.poll = select.poll()
         # poll.modify is new to 2.6
@@ -22,15 +23,34 @@ class Hub(BaseHub):
             self.modify = self.poll.modify
         except AttributeError:
             self.modify = self.poll.register
+        self.init_registrations()
+
+    def init_registrations(self):
+        # in persistent mode, the mask each descriptor is registered with
+        self.persistent = False
+        self.edge_triggered = False
+        self.registered = {}
+        self.unclaimed = {}
+        self.ctl_calls = 0
+        self.ctl_saved = 0
+        self._stats_time = self.clock()
+        self._stats_saved = 0
 
     def add(self, evtype, fileno, cb):
         listener = super(Hub, self).add(evtype, fileno, cb)
-        self.register(fileno, new=True)
+        if self.persistent:
+            self.arm(evtype, fileno)
+        else:
+            self.register(fileno, new=True)
         return listener
-    
+
     def remove(self, listener):
         super(Hub, self).remove(listener)
-        self.register(listener.fileno)
+        if self.persistent:
+            # the descriptor stays registered; see disarm()
+            self.ctl_saved += 1
+        else:
+            self.register(listener.fileno)
 
     def register(self, fileno, new=False):
         mask = 0
@@ -38,6 +58,7 @@ class Hub(BaseHub):
             mask |= READ_MASK | EXC_MASK
         if self.listeners[WRITE].get(fileno):
             mask |= WRITE_MASK | EXC_MASK
+        self.ctl_calls += 1
         if mask:
             if new:
                 self.poll.register(fileno, mask)
@@ -46,7 +67,7 @@ class Hub(BaseHub):
                     self.modify(fileno, mask)
                 except (IOError, OSError):
                     self.poll.register(fileno, mask)
-        else: 
+        else:
             try:
                 self.poll.unregister(fileno)
             except KeyError:
@@ -56,8 +77,127 @@ class Hub(BaseHub):
                 # already removed/invalid
                 pass
 
+    def set_persistent(self, persistent=True, edge_triggered=False):
+        """Keep each descriptor registered with the kernel for as long as it
+        is open, instead of registering it when a greenthread starts waiting
+        on it and unregistering it when the wait is over.  Waiting then only
+        touches the hub's own tables, which saves one or two syscalls per
+        blocking call.
+
+        In the default level-triggered mode, a descriptor that becomes ready
+        while nobody waits on it has that event masked off again (one syscall,
+        paid only then).  With *edge_triggered* (epoll only), descriptors are
+        registered for both directions once, and readiness that nobody
+        claimed is remembered and handed to the next waiter.
+
+        Persistent registrations are dropped by :meth:`remove_descriptor` and
+        when green sockets and pipes are closed.  Descriptors that are closed
+        behind eventlet's back are only dropped when their number is reused
+        by a new green socket or pipe.
+        """
+        if edge_triggered and not self.EDGE_TRIGGERED:
+            raise ValueError("%s does not support edge-triggered "
+                             "notification" % type(self).__module__)
+        readers = self.listeners[READ]
+        writers = self.listeners[WRITE]
+        for fileno in set(self.registered) | set(readers) | set(writers):
+            self._unregister(fileno)
+        self.registered.clear()
+        self.unclaimed.clear()
+        self.persistent = persistent
+        self.edge_triggered = persistent and edge_triggered
+        for fileno in set(readers) | set(writers):
+            if not persistent:
+                self.register(fileno, new=True)
+            else:
+                if readers.get(fileno):
+                    self.arm(READ, fileno)
+                if writers.get(fileno):
+                    self.arm(WRITE, fileno)
+
+    def _unregister(self, fileno):
+        self.ctl_calls += 1
+        try:
+            self.poll.unregister(fileno)
+        except (KeyError, ValueError):
+            pass
+        except (IOError, OSError):
+            pass
+
+    def arm(self, evtype, fileno):
+        if evtype is READ:
+            want = READ_MASK | EXC_MASK
+        else:
+            want = WRITE_MASK | EXC_MASK
+        mask = self.registered.get(fileno)
+        if mask is None:
+            if self.edge_triggered:
+                mask = READ_MASK | WRITE_MASK | EXC_MASK | self.EDGE_TRIGGERED
+            else:
+                mask = want
+            self.ctl_calls += 1
+            try:
+                self.poll.register(fileno, mask)
+            except (IOError, OSError), e:
+                if e.args[0] != errno.EEXIST:
+                    raise
+                self.modify(fileno, mask)
+            self.registered[fileno] = mask
+        elif mask & want != want:
+            mask |= want
+            self.ctl_calls += 1
+            try:
+                self.modify(fileno, mask)
+            except (IOError, OSError):
+                self.poll.register(fileno, mask)
+            self.registered[fileno] = mask
+        else:
+            self.ctl_saved += 1
+        if self.edge_triggered:
+            seen = self.unclaimed.get(fileno)
+            if seen and seen & want:
+                self.unclaimed[fileno] = seen & ~want
+                self.call_soon(self._claim, evtype, fileno)
+
+    def _claim(self, evtype, fileno):
+        listeners = self.listeners[evtype].get(fileno)
+        if listeners:
+            listeners[0](fileno)
+
+    def disarm(self, fileno, event):
+        """Deals with *event* on a persistently registered *fileno* arriving
+        while nobody waits for it."""
+        if self.edge_triggered:
+            self.unclaimed[fileno] = self.unclaimed.get(fileno, 0) | event
+            return
+        if fileno not in self.registered:
+            return
+        mask = 0
+        if self.listeners[READ].get(fileno):
+            mask |= READ_MASK | EXC_MASK
+        if self.listeners[WRITE].get(fileno):
+            mask |= WRITE_MASK | EXC_MASK
+        if mask:
+            self.ctl_calls += 1
+            try:
+                self.modify(fileno, mask)
+            except (IOError, OSError):
+                del self.registered[fileno]
+            else:
+                self.registered[fileno] = mask
+        else:
+            del self.registered[fileno]
+            self._unregister(fileno)
+
+    def forget(self, fileno):
+        self.unclaimed.pop(fileno, None)
+        if self.registered.pop(fileno, None) is not None:
+            self._unregister(fileno)
+
     def remove_descriptor(self, fileno):
         super(Hub, self).remove_descriptor(fileno)
+        self.registered.pop(fileno, None)
+        self.unclaimed.pop(fileno, None)
         try:
             self.poll.unregister(fileno)
         except (KeyError, ValueError):
@@ -67,6 +207,30 @@ class Hub(BaseHub):
             # already removed/invalid
             pass
 
+    def close(self):
+        # select.poll objects hold no descriptor, but epoll objects do
+        close = getattr(self.poll, 'close', None)
+        if close is not None:
+            close()
+        super(Hub, self).close()
+
+    def syscall_stats(self):
+        """Returns a dict describing how many registration syscalls the hub
+        has made (``ctl_calls``), how many persistent registration made
+        unnecessary (``ctl_saved``), and how many were saved per second since
+        the previous call (``saved_per_second``)."""
+        now = self.clock()
+        elapsed = now - self._stats_time
+        if elapsed > 0:
+            rate = (self.ctl_saved - self._stats_saved) / elapsed
+        else:
+            rate = 0.0
+        self._stats_time = now
+        self._stats_saved = self.ctl_saved
+        return {'ctl_calls': self.ctl_calls,
+                'ctl_saved': self.ctl_saved,
+                'saved_per_second': rate}
+
     def wait(self, seconds=None):
         readers = self.listeners[READ]
         writers = self.listeners[WRITE]
@@ -77,30 +241,42 @@ class Hub(BaseHub):
             return
         try:
             presult = self.poll.poll(seconds * self.WAIT_MULTIPLIER)
-        except select.error, e:
+        except (select.error, IOError), e:
+            # epoll reports an interrupted wait as IOError rather than
+            # select.error
             if e.args[0] == errno.EINTR:
                 return
             raise
+        self.update_now()
         SYSTEM_EXCEPTIONS = self.SYSTEM_EXCEPTIONS
+        persistent = self.persistent
 
         for fileno, event in presult:
             try:
-                listener = None
-                try:
-                    if event & READ_MASK:
-                        listener = readers[fileno][0]
-                    if event & WRITE_MASK:
-                        listener = writers[fileno][0]
-                except KeyError:
-                    pass
-                else:
-                    if listener:
-                        listener(fileno)
+                if persistent:
+                    unclaimed = 0
+                    if event & READ_MASK and not readers.get(fileno):
+                        unclaimed |= event & READ_MASK
+                    if event & WRITE_MASK and not writers.get(fileno):
+                        unclaimed |= event & WRITE_MASK
+                    if (event & EXC_MASK and not readers.get(fileno)
+                        and not writers.get(fileno)):
+                        unclaimed |= event & EXC_MASK
+                    if unclaimed:
+                        self.disarm(fileno, unclaimed)
+                if event & READ_MASK:
+                    listeners = readers.get(fileno)
+                    if listeners:
+                        listeners[0](fileno)
+                if event & WRITE_MASK:
+                    listeners = writers.get(fileno)
+                    if listeners:
+                        listeners[0](fileno)
                 if event & select.POLLNVAL:
                     self.remove_descriptor(fileno)
                     continue
                 if event & EXC_MASK:
-                    for listeners in (readers.get(fileno, []), 
+                    for listeners in (readers.get(fileno, []),
                                       writers.get(fileno, [])):
                         for listener in listeners:
                             listener(fileno)
@@ -69,6 +69,7 @@ class Hub(BaseHub):
                 return result
 
     def run(self):
+        self.setup_waker()
         while True:
             try:
                 self.dispatch()
@@ -94,6 +95,16 @@ class Hub(BaseHub):
         pass  # exists for compatibility with BaseHub
     running = property(_getrunning, _setrunning)
 
+    # libevent's loop runs callbacks and waits for events in one call, so
+    # there is no telling a busy hub from an idle one: a stall detector sees
+    # this hub waiting all the time, and callback budgets are ignored
+    def _getwaiting(self):
+        return True
+
+    def _setwaiting(self, value):
+        pass  # exists for compatibility with BaseHub
+    waiting = property(_getwaiting, _setwaiting)
+
     def add(self, evtype, fileno, real_cb):
         # this is stupid: pyevent won't call a callback unless it's a function,
         # so we have to force it to be one here
@@ -153,6 +164,17 @@ class Hub(BaseHub):
         self.events_to_add.append(wrapper)
         return wrapper
 
+    def call_soon(self, cb, *args, **kwargs):
+        return self.schedule_call_global(0, cb, *args, **kwargs)
+
+    def wakeup(self, fileno):
+        # there is no loop iteration to hook into, so hand the calls that
+        # other threads queued straight to libevent
+        super(Hub, self).wakeup(fileno)
+        threadsafe = self.threadsafe
+        while threadsafe:
+            self.schedule_call_global(0, threadsafe.popleft())
+
     def _version_info(self):
         baseversion = event.__version__
         return baseversion
@@ -3,6 +3,11 @@ import errno
 from eventlet import patcher
 select = patcher.original('select')
 time = patcher.original('time')
+# an extension module's "original" is the very module that monkey_patch()
+# patches, so when patching comes after this import, only the functions
+# looked up now are sure to be the blocking ones the hub needs
+_select = select.select
+_sleep = time.sleep
 
 from eventlet.hubs.hub import BaseHub, READ, WRITE
 
@@ -18,7 +23,7 @@ class Hub(BaseHub):
         """
         for fd in self.listeners[READ].keys() + self.listeners[WRITE].keys():
             try:
-                select.select([fd], [], [], 0)
+                _select([fd], [], [], 0)
             except select.error, e:
                 if e.args[0] == errno.EBADF:
                     self.remove_descriptor(fd)
@@ -28,10 +33,10 @@ class Hub(BaseHub):
         writers = self.listeners[WRITE]
         if not readers and not writers:
             if seconds:
-                time.sleep(seconds)
+                _sleep(seconds)
             return
         try:
-            r, w, er = select.select(readers.keys(), writers.keys(), readers.keys() + writers.keys(), seconds)
+            r, w, er = _select(readers.keys(), writers.keys(), readers.keys() + writers.keys(), seconds)
         except select.error, e:
             if e.args[0] == errno.EINTR:
                 return
@@ -40,6 +45,7 @@ class Hub(BaseHub):
                 return
             else:
                 raise
+        self.update_now()
 
         for fileno in er:
             for reader in readers.get(fileno, ()):
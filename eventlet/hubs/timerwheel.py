@@ -0,0 +1,200 @@
+"""Hierarchical timing wheel used by :class:`eventlet.hubs.hub.BaseHub` as an
+alternative timer store.
+
+The heap that the hub uses by default never shrinks when a timer is
+cancelled; the cancelled entry simply stays in it until its deadline passes.
+The wheel instead keeps every timer in a hash slot that is chosen by its
+deadline, so adding and cancelling are O(1) and a cancelled timer really goes
+away.  Timers are only handed back to the hub once the tick that contains
+their deadline has been reached; the hub fires them straight from there, in
+deadline order with the timers in its heap.
+
+.. note :: |internal|
+"""
+
+DEFAULT_RESOLUTION = 0.01
+DEFAULT_BITS = 8
+DEFAULT_LEVELS = 4
+
+
+class TimerWheel(object):
+    """ Stores timers by deadline in *levels* wheels of 2 ** *bits* slots
+    each.  Slots of the first wheel are *resolution* seconds wide, slots of
+    each following wheel span a full turn of the previous one.  Timers that
+    are further away than the last wheel reaches are parked in its farthest
+    slot and re-filed when that slot comes around.
+    """
+    def __init__(self, now, resolution=DEFAULT_RESOLUTION,
+                 bits=DEFAULT_BITS, levels=DEFAULT_LEVELS):
+        self.resolution = resolution
+        self.bits = bits
+        self.levels = levels
+        self.mask = (1 << bits) - 1
+        self.span = 1 << (bits * levels)
+        # each slot knows its level, so that filing a timer under it takes
+        # no allocation and removing it needs no lookup
+        self.wheels = [[(level, {}) for i in xrange(1 << bits)]
+                       for level in xrange(levels)]
+        # a timer goes on the first level whose reach exceeds its distance
+        self.reach = [1 << (bits * (level + 1)) for level in xrange(levels)]
+        self.counts = [0] * levels
+        self.where = {}
+        self.current = self._tick(now)
+        self.next_tick = None
+        # expire() has nothing to do before this
+        self.tick_ends = (self.current + 1) * resolution
+
+    def _tick(self, when):
+        return int(when / self.resolution)
+
+    def __len__(self):
+        return len(self.where)
+
+    def __iter__(self):
+        for timer, (level, slot) in self.where.iteritems():
+            yield timer, slot[timer][0]
+
+    def add(self, when, timer, seq=0):
+        """ Files *timer* under its deadline *when*; *seq* orders timers
+        with the same deadline.  Returns False without storing anything if
+        the deadline falls in the current tick; such timers are due right
+        away and belong in the caller's own queue."""
+        return not self.add_entries([(when, seq, timer)])
+
+    def add_entries(self, entries):
+        """ Files a list of ``(when, seq, timer)`` entries at once, which
+        is cheaper than calling :meth:`add` for each.  Returns the list of
+        entries that :meth:`add` would have refused. """
+        due = []
+        current = self.current
+        resolution = self.resolution
+        reach = self.reach
+        lowest = self.next_tick
+        for entry in entries:
+            tick = int(entry[0] / resolution)
+            delta = tick - current
+            if delta <= 0:
+                due.append(entry)
+                continue
+            if delta < reach[0]:
+                level = 0
+                # anything on a higher wheel is beyond the end of this turn
+                # of the first, which is as far as next_tick ever looks
+                if lowest is not None and tick < lowest:
+                    lowest = tick
+            else:
+                if delta >= self.span:
+                    delta = self.span - 1
+                    tick = current + delta
+                level = 1
+                while delta >= reach[level]:
+                    level += 1
+            pair = self.wheels[level][(tick >> (self.bits * level)) & self.mask]
+            pair[1][entry[2]] = entry
+            self.where[entry[2]] = pair
+            self.counts[level] += 1
+        self.next_tick = lowest
+        return due
+
+    def remove(self, timer):
+        """ Forgets *timer* if the wheel holds it. """
+        pair = self.where.pop(timer, None)
+        if pair is not None:
+            del pair[1][timer]
+            self.counts[pair[0]] -= 1
+
+    def clear(self):
+        for wheel in self.wheels:
+            for level, slot in wheel:
+                slot.clear()
+        self.where.clear()
+        self.counts = [0] * self.levels
+        self.next_tick = None
+
+    def _cascade(self):
+        # called when the first wheel has just completed a turn; refile the
+        # slot of every higher wheel whose turn is also complete, and return
+        # the entries that belong to the tick that has just been reached
+        bits = self.bits
+        mask = self.mask
+        current = self.current
+        where = self.where
+        due = []
+        for level in xrange(1, self.levels):
+            index = (current >> (bits * level)) & mask
+            slot = self.wheels[level][index][1]
+            if slot:
+                self.counts[level] -= len(slot)
+                for timer in slot:
+                    del where[timer]
+                entries = slot.values()
+                slot.clear()
+                due.extend(self.add_entries(entries))
+            if index:
+                break
+        return due
+
+    def expire(self, now):
+        """ Advances the wheel to *now* and returns a sorted list of the
+        ``(when, seq, timer)`` entries whose tick has been reached.  Entries
+        from the tick that contains *now* may not be due yet, but all of them
+        come before anything that is still in the wheel. """
+        target = int(now / self.resolution)
+        if target <= self.current:
+            return []
+        self.tick_ends = (target + 1) * self.resolution
+        due = []
+        where = self.where
+        if not where:
+            self.current = target
+            return due
+        mask = self.mask
+        first = self.wheels[0]
+        counts = self.counts
+        while self.current < target:
+            if counts[0]:
+                self.current += 1
+            else:
+                # nothing on the first wheel; skip straight to its next turn
+                self.current = min(target, (self.current | mask) + 1)
+            if not self.current & mask:
+                ready = self._cascade()
+            else:
+                ready = []
+            slot = first[self.current & mask][1]
+            if slot:
+                counts[0] -= len(slot)
+                for timer in slot:
+                    del where[timer]
+                ready.extend(slot.itervalues())
+                slot.clear()
+            if ready:
+                ready.sort()
+                due.extend(ready)
+            if not where:
+                self.current = target
+                break
+        self.next_tick = None
+        return due
+
+    def next_deadline(self):
+        """ Returns the time at which :meth:`expire` may next have something
+        to return, or None if the wheel is empty.  This can be earlier than
+        the first deadline, but never later."""
+        if not self.where:
+            return None
+        if self.next_tick is None:
+            self.next_tick = self._find_next_tick()
+        return self.next_tick * self.resolution
+
+    def _find_next_tick(self):
+        # the higher wheels get cascaded when the first one completes its
+        # turn, so that is the latest we can sleep
+        boundary = (self.current | self.mask) + 1
+        if self.counts[0]:
+            first = self.wheels[0]
+            mask = self.mask
+            for tick in xrange(self.current + 1, boundary):
+                if first[tick & mask][1]:
+                    return tick
+        return boundary
@@ -84,6 +84,32 @@ class socket_rwdescriptor(FdListener):
         return self.logstr
 
 
+class ThreadsafeCall(object):
+    """The call that call_soon_threadsafe() hands to the reactor, which,
+    like the timers that other hubs return, can be cancelled until it's
+    made; but only from the reactor's thread."""
+    def __init__(self, func, args, kwargs):
+        self.tpl = func, args, kwargs
+        self.called = False
+        self.cancelled = False
+
+    @property
+    def pending(self):
+        return not (self.cancelled or self.called)
+
+    def __call__(self):
+        if not self.called:
+            self.called = True
+            func, args, kwargs = self.tpl
+            del self.tpl
+            func(*args, **kwargs)
+
+    def cancel(self):
+        if not self.called:
+            self.called = self.cancelled = True
+            del self.tpl
+
+
 class BaseTwistedHub(object):
     """This hub does not run a dedicated greenlet for the mainloop (unlike TwistedHub).
     Instead, it assumes that the mainloop is run in the main greenlet.
@@ -145,6 +171,33 @@ class BaseTwistedHub(object):
         from twisted.internet import reactor
         return callLater(DelayedCall, reactor, seconds, func, *args, **kwargs)
 
+    def call_soon(self, func, *args, **kwargs):
+        return self.schedule_call_global(0, func, *args, **kwargs)
+
+    def call_soon_threadsafe(self, func, *args, **kwargs):
+        """Calls *func* in the reactor's thread; may be called from any
+        thread.  Returns a :class:`ThreadsafeCall`."""
+        from twisted.internet import reactor
+        call = ThreadsafeCall(func, args, kwargs)
+        reactor.callFromThread(call)
+        return call
+
+    # the reactor runs callbacks and waits for events in one call, so there
+    # is no iteration to budget and no telling a busy hub from an idle one;
+    # budgets are ignored, and a stall detector sees the hub waiting
+    budget_hits = 0
+    switches = 0
+    waiting = True
+    stall_detector = None
+
+    def set_callback_budget(self, count=None, seconds=None):
+        pass
+
+    def set_stall_detector(self, detector):
+        if self.stall_detector is not None:
+            self.stall_detector.stop()
+        self.stall_detector = detector
+
     def abort(self):
         from twisted.internet import reactor
         reactor.crash()
@@ -208,7 +208,7 @@ def killall(procs, *throw_args, **kwargs):
         raise TypeError('Invalid keyword argument for proc.killall(): %s' % ', '.join(kwargs.keys()))
     for g in procs:
         if not g.dead:
-            hubs.get_hub().schedule_call_global(0, g.throw, *throw_args)
+            hubs.get_hub().call_soon(g.throw, *throw_args)
     if wait and api.getcurrent() is not hubs.get_hub().greenlet:
         api.sleep(0)
 
@@ -230,7 +230,7 @@ def spawn_greenlet(function, *args):
     """
     g = api.Greenlet(function)
     g.parent = hubs.get_hub().greenlet
-    hubs.get_hub().schedule_call_global(0, g.switch, *args)
+    hubs.get_hub().call_soon(g.switch, *args)
     return g
 
 
@@ -401,7 +401,7 @@ class Source(object):
         self._start_send()
 
     def _start_send(self):
-        hubs.get_hub().schedule_call_global(0, self._do_send, self._value_links.items(), self._value_links)
+        hubs.get_hub().call_soon(self._do_send, self._value_links.items(), self._value_links)
 
     def send_exception(self, *throw_args):
         assert not self.ready(), "%s has been fired already" % self
@@ -410,7 +410,7 @@ class Source(object):
         self._start_send_exception()
 
     def _start_send_exception(self):
-        hubs.get_hub().schedule_call_global(0, self._do_send, self._exception_links.items(), self._exception_links)
+        hubs.get_hub().call_soon(self._do_send, self._exception_links.items(), self._exception_links)
 
     def _do_send(self, links, consult):
         while links:
@@ -422,7 +422,7 @@ class Source(object):
                     finally:
                         consult.pop(listener, None)
             except:
-                hubs.get_hub().schedule_call_global(0, self._do_send, links, consult)
+                hubs.get_hub().call_soon(self._do_send, links, consult)
                 raise
 
     def wait(self, timeout=None, *throw_args):
@@ -593,7 +593,7 @@ class Proc(Source):
         if not self.dead:
             if not throw_args:
                 throw_args = (ProcExit, )
-            hubs.get_hub().schedule_call_global(0, self.greenlet.throw, *throw_args)
+            hubs.get_hub().call_soon(self.greenlet.throw, *throw_args)
             if api.getcurrent() is not hubs.get_hub().greenlet:
                 api.sleep(0)
 
@@ -48,12 +48,21 @@ class Timeout(BaseException):
     When used in a with statement, if *exception* is ``False``, the timeout is
     still raised, but the context manager suppresses it, so the code outside the
     with-block won't see it.
+
+    If *lazy* is true, only the deadline is recorded at first; the timer is
+    scheduled when the greenthread actually switches to the hub.  Blocks
+    that finish without blocking, such as a cache hit or a read from an
+    already filled buffer, then never touch the hub's timers at all.  A
+    block that never yields can't be interrupted in either case.
     """
 
-    def __init__(self, seconds=None, exception=None):
+    def __init__(self, seconds=None, exception=None, lazy=False):
         self.seconds = seconds
         self.exception = exception
+        self.lazy = lazy
         self.timer = None
+        self.deadline = None
+        self.greenlet = None
         self.start()
 
     def start(self):
@@ -64,21 +73,51 @@ class Timeout(BaseException):
                '%r is already started; to restart it, cancel it first' % self
         if self.seconds is None: # "fake" timeout (never expires)
             self.timer = None
-        elif self.exception is None or self.exception is False: # timeout that raises self
-            self.timer = get_hub().schedule_call_global(
-                self.seconds, greenlet.getcurrent().throw, self)
-        else: # regular timeout with user-provided exception
-            self.timer = get_hub().schedule_call_global(
-                self.seconds, greenlet.getcurrent().throw, self.exception)
+            return self
+        hub = get_hub()
+        current = greenlet.getcurrent()
+        if self.lazy and not getattr(hub, 'uses_twisted_reactor', None):
+            # armed by the hub when current switches to it; see arm()
+            self.timer = None
+            self.deadline = hub.now() + self.seconds
+            self.greenlet = current
+            lazy = getattr(current, 'lazy_timeouts', None)
+            if lazy is None:
+                lazy = current.lazy_timeouts = []
+            lazy.append(self)
+        else:
+            self._schedule(hub, self.seconds, current)
         return self
 
+    def _schedule(self, hub, seconds, target):
+        if self.exception is None or self.exception is False: # timeout that raises self
+            self.timer = hub.schedule_call_global(seconds, target.throw, self)
+        else: # regular timeout with user-provided exception
+            self.timer = hub.schedule_call_global(
+                seconds, target.throw, self.exception)
+
+    def arm(self):
+        """Schedule the timer of a lazy timeout for whatever is left until
+        its deadline.  The hub calls this when the greenthread that started
+        the timeout switches to it."""
+        if self.deadline is None:
+            return
+        hub = get_hub()
+        target = self.greenlet
+        # the greenthread may have run for a while since the deadline was
+        # set, without the hub's cached reading moving on
+        seconds = max(self.deadline - hub.now(exact=True), 0)
+        self.deadline = None
+        self.greenlet = None
+        self._schedule(hub, seconds, target)
+
     @property
     def pending(self):
         """True if the timeout is scheduled to be raised."""
         if self.timer is not None:
             return self.timer.pending
         else:
-            return False
+            return self.deadline is not None
 
     def cancel(self):
         """If the timeout is pending, cancel it.  If not using
@@ -89,6 +128,13 @@ class Timeout(BaseException):
         if self.timer is not None:
             self.timer.cancel()
             self.timer = None
+        elif self.deadline is not None:
+            try:
+                self.greenlet.lazy_timeouts.remove(self)
+            except ValueError:
+                pass
+            self.deadline = None
+            self.greenlet = None
 
     def __repr__(self):
         try:
@@ -127,7 +173,7 @@ class Timeout(BaseException):
             return '%s second%s (%s)' % (self.seconds, suffix, self.exception)
 
     def __enter__(self):
-        if self.timer is None:
+        if self.timer is None and self.deadline is None:
             self.start()
         return self
 
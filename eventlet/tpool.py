@@ -16,73 +16,29 @@
 import os
 import sys
 
-from Queue import Empty, Queue
+from Queue import Queue
 
 from eventlet import event
-from eventlet import greenio
-from eventlet import greenthread
+from eventlet import hubs
 from eventlet import patcher
+from eventlet import timeout
+from eventlet.hubs.hub import monotonic
 threading = patcher.original('threading')
+_sleep = patcher.original('time').sleep
 
-__all__ = ['execute', 'Proxy', 'killall']
+__all__ = ['execute', 'execute_with_timeout', 'execute_many', 'map', 'Proxy',
+           'killall', 'resize', 'stats', 'Executor']
 
 QUIET=True
 
-_rfile = _wfile = None
-
-def _signal_t2e():
-    _wfile.write(' ')
-    _wfile.flush()
-
-_reqq = None
-_rspq = None
-
-def tpool_trampoline():
-    global _reqq, _rspq
-    while(True):
-        try:
-            _c = _rfile.read(1)
-            assert _c != ""
-        except ValueError:
-            break  # will be raised when pipe is closed
-        while not _rspq.empty():
-            try:
-                (e,rv) = _rspq.get(block=False)
-                e.send(rv)
-                rv = None
-            except Empty:
-                pass
-
-def esend(meth,*args, **kwargs):
-    global _reqq, _rspq
-    e = event.Event()
-    _reqq.put((e,meth,args,kwargs))
-    return e
-
 SYS_EXCS = (KeyboardInterrupt, SystemExit)
+# tells a thread to exit unless the pool is at its minimum size; None tells
+# it to exit regardless
+_REAP = 'reap'
+_NONE = object()
 
-
-def tworker():
-    global _reqq, _rspq
-    while(True):
-        msg = _reqq.get()
-        if msg is None:
-            return
-        (e,meth,args,kwargs) = msg
-        rv = None
-        try:
-            rv = meth(*args,**kwargs)
-        except SYS_EXCS:
-            raise
-        except Exception:
-            rv = sys.exc_info()
-        _rspq.put((e,rv))               # @@tavis: not supposed to
-                                        # keep references to
-                                        # sys.exc_info() so it would
-                                        # be worthwhile testing
-                                        # if this leads to memory leaks
-        meth = args = kwargs = e = rv = None
-        _signal_t2e()
+# the executor that a native thread belongs to, if any
+_local = threading.local()
 
 
 def erecv(e):
@@ -97,6 +53,458 @@ def erecv(e):
     return rv
 
 
+def _calls(calls):
+    # (meth, args) or (meth, args, kwargs) tuples, as (meth, args, kwargs)
+    rv = []
+    for call in calls:
+        if len(call) == 2:
+            rv.append((call[0], call[1], {}))
+        else:
+            rv.append(call)
+    return rv
+
+
+def _run_calls(calls):
+    # runs a batch of calls in one of the pool's threads
+    return [meth(*args, **kwargs) for (meth, args, kwargs) in calls]
+
+
+class _Request(event.Event):
+    """The event that a call's result is sent on, which also tells the
+    executor's threads whether anyone still wants the result."""
+    # set by the caller when it stops waiting
+    cancelled = False
+    # the time after which the call isn't worth starting, if any
+    deadline = None
+    # called with the result if it arrives after the caller gave up
+    discard = None
+
+
+class Executor(object):
+    """
+    A pool of native threads with a queue of calls of its own.  Calls made
+    through one executor never wait behind calls made through another, so
+    work that may be slow, like a reporting database or DNS lookups, can be
+    given an executor of its own to keep it from holding up everything
+    else::
+
+        reports = tpool.Executor('reports', size=4)
+        rows = reports.execute(run_report, month)
+
+    The pool starts another thread whenever a call would otherwise have to
+    wait for one, up to *size* threads, and threads beyond *min_threads* exit
+    once they've been idle for *idle_timeout* seconds.  Nothing is started
+    until the executor is first used.
+    """
+    def __init__(self, name=None, size=20, min_threads=1, idle_timeout=60):
+        self.name = name
+        # the most threads the pool grows to
+        self._nthreads = size
+        # the fewest threads the pool shrinks to
+        self._min_threads = min(min_threads, size)
+        # seconds a thread above the minimum may sit idle before it exits
+        self._idle_timeout = idle_timeout
+        self._reqq = None
+        self._threads = set()
+        self._setup_already = False
+        # protects the counters below, which the pool's threads update
+        self._lock = threading.Lock()
+        self._idle = 0
+        # the fewest threads idle at once since _reaper() last looked
+        self._idle_low = 0
+        self._reaping = False
+        self._executed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        # calls dropped before they started, and results nobody waited for
+        self._dropped = 0
+        self._late = 0
+
+    def __repr__(self):
+        return '<%s %r at 0x%x>' % (type(self).__name__, self.name, id(self))
+
+    def esend(self, meth, *args, **kwargs):
+        return self._esend(None, meth, args, kwargs)
+
+    def _esend(self, deadline, meth, args, kwargs, discard=None):
+        reqq = self._reqq
+        e = _Request()
+        e.deadline = deadline
+        e.discard = discard
+        reqq.put((e,hubs.get_hub(),meth,args,kwargs,monotonic()))
+        # start another thread if this call would have to wait for one
+        if reqq.qsize() > self._idle and len(self._threads) < self._nthreads:
+            self._start_thread()
+        return e
+
+    def _tworker(self):
+        reqq = self._reqq
+        lock = self._lock
+        threads = self._threads
+        me = threading.currentThread()
+        _local.executor = self
+        try:
+            while True:
+                lock.acquire()
+                self._idle += 1
+                lock.release()
+                # a timed get() would poll, so idle threads are told to exit
+                # by _reaper() instead
+                msg = reqq.get()
+                lock.acquire()
+                self._idle -= 1
+                if self._idle < self._idle_low:
+                    self._idle_low = self._idle
+                lock.release()
+                if msg is None:
+                    return
+                if msg is _REAP:
+                    lock.acquire()
+                    try:
+                        if len(threads) > self._min_threads:
+                            threads.discard(me)
+                            return
+                    finally:
+                        lock.release()
+                    continue
+                (e,hub,meth,args,kwargs,queued) = msg
+                msg = None
+                now = monotonic()
+                if e.cancelled or (e.deadline is not None and
+                                   now > e.deadline):
+                    # the caller has given up on it, or is about to
+                    lock.acquire()
+                    self._dropped += 1
+                    lock.release()
+                    meth = args = kwargs = e = hub = None
+                    continue
+                waited = now - queued
+                lock.acquire()
+                self._executed += 1
+                self._wait_total += waited
+                if waited > self._wait_max:
+                    self._wait_max = waited
+                lock.release()
+                rv = None
+                failed = False
+                try:
+                    rv = meth(*args,**kwargs)
+                except SYS_EXCS:
+                    raise
+                except Exception:
+                    rv = sys.exc_info()
+                    failed = True
+                if e.cancelled:
+                    lock.acquire()
+                    self._late += 1
+                    lock.release()
+                    if e.discard is not None and not failed:
+                        self._discard(e.discard, rv)
+                else:
+                    # the hub coalesces these, so a burst of results costs
+                    # it a single wakeup
+                    hub.call_soon_threadsafe(self._deliver, e, rv, failed)
+                                        # @@tavis: not supposed to
+                                        # keep references to
+                                        # sys.exc_info() so it would
+                                        # be worthwhile testing
+                                        # if this leads to memory leaks
+                meth = args = kwargs = e = hub = rv = None
+        finally:
+            lock.acquire()
+            threads.discard(me)
+            lock.release()
+
+    def _deliver(self, e, rv, failed):
+        # runs in the hub's thread, where callers cancel, so a caller that
+        # gave up after the call finished is noticed here
+        if e.cancelled:
+            self._lock.acquire()
+            self._late += 1
+            self._lock.release()
+            if e.discard is not None and not failed:
+                # the cleanup may block, so it mustn't run in the hub
+                self.esend(self._discard, e.discard, rv)
+        else:
+            e.send(rv)
+
+    def _discard(self, discard, rv):
+        # runs in one of the threads; nobody is left to report errors to
+        try:
+            discard(rv)
+        except SYS_EXCS:
+            raise
+        except Exception:
+            if not QUIET:
+                import traceback
+                traceback.print_exc()
+
+    def _cancel(self, e):
+        # the caller was killed or timed out; tell the threads
+        if not e.ready() and not e.cancelled:
+            e.cancelled = True
+
+    def _wait(self, e):
+        try:
+            return erecv(e)
+        except:
+            self._cancel(e)
+            raise
+
+    def _start_thread(self):
+        if self.name is None:
+            name = 'tpool'
+        else:
+            name = 'tpool-%s' % (self.name,)
+        t = threading.Thread(target=self._tworker, name=name)
+        t.setDaemon(True)
+        self._lock.acquire()
+        self._threads.add(t)
+        start_reaper = (len(self._threads) > self._min_threads
+                        and not self._reaping)
+        if start_reaper:
+            self._reaping = True
+            self._idle_low = self._idle
+        self._lock.release()
+        t.start()
+        if start_reaper:
+            reaper = threading.Thread(target=self._reaper, name=name)
+            reaper.setDaemon(True)
+            reaper.start()
+
+    def _reaper(self):
+        # runs while the pool has threads above the minimum; every
+        # idle_timeout seconds it tells as many threads to exit as stayed
+        # idle all along
+        reqq = self._reqq
+        lock = self._lock
+        while True:
+            _sleep(self._idle_timeout)
+            lock.acquire()
+            try:
+                if reqq is not self._reqq:
+                    # killall() got rid of the pool
+                    return
+                surplus = min(self._idle_low,
+                              len(self._threads) - self._min_threads)
+                self._idle_low = self._idle
+                done = len(self._threads) - max(surplus, 0) <= \
+                    self._min_threads
+                if done:
+                    self._reaping = False
+            finally:
+                lock.release()
+            for i in xrange(surplus):
+                reqq.put(_REAP)
+            if done:
+                return
+
+    def setup(self):
+        if self._setup_already:
+            return
+        else:
+            self._setup_already = True
+
+        self._reqq = Queue(maxsize=-1)
+        for i in range(0,self._min_threads):
+            self._start_thread()
+
+    def execute(self, meth, *args, **kwargs):
+        """
+        Execute *meth* in one of the executor's threads, blocking the current
+        greenthread until the method completes.  Called from a native thread
+        of any executor, it just calls *meth*.
+
+        If the greenthread is killed or times out while the call is still
+        queued, the call is dropped; if it's already running, its result is
+        thrown away when it arrives.
+        """
+        self.setup()
+        if getattr(_local, 'executor', None) is not None:
+            return meth(*args, **kwargs)
+        e = self._esend(None, meth, args, kwargs)
+        return self._wait(e)
+
+    def execute_with_timeout(self, seconds, meth, *args, **kwargs):
+        """
+        Like :meth:`execute`, but gives up after *seconds*, raising
+        :class:`~eventlet.timeout.Timeout` or, like
+        :func:`~eventlet.timeout.with_timeout`, returning the keyword argument
+        *timeout_value* if it's given.  A call that's still queued when its
+        time is up is never started, even if the hub is too busy to notice
+        in time.
+
+        If the keyword argument *discard* is given, it's called, in one of
+        the threads, with a result that arrives after the caller has given
+        up on it, so that a connection or file that nobody will use can be
+        closed rather than left to the garbage collector.
+        """
+        timeout_value = kwargs.pop('timeout_value', _NONE)
+        discard = kwargs.pop('discard', None)
+        self.setup()
+        if getattr(_local, 'executor', None) is not None:
+            return meth(*args, **kwargs)
+        t = timeout.Timeout(seconds)
+        try:
+            try:
+                if seconds is None:
+                    deadline = None
+                else:
+                    # the clock Timeout goes by, which unlike time.time()
+                    # doesn't jump when the system time is set
+                    deadline = monotonic() + seconds
+                e = self._esend(deadline, meth, args, kwargs, discard)
+                return self._wait(e)
+            except timeout.Timeout, ex:
+                if ex is t and timeout_value is not _NONE:
+                    return timeout_value
+                raise
+        finally:
+            t.cancel()
+
+    def execute_many(self, calls, chunksize=None):
+        """
+        Executes a sequence of calls, each a ``(meth, args)`` or ``(meth,
+        args, kwargs)`` tuple, and returns a list of their results.  The
+        calls are sent to the threads in batches of *chunksize*, so that a
+        batch costs a single round trip to the pool; by default they're
+        spread over as many batches as the pool has threads at most.  If a
+        call raises, its exception is raised and the calls that haven't
+        started yet are dropped.
+        """
+        calls = _calls(calls)
+        self.setup()
+        if getattr(_local, 'executor', None) is not None:
+            return _run_calls(calls)
+        if not calls:
+            return []
+        if chunksize is None:
+            chunksize = (len(calls) + self._nthreads - 1) // self._nthreads
+        events = []
+        for i in xrange(0, len(calls), chunksize):
+            events.append(self._esend(None, _run_calls,
+                                      (calls[i:i + chunksize],), {}))
+        results = []
+        try:
+            for e in events:
+                results.extend(erecv(e))
+        except:
+            for e in events:
+                self._cancel(e)
+            raise
+        return results
+
+    def map(self, func, *iterables, **kwargs):
+        """
+        Returns ``[func(*args) for args in zip(*iterables)]``, calling *func*
+        in the executor's threads; see :meth:`execute_many`, whose
+        *chunksize* it also takes.
+        """
+        chunksize = kwargs.pop('chunksize', None)
+        if kwargs:
+            raise TypeError("unexpected keyword arguments %r" % (kwargs,))
+        return self.execute_many([(func, args) for args in zip(*iterables)],
+                                 chunksize)
+
+    def proxy_call(self, autowrap, f, *args, **kwargs):
+        """
+        Like :func:`proxy_call`, with *f* executed by this executor, which
+        also executes the calls of the :class:`Proxy` objects it returns.
+        """
+        if kwargs.pop('nonblocking',False):
+            rv = f(*args, **kwargs)
+        else:
+            rv = self.execute(f,*args,**kwargs)
+        if isinstance(rv, autowrap):
+            return Proxy(rv, autowrap, executor=self)
+        else:
+            return rv
+
+    def resize(self, min_threads=None, max_threads=None, idle_timeout=None):
+        """
+        Changes the bounds of the pool while it runs.  When *max_threads*
+        shrinks, threads above it exit as soon as they've finished the calls
+        queued before.
+        """
+        if min_threads is None:
+            min_threads = self._min_threads
+        if max_threads is None:
+            max_threads = self._nthreads
+        if not 0 <= min_threads <= max_threads or max_threads < 1:
+            raise ValueError("need 0 <= min_threads <= max_threads and "
+                             "max_threads >= 1, not %r and %r" % (
+                             min_threads, max_threads))
+        self._min_threads = min_threads
+        self._nthreads = max_threads
+        if idle_timeout is not None:
+            self._idle_timeout = idle_timeout
+        if not self._setup_already:
+            return
+        while len(self._threads) < self._min_threads:
+            self._start_thread()
+        for i in range(len(self._threads) - self._nthreads):
+            self._reqq.put(None)
+
+    def stats(self):
+        """
+        Returns a dict with the number of threads in the pool (``threads``)
+        and how many of them are idle (``idle``), the pool's bounds
+        (``min_threads``, ``max_threads``), the number of calls waiting for a
+        thread (``queued``), how many calls the pool has executed
+        (``executed``), and how long they waited for a thread on average and
+        at most (``wait_average``, ``wait_max``, in seconds).  ``dropped``
+        counts the calls that weren't started because their caller had given
+        up or their deadline had passed, and ``late`` the calls that finished
+        after their caller had given up.
+        """
+        if self._reqq is not None:
+            queued = self._reqq.qsize()
+        else:
+            queued = 0
+        if self._executed:
+            average = self._wait_total / self._executed
+        else:
+            average = 0.0
+        return {'threads': len(self._threads),
+                'idle': self._idle,
+                'min_threads': self._min_threads,
+                'max_threads': self._nthreads,
+                'queued': queued,
+                'executed': self._executed,
+                'wait_average': average,
+                'wait_max': self._wait_max,
+                'dropped': self._dropped,
+                'late': self._late}
+
+    def killall(self):
+        """
+        Stops the executor's threads, after they've finished the calls
+        queued so far.  Using the executor again starts new ones.
+        """
+        if not self._setup_already:
+            return
+        threads = list(self._threads)
+        for i in threads:
+            self._reqq.put(None)
+        for thr in threads:
+            thr.join()
+        self._threads.clear()
+        self._reqq = None
+        self._reaping = False
+        self._setup_already = False
+
+
+_default = Executor(
+    'default',
+    size=int(os.environ.get('EVENTLET_THREADPOOL_SIZE', 20)),
+    min_threads=int(os.environ.get('EVENTLET_THREADPOOL_MIN', 1)),
+    idle_timeout=float(os.environ.get('EVENTLET_THREADPOOL_IDLE_TIMEOUT', 60)))
+
+
+def esend(meth,*args, **kwargs):
+    return _default.esend(meth, *args, **kwargs)
+
+
 def execute(meth,*args, **kwargs):
     """
     Execute *meth* in a Python thread, blocking the current coroutine/
@@ -107,15 +515,38 @@ def execute(meth,*args, **kwargs):
     to achieve cooperative yielding.  With tpool, you can force such objects to
     cooperate with green threads by sticking them in native threads, at the cost
     of some overhead.
+
+    This uses the default :class:`Executor`; call the :meth:`~Executor.execute`
+    method of another one to keep the call apart from the others.
     """
-    global _threads
-    setup()
-    my_thread = threading.currentThread()
-    if my_thread in _threads:
-        return meth(*args, **kwargs)
-    e = esend(meth, *args, **kwargs)
-    rv = erecv(e)
-    return rv
+    return _default.execute(meth, *args, **kwargs)
+
+
+def execute_with_timeout(seconds, meth, *args, **kwargs):
+    """
+    Execute *meth* in a Python thread like :func:`execute`, giving up after
+    *seconds*; see :meth:`Executor.execute_with_timeout`.
+    """
+    return _default.execute_with_timeout(seconds, meth, *args, **kwargs)
+
+
+def execute_many(calls, chunksize=None):
+    """
+    Execute a sequence of ``(meth, args)`` or ``(meth, args, kwargs)`` calls
+    in Python threads, returning a list of their results.  They're sent to
+    the threads in batches, so that many small calls cost far fewer round
+    trips than executing them one by one; see
+    :meth:`Executor.execute_many`.
+    """
+    return _default.execute_many(calls, chunksize)
+
+
+def map(func, *iterables, **kwargs):
+    """
+    Returns ``[func(*args) for args in zip(*iterables)]``, with the calls
+    made in Python threads, in batches; see :meth:`Executor.map`.
+    """
+    return _default.map(func, *iterables, **kwargs)
 
 
 def proxy_call(autowrap, f, *args, **kwargs):
@@ -130,14 +561,7 @@ def proxy_call(autowrap, f, *args, **kwargs):
     that don't need to be called in a separate thread, but which return objects
     that should be Proxy wrapped.
     """
-    if kwargs.pop('nonblocking',False):
-        rv = f(*args, **kwargs)
-    else:
-        rv = execute(f,*args,**kwargs)
-    if isinstance(rv, autowrap):
-        return Proxy(rv, autowrap)
-    else:
-        return rv
+    return _default.proxy_call(autowrap, f, *args, **kwargs)
 
 class Proxy(object):
     """
@@ -159,23 +583,31 @@ class Proxy(object):
     wrapped in a Proxy.  *autowrap_names* is a collection
     of strings, which represent the names of attributes that should be
     wrapped in Proxy objects when accessed.
+
+    The calls go to *executor*, an :class:`Executor`, or to the default
+    one if it's None; Proxy objects wrapped around attributes and return
+    values use the same executor.
     """
-    def __init__(self, obj,autowrap=(), autowrap_names=()):
+    def __init__(self, obj,autowrap=(), autowrap_names=(), executor=None):
         self._obj = obj
         self._autowrap = autowrap
         self._autowrap_names = autowrap_names
+        if executor is None:
+            executor = _default
+        self._executor = executor
 
     def __getattr__(self,attr_name):
         f = getattr(self._obj,attr_name)
         if not callable(f):
             if (isinstance(f, self._autowrap) or
                 attr_name in self._autowrap_names):
-                return Proxy(f, self._autowrap)
+                return Proxy(f, self._autowrap, executor=self._executor)
             return f
         def doit(*args, **kwargs):
-            result = proxy_call(self._autowrap, f, *args, **kwargs)
+            result = self._executor.proxy_call(self._autowrap, f,
+                                               *args, **kwargs)
             if attr_name in self._autowrap_names and not isinstance(result, Proxy):
-                return Proxy(result)
+                return Proxy(result, executor=self._executor)
             return result
         return doit
 
@@ -183,13 +615,17 @@ class Proxy(object):
     # doesn't use getattr to retrieve and therefore have to be defined
     # explicitly
     def __getitem__(self, key):
-        return proxy_call(self._autowrap, self._obj.__getitem__, key)
+        return self._executor.proxy_call(self._autowrap,
+                                         self._obj.__getitem__, key)
     def __setitem__(self, key, value):
-        return proxy_call(self._autowrap, self._obj.__setitem__, key, value)
+        return self._executor.proxy_call(self._autowrap,
+                                         self._obj.__setitem__, key, value)
     def __deepcopy__(self, memo=None):
-        return proxy_call(self._autowrap, self._obj.__deepcopy__, memo)
+        return self._executor.proxy_call(self._autowrap,
+                                         self._obj.__deepcopy__, memo)
     def __copy__(self, memo=None):
-        return proxy_call(self._autowrap, self._obj.__copy__, memo)
+        return self._executor.proxy_call(self._autowrap,
+                                         self._obj.__copy__, memo)
     # these don't go through a proxy call, because they're likely to
     # be called often, and are unlikely to be implemented on the
     # wrapped object in such a way that they would block
@@ -205,64 +641,32 @@ class Proxy(object):
         return bool(self._obj)
 
 
-
-_nthreads = int(os.environ.get('EVENTLET_THREADPOOL_SIZE', 20))
-_threads = set()
-_coro = None
-_setup_already = False
 def setup():
-    global _rfile, _wfile, _threads, _coro, _setup_already, _reqq, _rspq
-    if _setup_already:
-        return
-    else:
-        _setup_already = True
-    try:
-        _rpipe, _wpipe = os.pipe()
-        _wfile = os.fdopen(_wpipe,"w",0)
-        _rfile = os.fdopen(_rpipe,"r",0)
-        ## Work whether or not wrap_pipe_with_coroutine_pipe was called
-        if not isinstance(_rfile, greenio.GreenPipe):
-            _rfile = greenio.GreenPipe(_rfile)
-    except ImportError:
-        # This is Windows compatibility -- use a socket instead of a pipe because
-        # pipes don't really exist on Windows.
-        import socket
-        from eventlet import util
-        sock = util.__original_socket__(socket.AF_INET, socket.SOCK_STREAM)
-        sock.bind(('localhost', 0))
-        sock.listen(50)
-        csock = util.__original_socket__(socket.AF_INET, socket.SOCK_STREAM)
-        csock.connect(('localhost', sock.getsockname()[1]))
-        nsock, addr = sock.accept()
-        _rfile = greenio.Green_fileobject(greenio.GreenSocket(csock))
-        _wfile = nsock.makefile()
-
-    _reqq = Queue(maxsize=-1)
-    _rspq = Queue(maxsize=-1)
-    for i in range(0,_nthreads):
-        t = threading.Thread(target=tworker)
-        t.setDaemon(True)
-        t.start()
-        _threads.add(t)
+    _default.setup()
+
+
+def resize(min_threads=None, max_threads=None, idle_timeout=None):
+    """
+    Changes the bounds of the default executor's pool while it runs.  The
+    pool starts threads, up to *max_threads*, whenever calls would otherwise
+    wait for one, and threads beyond *min_threads* exit once they've been
+    idle for *idle_timeout* seconds.  When *max_threads* shrinks, threads
+    above it exit as soon as they've finished the calls queued before.
+
+    The initial bounds come from the environment variables
+    ``EVENTLET_THREADPOOL_MIN`` (1), ``EVENTLET_THREADPOOL_SIZE`` (20) and
+    ``EVENTLET_THREADPOOL_IDLE_TIMEOUT`` (60).
+    """
+    _default.resize(min_threads, max_threads, idle_timeout)
+
 
-    _coro = greenthread.spawn_n(tpool_trampoline)
+def stats():
+    """
+    Returns the statistics of the default executor; see
+    :meth:`Executor.stats`.
+    """
+    return _default.stats()
 
 
 def killall():
-    global _setup_already, _reqq, _rspq, _rfile, _wfile
-    if not _setup_already:
-        return
-    for i in _threads:
-        _reqq.put(None)
-    for thr in _threads:
-        thr.join()
-    _threads.clear()
-    if _coro is not None:
-        greenthread.kill(_coro)
-    _rfile.close()
-    _wfile.close()
-    _rfile = None
-    _wfile = None
-    _reqq = None
-    _rspq = None
-    _setup_already = False
+    _default.killall()
@@ -1,24 +1,42 @@
+import collections
 import errno
 import os
+import stat
 import sys
+import tempfile
 import time
 import traceback
 import warnings
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
 
 from eventlet.green import urllib
 from eventlet.green import socket
 from eventlet.green import BaseHTTPServer
+from eventlet import convenience
+from eventlet import event
 from eventlet import greenpool
 from eventlet import greenio
+from eventlet import greenthread
+from eventlet import hubs
+from eventlet.hubs.hub import monotonic
+from eventlet import patcher
+from eventlet import timeout
+from eventlet import tpool
 
 DEFAULT_MAX_SIMULTANEOUS_REQUESTS = 1024
 DEFAULT_MAX_HTTP_VERSION = 'HTTP/1.1'
 MAX_REQUEST_LINE = 8192
+MAX_HEADERS_SIZE = 65536
+MAX_CACHED_HEADER_NAMES = 1000
 MINIMUM_CHUNK_SIZE = 4096
 DEFAULT_LOG_FORMAT= ('%(client_ip)s - - [%(date_time)s] "%(request_line)s"'
                      ' %(status_code)s %(body_length)s %(wall_seconds).6f')
 
-__all__ = ['server', 'format_date_time']
+__all__ = ['server', 'serve_multi', 'format_date_time', 'AdmissionQueue',
+           'AsyncLog']
 
 # Weekday and month names for HTTP date/time formatting; always English!
 _weekdayname = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
@@ -33,6 +51,173 @@ def format_date_time(timestamp):
         _weekdayname[wd], day, _monthname[month], year, hh, mm, ss
     )
 
+_cached_date = (None, None)
+
+def date_header():
+    """Returns the Date header line for the current time, formatting it at
+    most once per second."""
+    global _cached_date
+    now = int(time.time())
+    if _cached_date[0] != now:
+        _cached_date = (now, 'Date: %s\r\n' % format_date_time(now))
+    return _cached_date[1]
+
+_cached_log_date = (None, None)
+
+def log_date_time():
+    """Returns the local time the way access log lines show it, formatting it
+    at most once per second."""
+    global _cached_log_date
+    now = int(time.time())
+    if _cached_log_date[0] != now:
+        year, month, day, hh, mm, ss, _w, _y, _z = time.localtime(now)
+        _cached_log_date = (now, "%02d/%3s/%04d %02d:%02d:%02d" % (
+            day, _monthname[month], year, hh, mm, ss))
+    return _cached_log_date[1]
+
+_capitalized_names = {}
+
+def capitalize_header(name):
+    """Capitalizes a header name the canonical way, e.g. content-type becomes
+    Content-Type."""
+    try:
+        return _capitalized_names[name]
+    except KeyError:
+        pass
+    capitalized = '-'.join([x.capitalize() for x in name.split('-')])
+    if len(_capitalized_names) < MAX_CACHED_HEADER_NAMES:
+        _capitalized_names[name] = capitalized
+    return capitalized
+
+_environ_keys = {}
+
+def _environ_key(name):
+    # the key a header goes by in the environ, with and without HTTP_
+    try:
+        return _environ_keys[name]
+    except KeyError:
+        pass
+    key = name.replace('-', '_').upper()
+    keys = (key, 'HTTP_' + key)
+    if len(_environ_keys) < MAX_CACHED_HEADER_NAMES:
+        _environ_keys[name] = keys
+    return keys
+
+
+class Headers(object):
+    """ Request headers, as parsed by :func:`parse_headers`.  Supports the
+    parts of the :class:`mimetools.Message` interface that request handlers
+    use; *fields* is the list of ``(name, value)`` pairs in the order they
+    were received, and *headers* the raw header lines. """
+    def __init__(self, lines, fields):
+        self.headers = lines
+        self.fields = fields
+        # like mimetools.Message, the last of repeated headers wins
+        self.dict = dict([(name.lower(), value) for name, value in fields])
+
+    def getheader(self, name, default=None):
+        return self.dict.get(name.lower(), default)
+
+    get = getheader
+
+    def getheaders(self, name):
+        name = name.lower()
+        return [value for key, value in self.fields if key.lower() == name]
+
+    def __getitem__(self, name):
+        return self.dict[name.lower()]
+
+    def __contains__(self, name):
+        return name.lower() in self.dict
+
+    has_key = __contains__
+
+    def __len__(self):
+        return len(self.dict)
+
+    def __iter__(self):
+        return iter(self.dict)
+
+    def keys(self):
+        return self.dict.keys()
+
+    def values(self):
+        return self.dict.values()
+
+    def items(self):
+        return self.dict.items()
+
+    @property
+    def typeheader(self):
+        return self.dict.get('content-type')
+
+    @property
+    def type(self):
+        typeheader = self.typeheader
+        if typeheader is None:
+            return 'text/plain'
+        return typeheader.split(';', 1)[0].strip().lower()
+
+
+def parse_headers(block):
+    """ Parses a block of RFC 822 header lines into a :class:`Headers`. """
+    lines = []
+    fields = []
+    for line in block.splitlines(True):
+        if line[:1] in (' ', '\t'):
+            # folded continuation of the previous header
+            if fields:
+                name, value = fields[-1]
+                fields[-1] = (name, (value + ' ' + line.strip()).strip())
+                lines.append(line)
+            continue
+        i = line.find(':')
+        if i > 0:
+            fields.append((line[:i], line[i + 1:].strip()))
+            lines.append(line)
+        elif not line.strip():
+            break
+    return Headers(lines, fields)
+
+
+_http_versions = {'HTTP/1.1': (1, 1), 'HTTP/1.0': (1, 0)}
+
+def parse_http_version(version):
+    """ Returns the version number of an HTTP version string such as
+    HTTP/1.1 as a tuple of ints, or None if it is malformed."""
+    if version[:5] != 'HTTP/':
+        return None
+    # RFC 2145 section 3.1 says there can be only one "." and
+    #   - major and minor numbers MUST be treated as
+    #      separate integers;
+    #   - HTTP/2.4 is a lower version than HTTP/2.13, which in
+    #      turn is lower than HTTP/12.3;
+    #   - Leading zeros MUST be ignored by recipients.
+    version_number = version[5:].split(".")
+    if len(version_number) != 2:
+        return None
+    try:
+        return int(version_number[0]), int(version_number[1])
+    except ValueError:
+        return None
+
+
+def read_headers(rfile, size=MAX_HEADERS_SIZE):
+    """ Reads a header block from *rfile*, up to and including the empty line
+    that ends it, or at most *size* bytes of it. """
+    if hasattr(rfile, 'readheaders'):
+        return rfile.readheaders(size)
+    lines = []
+    left = size
+    while left > 0:
+        line = rfile.readline(left)
+        lines.append(line)
+        left -= len(line)
+        if line in ('\r\n', '\n', ''):
+            break
+    return ''.join(lines)
+
+
 # Collections of error codes to compare against.  Not all attributes are set
 # on errno module on all platforms, so some are literals :(
 BAD_SOCK = set((errno.EBADF, 10053))
@@ -51,6 +236,13 @@ def get_errno(err):
         return None
 
 class Input(object):
+    """ The ``wsgi.input`` of a request.  The body is read from the connection
+    as the application asks for it, so reading it a block or a line at a
+    time, or iterating over its lines, takes memory for a block or a line
+    however large the body is. """
+    # bytes read at a time by spool()
+    block_size = 65536
+
     def __init__(self,
                  rfile,
                  content_length,
@@ -70,17 +262,22 @@ class Input(object):
         self.chunked_input = chunked_input
         self.chunk_length = -1
 
-    def _do_read(self, reader, length=None):
+    def _send_continue(self):
         if self.wfile is not None:
             ## 100 Continue
             self.wfile.write(self.wfile_line)
+            # the client waits for it before sending the body
+            self.wfile.flush()
             self.wfile = None
             self.wfile_line = None
 
-        if length is None and self.content_length is not None:
-            length = self.content_length - self.position
-        if length and length > self.content_length - self.position:
-            length = self.content_length - self.position
+    def _do_read(self, reader, length=None):
+        self._send_continue()
+        if self.content_length is None:
+            return ''
+        left = self.content_length - self.position
+        if length is None or length < 0 or length > left:
+            length = left
         if not length:
             return ''
         try:
@@ -90,36 +287,46 @@ class Input(object):
         self.position += len(read)
         return read
 
-    def _chunked_read(self, rfile, length=None):
-        if self.wfile is not None:
-            ## 100 Continue
-            self.wfile.write(self.wfile_line)
-            self.wfile = None
-            self.wfile_line = None
-
+    def _chunked_read(self, rfile, length=None, use_readline=False):
+        """ Reads up to *length* bytes of a chunked body, all of it if
+        *length* is None, stopping at the end of a line if *use_readline*. """
+        self._send_continue()
+        if length is not None and length < 0:
+            length = None
+        if use_readline:
+            reader = rfile.readline
+        else:
+            reader = rfile.read
         response = []
         try:
-            if length is None:
-                if self.chunk_length > self.position:
-                    response.append(rfile.read(self.chunk_length - self.position))
-                while self.chunk_length != 0:
-                    self.chunk_length = int(rfile.readline(), 16)
-                    response.append(rfile.read(self.chunk_length))
+            while self.chunk_length != 0 and length != 0:
+                left = self.chunk_length - self.position
+                if left <= 0:
+                    # the chunk-size line, which may carry extensions
+                    self.chunk_length = int(
+                        rfile.readline().split(';', 1)[0], 16)
+                    self.position = 0
+                    if not self.chunk_length:
+                        # skip the trailer, up to the empty line
+                        while rfile.readline() not in ('\r\n', '\n', ''):
+                            pass
+                    continue
+                if length is not None and length < left:
+                    left = length
+                data = reader(left)
+                if not data:
+                    # the client went away in the middle of the body
+                    self.chunk_length = 0
+                    break
+                response.append(data)
+                self.position += len(data)
+                if self.position == self.chunk_length:
+                    # the CRLF after the chunk
                     rfile.readline()
-            else:
-                while length > 0 and self.chunk_length != 0:
-                    if self.chunk_length > self.position:
-                        response.append(rfile.read(
-                                min(self.chunk_length - self.position, length)))
-                        length -= len(response[-1])
-                        self.position += len(response[-1])
-                        if self.chunk_length == self.position:
-                            rfile.readline()
-                    else:
-                        self.chunk_length = int(rfile.readline(), 16)
-                        self.position = 0
-                        if not self.chunk_length:
-                            rfile.readline()
+                if length is not None:
+                    length -= len(data)
+                if use_readline and data[-1] == '\n':
+                    break
         except greenio.SSL.ZeroReturnError:
             pass
         return ''.join(response)
@@ -130,37 +337,229 @@ class Input(object):
         return self._do_read(self.rfile.read, length)
 
     def readline(self, size=None):
-        return self._do_read(self.rfile.readline)
+        if self.chunked_input:
+            return self._chunked_read(self.rfile, size, True)
+        return self._do_read(self.rfile.readline, size)
 
     def readlines(self, hint=None):
-        return self._do_read(self.rfile.readlines, hint)
+        lines = []
+        total = 0
+        for line in self:
+            lines.append(line)
+            total += len(line)
+            if hint and total >= hint:
+                break
+        return lines
 
     def __iter__(self):
-        return iter(self.read())
+        return self
+
+    def next(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def spool(self, threshold=1048576):
+        """ Reads the rest of the body into a seekable file-like object,
+        positioned at its start, for applications that need random access to
+        it.  Up to *threshold* bytes are kept in memory; a larger body is
+        written a block at a time to a temporary file. """
+        spooled = StringIO()
+        size = 0
+        on_disk = False
+        while True:
+            data = self.read(self.block_size)
+            if not data:
+                break
+            size += len(data)
+            if size > threshold and not on_disk:
+                temp = tempfile.TemporaryFile()
+                temp.write(spooled.getvalue())
+                spooled = temp
+                on_disk = True
+            spooled.write(data)
+        spooled.seek(0)
+        return spooled
 
     def get_socket(self):
         return self.rfile._sock.dup()
 
 
+class FileWrapper(object):
+    """ The ``wsgi.file_wrapper`` of PEP 333.  When an application returns
+    one wrapped around a regular file, the server sends the file with
+    :meth:`~eventlet.greenio.GreenSocket.sendfile` instead of reading it into
+    Python; otherwise it is iterated over like any other response. """
+    def __init__(self, filelike, blksize=8192):
+        self.filelike = filelike
+        self.blksize = blksize
+        if hasattr(filelike, 'close'):
+            self.close = filelike.close
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        data = self.filelike.read(self.blksize)
+        if data:
+            return data
+        raise StopIteration
+
+    def file_span(self):
+        """ Returns the offset of the file's current position and how many
+        bytes are left to send from there, or None if the wrapped object is
+        not a regular file. """
+        try:
+            fileno = self.filelike.fileno()
+            st = os.fstat(fileno)
+            if not stat.S_ISREG(st.st_mode):
+                return None
+            offset = self.filelike.tell()
+        except (AttributeError, ValueError, OSError, IOError):
+            return None
+        return offset, max(st.st_size - offset, 0)
+
+
 class HttpProtocol(BaseHTTPServer.BaseHTTPRequestHandler):
     protocol_version = 'HTTP/1.1'
     minimum_chunk_size = MINIMUM_CHUNK_SIZE
+    # how many bytes of responses to pipelined requests may be held back to
+    # be sent together; 0 sends every response as it is written
+    pipeline_batch_size = 65536
+    # how many bytes of a response may be held back until the application
+    # yields, so that many small writes go out in one send; 0 sends every
+    # write as it is made
+    coalesce_size = 65536
+    # the connection's local address, looked up on its first request
+    sockname = None
+    requests_served = 0
+    # set while the server waits for the next request on the connection
+    parked = False
 
     def setup(self):
-        # overriding SocketServer.setup to correctly handle SSL.Connection objects
+        # overriding SocketServer.setup to correctly handle SSL.Connection
+        # objects, and to read and write through the connection itself
+        # rather than through two dup()s of it
         conn = self.connection = self.request
+        if hasattr(conn, 'sendall') and hasattr(conn, 'recv'):
+            self.rfile = greenio.GreenSocketFile(conn, 'rb', self.rbufsize)
+            self.wfile = greenio.GreenSocketFile(conn, 'wb', self.wbufsize)
+            self.wfile.coalesce_size = self.coalesce_size
+        else:
+            # it's a SSLObject, or a martian
+            raise NotImplementedError("wsgi.py doesn't support sockets "\
+                                      "of type %s" % type(conn))
+
+    def parse_request(self):
+        """Parses the request line in self.raw_requestline and reads the
+        headers, like BaseHTTPRequestHandler.parse_request does, but reads
+        the whole header block at once and parses it with
+        :func:`parse_headers` instead of mimetools.Message.  Returns True
+        for success; on failure, an error has been sent back."""
+        self.command = None  # set in case of error on the first line
+        self.request_version = version = self.default_request_version
+        self.close_connection = 1
+        requestline = self.raw_requestline.rstrip('\r\n')
+        self.requestline = requestline
+        words = requestline.split()
+        if len(words) == 3:
+            command, path, version = words
+            version_number = _http_versions.get(version)
+            if version_number is None:
+                version_number = parse_http_version(version)
+                if version_number is None:
+                    self.send_error(400, "Bad request version (%r)" % version)
+                    return False
+            if version_number >= (1, 1) and self.protocol_version >= "HTTP/1.1":
+                self.close_connection = 0
+            if version_number >= (2, 0):
+                self.send_error(505,
+                          "Invalid HTTP Version (%s)" % version.split('/', 1)[1])
+                return False
+        elif len(words) == 2:
+            command, path = words
+            self.close_connection = 1
+            if command != 'GET':
+                self.send_error(400,
+                                "Bad HTTP/0.9 request type (%r)" % command)
+                return False
+        elif not words:
+            return False
+        else:
+            self.send_error(400, "Bad request syntax (%r)" % requestline)
+            return False
+        self.command, self.path, self.request_version = command, path, version
+
+        block = read_headers(self.rfile)
+        if not block.endswith('\n\n') and not block.endswith('\n\r\n') \
+                and block not in ('\r\n', '\n'):
+            if len(block) >= MAX_HEADERS_SIZE:
+                self.wfile.write(
+                    "HTTP/1.0 400 Bad Request\r\n"
+                    "Connection: close\r\nContent-length: 0\r\n\r\n")
+            # otherwise the client went away halfway through the headers
+            self.close_connection = 1
+            return False
+        self.headers = parse_headers(block)
+
+        conntype = self.headers.get('Connection', "").lower()
+        if conntype == 'close':
+            self.close_connection = 1
+        elif (conntype == 'keep-alive' and
+              self.protocol_version >= "HTTP/1.1"):
+            self.close_connection = 0
+        return True
+
+    def handle(self):
+        self.close_connection = 0
+        while not self.close_connection:
+            if not self.request_buffered():
+                self.send_held_responses()
+                if self.close_connection:
+                    break
+                if self.requests_served:
+                    # the last request's state is of no use to the next one
+                    self.environ = self.headers = None
+                    if self.server.park(self):
+                        # the server hands the connection back to resume()
+                        # when the next request arrives
+                        self.parked = True
+                        return
+            self.handle_one_request()
+
+    def send_held_responses(self):
+        """Sends the responses to pipelined requests that were held back to
+        go out together."""
+        wfile = self.wfile
+        wfile.batch_size = 0
         try:
-            self.rfile = conn.makefile('rb', self.rbufsize)
-            self.wfile = conn.makefile('wb', self.wbufsize)
-        except (AttributeError, NotImplementedError):
-            if hasattr(conn, 'send') and hasattr(conn, 'recv'):
-                # it's an SSL.Connection
-                self.rfile = socket._fileobject(conn, "rb", self.rbufsize)
-                self.wfile = socket._fileobject(conn, "wb", self.wbufsize)
-            else:
-                # it's a SSLObject, or a martian
-                raise NotImplementedError("wsgi.py doesn't support sockets "\
-                                          "of type %s" % type(conn))
+            wfile.flush()
+        except socket.error, e:
+            if get_errno(e) not in BROKEN_SOCK:
+                raise
+            self.close_connection = 1
+
+    def resume(self):
+        """Carries on serving a connection that :meth:`Server.park` parked
+        while it waited for the next request."""
+        self.parked = False
+        try:
+            self.handle_one_request()
+            if not self.close_connection:
+                self.handle()
+        finally:
+            self.finish()
+
+    def request_buffered(self):
+        """Returns True if some of the next request has been received
+        already, so that there's no point in waiting for the socket to become
+        readable."""
+        pending = getattr(self.rfile, 'pending', None)
+        if pending is not None and pending():
+            return True
+        pending = getattr(self.connection, 'pending', None)
+        return bool(pending is not None and pending())
 
     def handle_one_request(self):
         if self.server.max_http_version:
@@ -170,20 +569,33 @@ class HttpProtocol(BaseHTTPServer.BaseHTTPRequestHandler):
             self.close_connection = 1
             return
 
+        idle = None
+        if self.requests_served and self.server.keepalive_timeout is not None:
+            # only costs a timer if the read blocks
+            idle = timeout.Timeout(self.server.keepalive_timeout, lazy=True)
         try:
-            self.raw_requestline = self.rfile.readline(MAX_REQUEST_LINE)
-            if len(self.raw_requestline) == MAX_REQUEST_LINE:
-                self.wfile.write(
-                    "HTTP/1.0 414 Request URI Too Long\r\n"
-                    "Connection: close\r\nContent-length: 0\r\n\r\n")
-                self.close_connection = 1
-                return
-        except greenio.SSL.ZeroReturnError:
-            self.raw_requestline = ''
-        except socket.error, e:
-            if get_errno(e) not in BAD_SOCK:
-                raise
-            self.raw_requestline = ''
+            try:
+                self.raw_requestline = self.rfile.readline(MAX_REQUEST_LINE)
+                if len(self.raw_requestline) == MAX_REQUEST_LINE:
+                    self.wfile.write(
+                        "HTTP/1.0 414 Request URI Too Long\r\n"
+                        "Connection: close\r\nContent-length: 0\r\n\r\n")
+                    self.close_connection = 1
+                    return
+            except greenio.SSL.ZeroReturnError:
+                self.raw_requestline = ''
+            except socket.error, e:
+                if get_errno(e) not in BAD_SOCK:
+                    raise
+                self.raw_requestline = ''
+            except timeout.Timeout, t:
+                if t is not idle:
+                    raise
+                # the connection sat idle for too long
+                self.raw_requestline = ''
+        finally:
+            if idle is not None:
+                idle.cancel()
 
         if not self.raw_requestline:
             self.close_connection = 1
@@ -191,6 +603,7 @@ class HttpProtocol(BaseHTTPServer.BaseHTTPRequestHandler):
 
         if not self.parse_request():
             return
+        self.requests_served += 1
 
         content_length = self.headers.getheader('content-length')
         if content_length:
@@ -203,6 +616,14 @@ class HttpProtocol(BaseHTTPServer.BaseHTTPRequestHandler):
                 self.close_connection = 1
                 return
 
+        # if the client has pipelined another request after this one, hold
+        # this response back to send it together with the next one; but not
+        # if reading this request's body might wait on the client
+        if (self.pipeline_batch_size and not content_length
+            and 'transfer-encoding' not in self.headers
+            and self.request_buffered()):
+            self.wfile.batch_size = self.pipeline_batch_size
+
         self.environ = self.get_environ()
         self.application = self.server.app
         try:
@@ -234,18 +655,23 @@ class HttpProtocol(BaseHTTPServer.BaseHTTPRequestHandler):
             elif not headers_sent:
                 status, response_headers = headers_set
                 headers_sent.append(1)
-                header_list = [header[0].lower() for header in response_headers]
+                # start_response() capitalized the names already
+                header_list = [header[0] for header in response_headers]
                 towrite.append('%s %s\r\n' % (self.protocol_version, status))
                 for header in response_headers:
                     towrite.append('%s: %s\r\n' % header)
 
                 # send Date header?
-                if 'date' not in header_list:
-                    towrite.append('Date: %s\r\n' % (format_date_time(time.time()),))
+                if 'Date' not in header_list:
+                    towrite.append(date_header())
 
                 client_conn = self.headers.get('Connection', '').lower()
                 send_keep_alive = False
-                if self.server.keepalive and (client_conn == 'keep-alive' or \
+                max_requests = self.server.max_requests_per_connection
+                if self.server.keepalive and \
+                    (max_requests is None or
+                     self.requests_served < max_requests) and \
+                    (client_conn == 'keep-alive' or \
                     (self.request_version == 'HTTP/1.1' and
                      not client_conn == 'close')):
                         # only send keep-alives back to clients that sent them,
@@ -255,11 +681,11 @@ class HttpProtocol(BaseHTTPServer.BaseHTTPRequestHandler):
                 else:
                     self.close_connection = 1
 
-                if 'content-length' not in header_list:
+                if 'Content-Length' not in header_list:
                     if self.request_version == 'HTTP/1.1':
                         use_chunked[0] = True
                         towrite.append('Transfer-Encoding: chunked\r\n')
-                    elif 'content-length' not in header_list:
+                    elif 'Content-Length' not in header_list:
                         # client is 1.0 and therefore must read to EOF
                         self.close_connection = 1
 
@@ -302,8 +728,7 @@ class HttpProtocol(BaseHTTPServer.BaseHTTPRequestHandler):
                     # Avoid dangling circular ref
                     exc_info = None
 
-            capitalized_headers = [('-'.join([x.capitalize()
-                                              for x in key.split('-')]), value)
+            capitalized_headers = [(capitalize_header(key), value)
                                    for key, value in response_headers]
 
             headers_set[:] = [status, capitalized_headers]
@@ -318,6 +743,38 @@ class HttpProtocol(BaseHTTPServer.BaseHTTPRequestHandler):
                 if not headers_sent and hasattr(result, '__len__') and \
                         'Content-Length' not in [h for h, _v in headers_set[1]]:
                     headers_set[1].append(('Content-Length', str(sum(map(len, result)))))
+                if isinstance(result, FileWrapper) and not headers_sent and \
+                        headers_set and \
+                        isinstance(self.connection, greenio.GreenSocket):
+                    span = result.file_span()
+                else:
+                    span = None
+                if span is not None:
+                    offset, size = span
+                    for header, value in headers_set[1]:
+                        if header == 'Content-Length':
+                            try:
+                                declared = int(value)
+                            except ValueError:
+                                declared = -1
+                            if declared < 0:
+                                # a malformed length is the application's
+                                # business; send the file the usual way
+                                span = None
+                            else:
+                                size = min(size, declared)
+                            break
+                    else:
+                        headers_set[1].append(('Content-Length', str(size)))
+                if span is not None:
+                    # with the length known, this writes just the headers
+                    write('')
+                    wfile.flush()
+                    sent = self.connection.sendfile(result.filelike, offset, size)
+                    length[0] += sent
+                    if sent < size:
+                        self.close_connection = 1
+                    return
                 towrite = []
                 towrite_size = 0
                 just_written_size = 0
@@ -361,6 +818,9 @@ class HttpProtocol(BaseHTTPServer.BaseHTTPRequestHandler):
                 body_length=length[0],
                 wall_seconds=finish - start))
 
+    def log_date_time_string(self):
+        return log_date_time()
+
     def get_client_ip(self):
         client_ip = self.client_address[0]
         if self.server.log_x_forwarded_for:
@@ -381,29 +841,32 @@ class HttpProtocol(BaseHTTPServer.BaseHTTPRequestHandler):
         env['PATH_INFO'] = urllib.unquote(path)
         env['QUERY_STRING'] = query
 
-        if self.headers.typeheader is None:
-            env['CONTENT_TYPE'] = self.headers.type
-        else:
-            env['CONTENT_TYPE'] = self.headers.typeheader
+        headers = self.headers
+        env['CONTENT_TYPE'] = headers.getheader('content-type', 'text/plain')
 
-        length = self.headers.getheader('content-length')
+        length = headers.getheader('content-length')
         if length:
             env['CONTENT_LENGTH'] = length
         env['SERVER_PROTOCOL'] = 'HTTP/1.0'
 
-        host, port = self.request.getsockname()
+        if self.sockname is None:
+            self.sockname = self.request.getsockname()
+        host, port = self.sockname
         env['SERVER_NAME'] = host
         env['SERVER_PORT'] = str(port)
         env['REMOTE_ADDR'] = self.client_address[0]
         env['GATEWAY_INTERFACE'] = 'CGI/1.1'
 
-        for h in self.headers.headers:
-            k, v = h.split(':', 1)
-            k = k.replace('-', '_').upper()
-            v = v.strip()
+        if isinstance(headers, Headers):
+            fields = headers.fields
+        else:
+            # a mimetools.Message, from a subclass's own parse_request()
+            fields = [h.split(':', 1) for h in headers.headers]
+        for k, v in fields:
+            k, envk = _environ_key(k)
             if k in env:
                 continue
-            envk = 'HTTP_' + k
+            v = v.strip()
             if envk in env:
                 env[envk] += ',' + v
             else:
@@ -423,11 +886,237 @@ class HttpProtocol(BaseHTTPServer.BaseHTTPRequestHandler):
         return env
 
     def finish(self):
+        if self.parked:
+            # resume() finishes the connection once it's done with it
+            return
         BaseHTTPServer.BaseHTTPRequestHandler.finish(self)
         greenio.shutdown_safe(self.connection)
         self.connection.close()
 
 
+class ParkedConnection(object):
+    """ A kept-alive connection waiting for its next request, watched by a
+    hub listener instead of a greenthread of its own.  Its callbacks run in
+    the hub, so they must not block. """
+    __slots__ = ['server', 'proto', 'listener', 'timer']
+
+    def __init__(self, server, proto):
+        self.server = server
+        self.proto = proto
+        server.parked_connections.add(self)
+        hub = hubs.get_hub()
+        self.listener = hub.add(hub.READ, proto.connection.fileno(),
+                                self.readable)
+        if server.keepalive_timeout is None:
+            self.timer = None
+        else:
+            self.timer = hub.schedule_call_global(server.keepalive_timeout,
+                                                  self.expired)
+
+    def _unwatch(self):
+        self.server.parked_connections.discard(self)
+        hubs.get_hub().remove(self.listener)
+        if self.timer is not None:
+            self.timer.cancel()
+
+    def readable(self, fileno):
+        self._unwatch()
+        server = self.server
+        if server.pool.free() > 0:
+            server.spawn(self.proto.resume)
+        else:
+            # spawning into a full pool blocks until a slot frees up
+            greenthread.spawn_n(server.spawn, self.proto.resume)
+
+    def expired(self):
+        self._unwatch()
+        proto = self.proto
+        proto.parked = False
+        proto.close_connection = 1
+        # closing an SSL connection may have to write
+        greenthread.spawn_n(proto.finish)
+
+
+class AsyncLog(object):
+    """ File-like object to pass as the *log* of :func:`server`, which keeps
+    slow log files from holding up the hub.  Writes are buffered in memory
+    and written out in batches by a tpool thread; while one batch is being
+    written, the next one collects.
+
+    At most *max_buffered* bytes are held, counting the batch being written;
+    writes that don't fit are dropped and counted.  *log* is the file written
+    to, sys.stderr by default.  The batches are written by *executor*, a
+    :class:`~eventlet.tpool.Executor`, or by the default one if it's None.
+    """
+    def __init__(self, log=None, max_buffered=1048576, executor=None):
+        if log is None:
+            log = sys.stderr
+        self.log = log
+        self.max_buffered = max_buffered
+        self.executor = executor
+        self.records = []
+        self.buffered = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self._writer = None
+
+    def write(self, data):
+        if self.buffered + len(data) > self.max_buffered:
+            self.dropped += 1
+            return
+        self.records.append(data)
+        self.buffered += len(data)
+        if self._writer is None:
+            self._writer = greenthread.spawn(self._write_batches)
+
+    def _write_batches(self):
+        try:
+            while self.records:
+                records = self.records
+                self.records = []
+                batch = ''.join(records)
+                try:
+                    if self.executor is None:
+                        tpool.execute(self._write_batch, batch)
+                    else:
+                        self.executor.execute(self._write_batch, batch)
+                finally:
+                    self.buffered -= len(batch)
+                self.written += len(records)
+                self.batches += 1
+        finally:
+            self._writer = None
+
+    def _write_batch(self, batch):
+        # runs in a tpool thread
+        self.log.write(batch)
+        flush = getattr(self.log, 'flush', None)
+        if flush is not None:
+            flush()
+
+    def flush(self):
+        """ Waits until everything written so far is in the log."""
+        writer = self._writer
+        if writer is not None:
+            writer.wait()
+
+    def stats(self):
+        """ Returns a dict of the number of writes waiting to be written
+        ('pending'), the bytes held ('buffered'), the writes written
+        ('written'), the batches they were written in ('batches') and the
+        writes dropped because the buffer was full ('dropped')."""
+        return {'pending': len(self.records),
+                'buffered': self.buffered,
+                'written': self.written,
+                'batches': self.batches,
+                'dropped': self.dropped}
+
+
+SHED_RESPONSE = ("HTTP/1.1 503 Service Unavailable\r\n"
+                 "Connection: close\r\nContent-Length: 0\r\n\r\n")
+
+class AdmissionQueue(object):
+    """ Admission policy for :func:`server`.  Connections that are accepted
+    while the server's pool is full wait in a queue for room in the pool, for
+    at most *max_wait* seconds each (forever if it is None).  Up to
+    *max_queued* connections can wait; beyond that, and once their time is
+    up, connections are shed: they get a 503 Service Unavailable response
+    and are closed, without their requests being read.
+
+    Without an admission policy, the server stops accepting connections
+    while its pool is full, and they pile up in the listen backlog
+    instead. """
+    def __init__(self, max_queued=100, max_wait=None):
+        self.max_queued = max_queued
+        self.max_wait = max_wait
+        # [client, enqueued at, timer] for each waiting connection
+        self.waiting = collections.deque()
+        self.peak_queued = 0
+        self.admitted = 0
+        self.shed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def __len__(self):
+        return len(self.waiting)
+
+    def offer(self, client):
+        """ Queues the accepted *client* ``(socket, address)`` pair, or
+        sheds it if the queue is full. """
+        if len(self.waiting) >= self.max_queued:
+            self.reject(client)
+            return
+        # the clock the hub's timers go by, so that the waits reported agree
+        # with max_wait even when the system time is set
+        entry = [client, monotonic(), None]
+        if self.max_wait is not None:
+            entry[2] = hubs.get_hub().schedule_call_global(
+                self.max_wait, self._expire, entry)
+        self.waiting.append(entry)
+        if len(self.waiting) > self.peak_queued:
+            self.peak_queued = len(self.waiting)
+
+    def pop(self):
+        """ Returns the client that has waited longest, or None if none is
+        waiting. """
+        if not self.waiting:
+            return None
+        client, enqueued, timer = self.waiting.popleft()
+        if timer is not None:
+            timer.cancel()
+        waited = monotonic() - enqueued
+        self.admitted += 1
+        self.wait_total += waited
+        if waited > self.wait_max:
+            self.wait_max = waited
+        return client
+
+    def _expire(self, entry):
+        # runs in the hub
+        try:
+            self.waiting.remove(entry)
+        except ValueError:
+            return
+        self.reject(entry[0])
+
+    def reject(self, client):
+        """ Sheds *client*. """
+        self.shed += 1
+        # sending may block, and this may be running in the hub
+        greenthread.spawn_n(self._send_shed_response, client[0])
+
+    def _send_shed_response(self, sock):
+        try:
+            try:
+                sock.sendall(SHED_RESPONSE)
+                # take in what the client sent, if anything, so that closing
+                # doesn't reset the connection before the response is read
+                sock.fd.recv(65536)
+            except socket.error:
+                pass
+        finally:
+            greenio.shutdown_safe(sock)
+            sock.close()
+
+    def stats(self):
+        """Returns a dict with the number of connections waiting now
+        (``queued``) and at most (``peak_queued``), how many were served after
+        waiting (``admitted``) and how long they waited on average and at
+        most (``wait_average``, ``wait_max``, in seconds), and how many
+        connections were shed (``shed``)."""
+        if self.admitted:
+            average = self.wait_total / self.admitted
+        else:
+            average = 0.0
+        return {'queued': len(self.waiting),
+                'peak_queued': self.peak_queued,
+                'admitted': self.admitted,
+                'wait_average': average,
+                'wait_max': self.wait_max,
+                'shed': self.shed}
+
+
 class Server(BaseHTTPServer.HTTPServer):
     def __init__(self,
                  socket,
@@ -440,7 +1129,12 @@ class Server(BaseHTTPServer.HTTPServer):
                  minimum_chunk_size=None,
                  log_x_forwarded_for=True,
                  keepalive=True,
-                 log_format=DEFAULT_LOG_FORMAT):
+                 log_format=DEFAULT_LOG_FORMAT,
+                 keepalive_timeout=None,
+                 max_requests_per_connection=None,
+                 pool=None,
+                 admission=None,
+                 park_idle=False):
 
         self.outstanding_requests = 0
         self.socket = socket
@@ -459,6 +1153,13 @@ class Server(BaseHTTPServer.HTTPServer):
             protocol.minimum_chunk_size = minimum_chunk_size
         self.log_x_forwarded_for = log_x_forwarded_for
         self.log_format = log_format
+        self.keepalive_timeout = keepalive_timeout
+        self.max_requests_per_connection = max_requests_per_connection
+        self.pool = pool
+        self.admission = admission
+        self.park_idle = park_idle
+        # the ParkedConnections waiting for their next request
+        self.parked_connections = set()
 
     def get_environ(self):
         d = {
@@ -468,14 +1169,74 @@ class Server(BaseHTTPServer.HTTPServer):
             'wsgi.multiprocess': False,
             'wsgi.run_once': False,
             'wsgi.url_scheme': 'http',
+            'wsgi.file_wrapper': FileWrapper,
         }
         if self.environ is not None:
             d.update(self.environ)
         return d
 
     def process_request(self, (socket, address)):
-        proto = self.protocol(socket, address, self)
-        proto.handle()
+        # handles the connection's requests, or parks it after the first
+        self.protocol(socket, address, self)
+
+    def spawn(self, func, *args):
+        """Runs *func* in the pool.  With an admission policy, the
+        greenthread goes on to serve the connections waiting for room in the
+        pool once *func* is done."""
+        if self.admission is None:
+            self.pool.spawn_n(func, *args)
+        else:
+            self.pool.spawn_n(self._serve_admitted, func, args)
+
+    def _serve_admitted(self, func, args):
+        while True:
+            try:
+                func(*args)
+            except Exception:
+                if greenpool.DEBUG:
+                    traceback.print_exc()
+            client = self.admission.pop()
+            if client is None:
+                return
+            func, args = self.process_request, (client,)
+
+    def admit(self, client):
+        """Serves the newly accepted *client* ``(socket, address)`` pair if
+        there's room in the pool, and otherwise leaves it to the admission
+        policy.  Doesn't block."""
+        admission = self.admission
+        pool = self.pool
+        # connections that waited go first, should room have opened up in a
+        # way that _serve_admitted() didn't notice
+        while admission.waiting and pool.free() > 0:
+            self.spawn(self.process_request, admission.pop())
+        if pool.free() > 0:
+            self.spawn(self.process_request, client)
+        else:
+            admission.offer(client)
+
+    def park(self, proto):
+        """Has the hub watch the kept-alive connection of *proto* for its
+        next request, so that idle connections take up neither a greenthread
+        nor room in the pool meant for requests being served.
+        :meth:`HttpProtocol.resume` is spawned in the pool once the request
+        arrives, and the connection is closed if nothing arrives within
+        :attr:`keepalive_timeout`.  Returns False if the connection isn't
+        parked, because :attr:`park_idle` is off or the pool lacks the
+        ``spawn_n`` and ``free`` methods of a GreenPool, in which case the
+        connection's greenthread waits for the request itself."""
+        pool = self.pool
+        if not (self.park_idle and hasattr(pool, 'spawn_n') and
+                hasattr(pool, 'free')):
+            return False
+        ParkedConnection(self, proto)
+        return True
+
+    def close_idle(self):
+        """Closes the kept-alive connections that are parked waiting for
+        their next request."""
+        for parked in list(self.parked_connections):
+            parked.expired()
 
     def log_message(self, message):
         self.log.write(message + '\n')
@@ -500,7 +1261,11 @@ def server(sock, site,
            log_x_forwarded_for=True,
            custom_pool=None,
            keepalive=True,
-           log_format=DEFAULT_LOG_FORMAT):
+           log_format=DEFAULT_LOG_FORMAT,
+           keepalive_timeout=None,
+           max_requests_per_connection=None,
+           admission=None,
+           park_idle=False):
     """  Start up a wsgi server handling requests from the supplied server
     socket.  This function loops forever.  The *sock* object will be closed after server exits,
     but the underlying file descriptor will remain open, so if you have a dup() of *sock*,
@@ -508,9 +1273,9 @@ def server(sock, site,
 
     :param sock: Server socket, must be already bound to a port and listening.
     :param site: WSGI application function.
-    :param log: File-like object that logs should be written to.  If not specified, sys.stderr is used.
+    :param log: File-like object that logs should be written to.  If not specified, sys.stderr is used.  Wrap it in an :class:`AsyncLog` if writing to it may block.
     :param environ: Additional parameters that go into the environ dictionary of every request.
-    :param max_size: Maximum number of client connections opened at any time by this server.
+    :param max_size: Maximum number of client connections served at any time by this server.  Kept-alive connections waiting for their next request don't count.
     :param max_http_version: Set to "HTTP/1.0" to make the server pretend it only supports HTTP 1.0.  This can help with applications or clients that don't behave properly using HTTP 1.1.
     :param protocol: Protocol class.  Deprecated.
     :param server_event: Used to collect the Server object.  Deprecated.
@@ -518,6 +1283,10 @@ def server(sock, site,
     :param log_x_forwarded_for: If True (the default), logs the contents of the x-forwarded-for header in addition to the actual client ip address in the 'client_ip' field of the log line.
     :param custom_pool: A custom GreenPool instance which is used to spawn client green threads.  If this is supplied, max_size is ignored.
     :param keepalive: If set to False, disables keepalives on the server; all connections will be closed after serving one request.
+    :param keepalive_timeout: Number of seconds a kept-alive connection may sit idle between requests before it is closed.  If None (the default), it may sit idle forever.  Idle connections don't count against *max_size*, which only limits the requests being served.
+    :param max_requests_per_connection: Number of requests served on a connection before it is closed.  If None (the default), there is no limit.
+    :param park_idle: If True, kept-alive connections waiting for their next request are watched by the hub rather than each holding a greenthread, which saves memory when there are many of them.  Off by default, so that each connection keeps a greenthread for its whole life, as in earlier versions.
+    :param admission: An :class:`AdmissionQueue`, which decides what happens to connections that arrive while the pool is full, and keeps statistics about them.  If None (the default), the server waits for room in the pool before it accepts another connection.
     :param log_format: A python format string that is used as the template to generate log lines.  The following values can be formatted into it: client_ip, date_time, request_line, status_code, body_length, wall_seconds.  Look the default for an example of how to use this.
     """
     serv = Server(sock, sock.getsockname(),
@@ -528,7 +1297,11 @@ def server(sock, site,
                   minimum_chunk_size=minimum_chunk_size,
                   log_x_forwarded_for=log_x_forwarded_for,
                   keepalive=keepalive,
-                  log_format=log_format)
+                  log_format=log_format,
+                  keepalive_timeout=keepalive_timeout,
+                  max_requests_per_connection=max_requests_per_connection,
+                  admission=admission,
+                  park_idle=park_idle)
     if server_event is not None:
         server_event.send(serv)
     if max_size is None:
@@ -537,6 +1310,7 @@ def server(sock, site,
         pool = custom_pool
     else:
         pool = greenpool.GreenPool(max_size)
+    serv.pool = pool
     try:
         host, port = sock.getsockname()
         port = ':%s' % (port, )
@@ -554,6 +1328,9 @@ def server(sock, site,
         while True:
             try:
                 client_socket = sock.accept()
+                if admission is not None:
+                    serv.admit(client_socket)
+                    continue
                 try:
                     pool.spawn_n(serv.process_request, client_socket)
                 except AttributeError:
@@ -579,3 +1356,213 @@ def server(sock, site,
         except socket.error, e:
             if get_errno(e) not in BROKEN_SOCK:
                 traceback.print_exc()
+
+
+def _cpu_count():
+    try:
+        return os.sysconf('SC_NPROCESSORS_ONLN')
+    except (AttributeError, ValueError, OSError):
+        return 1
+
+
+def _reuse_port_socket(addr, family):
+    """Returns a socket bound to *addr* with SO_REUSEPORT set, or None if
+    the system doesn't support that option."""
+    option = getattr(socket, 'SO_REUSEPORT', None)
+    if option is None:
+        # missing from the socket module of older Pythons; 15 is its value
+        # on Linux, and elsewhere there's no telling
+        if not sys.platform.startswith('linux'):
+            return None
+        option = 15
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, option, 1)
+    except socket.error, e:
+        # Linux only has it since 3.9
+        if get_errno(e) != errno.ENOPROTOOPT:
+            raise
+        sock.close()
+        return None
+    sock.bind(addr)
+    return sock
+
+
+def _serve_worker(sock, site, addr, family, backlog, drain_timeout, kwargs,
+                  stopping):
+    """Runs in a forked worker process: serves on *sock* until a signal is
+    appended to *stopping*, then stops accepting, closes its idle
+    connections and waits up to *drain_timeout* seconds for the requests in
+    progress to finish."""
+    # the hub inherited from the parent shares its file descriptors; give
+    # this process one of its own, and close the inherited ones
+    inherited = hubs.get_hub()
+    hubs.use_hub(type(inherited))
+    inherited.close()
+    if sock is None:
+        sock = _reuse_port_socket(addr, family)
+        sock.listen(backlog)
+    started = event.Event()
+    server_gt = greenthread.spawn(server, sock, site,
+                                  server_event=started, **kwargs)
+    serv = started.wait()
+    while not stopping and not server_gt.dead:
+        greenthread.sleep(0.1)
+    if server_gt.dead:
+        # the server failed; let the parent start another worker
+        return 1
+    greenthread.kill(server_gt, SystemExit)
+    # the requests in progress are the last on their connections, and the
+    # connections waiting for another request get none
+    serv.keepalive = False
+    serv.close_idle()
+    deadline = time.time() + drain_timeout
+    while serv.outstanding_requests and time.time() < deadline:
+        greenthread.sleep(0.05)
+    flush = getattr(serv.log, 'flush', None)
+    if flush is not None:
+        flush()
+    return 0
+
+
+def serve_multi(addr, site, workers=None, reuse_port=False,
+                family=socket.AF_INET, backlog=50, drain_timeout=30,
+                **kwargs):
+    """Serves *site* from *workers* forked processes, each running its own
+    hub and :func:`server`, and supervises them until it gets SIGTERM or
+    SIGINT.  This function blocks; call it from the main thread of a process
+    that hasn't yet started a tpool or any greenthreads of its own.
+
+    A worker that dies is replaced by a new one.  On SIGTERM or SIGINT the
+    workers stop accepting connections, close the kept-alive connections
+    that are waiting for another request, finish the requests in progress
+    and exit, and then this function returns.  On SIGHUP the workers are
+    replaced the same way, without closing the listening socket, which makes
+    for a graceful restart.
+
+    :param addr: Address to listen on, a (host, port) tuple.
+    :param site: WSGI application function.
+    :param workers: Number of worker processes.  Defaults to the number of CPUs.
+    :param reuse_port: If True, every worker listens on a socket of its own bound with SO_REUSEPORT, and the kernel spreads the connections evenly over them.  If False (the default), or if the system has no SO_REUSEPORT, the workers accept from one socket opened before forking.
+    :param family: Socket family.
+    :param backlog: The maximum number of queued connections of each listening socket.
+    :param drain_timeout: Number of seconds a stopping worker waits for its requests in progress (see :attr:`Server.outstanding_requests`) before it exits anyway.
+    :param kwargs: Passed on to :func:`server` in each worker.
+    """
+    import signal
+    os_ = patcher.original('os')
+    time_ = patcher.original('time')
+    if workers is None:
+        workers = _cpu_count()
+    reserved = None
+    if reuse_port:
+        # bound but not listening, so that it takes no connections, just
+        # reserves the port for the workers' sockets
+        reserved = _reuse_port_socket(addr, family)
+    if reserved is not None:
+        sock = None
+        addr = reserved.getsockname()
+    else:
+        reserved = sock = convenience.listen(addr, family, backlog)
+
+    children = {}
+    retiring = set()
+    signals = []
+    # the handler is installed before forking, so that the workers have it
+    # from the start; in a worker, it notes the signals in its own list,
+    # which stays empty in the supervisor
+    supervisor = os_.getpid()
+    worker_signals = []
+    def note(signum, frame):
+        # only note the signal; waking the hub isn't safe in a signal handler
+        if os_.getpid() == supervisor:
+            signals.append(signum)
+        else:
+            worker_signals.append(signum)
+    old_handlers = {}
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        old_handlers[signum] = signal.signal(signum, note)
+
+    def start_worker():
+        pid = os_.fork()
+        if pid == 0:
+            status = 1
+            try:
+                try:
+                    status = _serve_worker(sock, site, addr, family, backlog,
+                                           drain_timeout, kwargs,
+                                           worker_signals)
+                except:
+                    traceback.print_exc()
+            finally:
+                try:
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+                finally:
+                    os_._exit(status)
+        children[pid] = time_.time()
+
+    def stop_workers(pids):
+        for pid in pids:
+            try:
+                os_.kill(pid, signal.SIGTERM)
+            except OSError, e:
+                if get_errno(e) != errno.ESRCH:
+                    raise
+
+    def reap():
+        # collects the workers that have exited, without blocking
+        dead = []
+        while children:
+            try:
+                pid, status = os_.waitpid(-1, os_.WNOHANG)
+            except OSError, e:
+                if get_errno(e) == errno.EINTR:
+                    continue
+                if get_errno(e) != errno.ECHILD:
+                    raise
+                pid = 0
+            if not pid:
+                break
+            started = children.pop(pid, None)
+            if started is not None:
+                dead.append((pid, started))
+        return dead
+
+    try:
+        for i in xrange(workers):
+            start_worker()
+        while True:
+            while signals:
+                signum = signals.pop(0)
+                if signum != signal.SIGHUP:
+                    stop_workers(children.keys())
+                    deadline = time_.time() + drain_timeout + 5
+                    while children and time_.time() < deadline:
+                        reap()
+                        time_.sleep(0.05)
+                    for pid in children.keys():
+                        os_.kill(pid, signal.SIGKILL)
+                        os_.waitpid(pid, 0)
+                    return
+                replaced = [pid for pid in children if pid not in retiring]
+                stop_workers(replaced)
+                retiring.update(replaced)
+                for i in xrange(workers):
+                    start_worker()
+            for pid, started in reap():
+                if pid in retiring:
+                    retiring.discard(pid)
+                    continue
+                if time_.time() - started < 1:
+                    # don't spin on a worker that dies as soon as it starts
+                    time_.sleep(1)
+                start_worker()
+            # polled rather than waited for with os.wait(), so that a signal
+            # arriving just before the wait isn't missed
+            time_.sleep(0.1)
+    finally:
+        for signum, handler in old_handlers.items():
+            signal.signal(signum, handler)
+        reserved.close()
@@ -458,6 +458,48 @@ class TpoolConnectionPool(DBConnectionPool):
         from eventlet import tpool
         tpool.killall()
 
+    @skip_with_pyevent
+    def test_executor(self):
+        from eventlet import tpool
+        executor = tpool.Executor('db', size=2)
+        pool = db_pool.TpooledConnectionPool(self._dbmodule,
+            min_size=0, max_size=1, connect_timeout=0.5,
+            executor=executor, **self._auth)
+        try:
+            conn = pool.get()
+            before = executor.stats()['executed']
+            cursor = conn.cursor()
+            cursor.execute("select 1")
+            self.assertEqual(cursor.fetchone()[0], 1)
+            self.assert_(executor.stats()['executed'] > before)
+            pool.put(conn)
+        finally:
+            pool.clear()
+            executor.killall()
+
+
+
+class TestTpooledConnect(TestCase):
+    def tearDown(self):
+        from eventlet import tpool
+        tpool.killall()
+
+    @skip_with_pyevent
+    def test_late_connection_closed(self):
+        import time
+        closed = []
+        class Connection(object):
+            def close(self):
+                closed.append(self)
+        class SlowModule(object):
+            def connect(self, *args, **kw):
+                time.sleep(0.2)
+                return Connection()
+        self.assertRaises(db_pool.ConnectTimeout,
+                          db_pool.TpooledConnectionPool.connect,
+                          SlowModule(), 0.1)
+        eventlet.sleep(0.2)
+        self.assertEqual(len(closed), 1)
 
 
 class RawConnectionPool(DBConnectionPool):
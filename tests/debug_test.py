@@ -1,8 +1,9 @@
 import sys
+import time
 
 import eventlet
 from eventlet import debug
-from tests import LimitedTestCase, main
+from tests import LimitedTestCase, main, skip_if, using_pyevent
 from unittest import TestCase
 
 try:
@@ -129,6 +130,76 @@ class TestDebug(LimitedTestCase):
         # look for the KeyError exception in the traceback
         self.assert_('KeyError: 1' in fake.getvalue(), 
             "Traceback not in:\n" + fake.getvalue())
-        
+
+
+def _stalls_unseen(_f):
+    # these hubs look idle to a stall detector all the time
+    from eventlet import hubs
+    return bool(using_pyevent(_f) or
+                getattr(hubs.get_hub(), 'uses_twisted_reactor', None))
+
+class TestStallDetection(LimitedTestCase):
+    def tearDown(self):
+        debug.hub_stall_detection(False)
+        super(TestStallDetection, self).tearDown()
+
+    def busy(self, seconds):
+        end = time.time() + seconds
+        while time.time() < end:
+            pass
+
+    @skip_if(_stalls_unseen)
+    def test_records_hog(self):
+        detector = debug.hub_stall_detection(True, threshold=0.05,
+                                             spawn_sites=True)
+        gt = eventlet.spawn(self.busy, 0.2)
+        gt.wait()
+        # the watchdog notices the end of the stall on its next round
+        for i in xrange(20):
+            if detector.count:
+                break
+            eventlet.sleep(0.02)
+        self.assertEquals(detector.count, 1)
+        stall = detector.stalls[-1]
+        self.assert_(0.1 < stall['duration'] < 0.6, stall['duration'])
+        self.assert_('GreenThread' in stall['greenlet'], stall['greenlet'])
+        self.assert_('busy' in [entry[2] for entry in stall['stack']],
+                     stall['stack'])
+        self.assert_('test_records_hog' in
+                     [entry[2] for entry in stall['spawn_site']],
+                     stall['spawn_site'])
+        self.assertEquals(sum(detector.histogram.values()), 1)
+        output = debug.format_hub_stalls()
+        self.assert_('STALLS: 1' in output, output)
+        self.assert_('spawned at:' in output, output)
+
+    def test_idle_hub_is_not_a_stall(self):
+        detector = debug.hub_stall_detection(True, threshold=0.05)
+        eventlet.sleep(0.1)
+        for i in xrange(10):
+            self.busy(0.005)
+            eventlet.sleep(0)
+        self.assertEquals(detector.count, 0)
+        self.assertEquals(len(detector.stalls), 0)
+
+    def test_many_short_greenthreads_are_not_a_stall(self):
+        detector = debug.hub_stall_detection(True, threshold=0.05)
+        # they all run in one iteration of the hub, and none of them yields
+        pool = eventlet.GreenPool()
+        for i in xrange(20):
+            pool.spawn(self.busy, 0.01)
+        pool.waitall()
+        eventlet.sleep(0.05)
+        self.assertEquals(detector.count, 0)
+        self.assertEquals(len(detector.stalls), 0)
+
+    def test_off(self):
+        detector = debug.hub_stall_detection(True, threshold=0.05)
+        debug.hub_stall_detection(False)
+        self.assert_(detector.thread is None)
+        self.assert_(eventlet.hubs.get_hub().stall_detector is None)
+        self.assert_('off' in debug.format_hub_stalls())
+
+
 if __name__ == "__main__":
     main()
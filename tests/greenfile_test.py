@@ -0,0 +1,123 @@
+import os
+import shutil
+import tempfile
+import time
+
+from tests import skip_with_pyevent, LimitedTestCase, main
+
+import eventlet
+from eventlet import greenfile
+from eventlet import tpool
+
+
+class TestGreenFile(LimitedTestCase):
+    def setUp(self):
+        super(TestGreenFile, self).setUp()
+        self.tempdir = tempfile.mkdtemp('_greenfile_test')
+        self.path = os.path.join(self.tempdir, 'test')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        tpool.killall()
+        super(TestGreenFile, self).tearDown()
+
+    def write_lines(self, count):
+        lines = ['line %d %s\n' % (i, 'x' * (i % 50)) for i in range(count)]
+        f = open(self.path, 'w')
+        f.write(''.join(lines))
+        f.close()
+        return lines
+
+    @skip_with_pyevent
+    def test_lines(self):
+        lines = self.write_lines(1000)
+        f = greenfile.open(self.path, bufsize=1000)
+        self.assertEqual(list(f), lines)
+        f.seek(0)
+        self.assertEqual(f.readline(), lines[0])
+        self.assertEqual(f.readline(3), lines[1][:3])
+        self.assertEqual(f.readline(), lines[1][3:])
+        self.assertEqual(f.readlines(1), [lines[2]])
+        self.assertEqual(f.readlines(), lines[3:])
+        self.assertEqual(f.readline(), '')
+        # iteration and the other read methods can be mixed
+        f.seek(0)
+        it = iter(f)
+        self.assertEqual(it.next(), lines[0])
+        self.assertEqual(f.readline(), lines[1])
+        self.assertEqual(it.next(), lines[2])
+        self.assertEqual(f.read(3), lines[3][:3])
+        self.assertEqual(list(it), [lines[3][3:]] + lines[4:])
+        f.close()
+        self.assert_(f.closed)
+        self.assertRaises(ValueError, f.readline)
+
+    @skip_with_pyevent
+    def test_readahead(self):
+        lines = self.write_lines(1000)
+        data = ''.join(lines)
+        f = greenfile.open(self.path)
+        before = tpool.stats()['executed']
+        self.assertEqual(list(f), lines)
+        # one read for the whole file, and one to find its end
+        self.assertEqual(tpool.stats()['executed'] - before, 2)
+        f.seek(10)
+        self.assertEqual(f.read(5), data[10:15])
+        self.assertEqual(f.tell(), 15)
+        f.seek(5, 1)
+        self.assertEqual(f.read(5), data[20:25])
+        self.assertEqual(f.read(), data[25:])
+        self.assertEqual(f.read(5), '')
+        f.close()
+
+    @skip_with_pyevent
+    def test_write(self):
+        f = greenfile.open(self.path, 'w+', bufsize=100)
+        f.write('hello ')
+        f.writelines(['green ', 'world\n'])
+        self.assertEqual(f.tell(), 18)
+        # buffered until the writes add up to bufsize
+        self.assertEqual(open(self.path).read(), '')
+        f.fsync()
+        self.assertEqual(open(self.path).read(), 'hello green world\n')
+        f.seek(0)
+        self.assertEqual(f.read(6), 'hello ')
+        # writes go where the reader is, not after the data read ahead
+        f.write('GREEN')
+        f.seek(0)
+        self.assertEqual(f.read(), 'hello GREEN world\n')
+        # like a builtin file's, the position stays where it was
+        f.truncate(5)
+        f.write('!' * 100)
+        self.assertEqual(open(self.path).read(), 'hello' + '\0' * 13 +
+                         '!' * 100)
+        f.close()
+
+    @skip_with_pyevent
+    def test_open_errors(self):
+        self.assertRaises(IOError, greenfile.open,
+                          os.path.join(self.tempdir, 'missing'))
+
+    @skip_with_pyevent
+    def test_doesnt_block_hub(self):
+        class SlowFile(object):
+            closed = False
+            def read(self, size=-1):
+                time.sleep(0.1)
+                return ''
+        f = greenfile.open(self.path, 'w')
+        f.close()
+        f._file = SlowFile()
+        ticks = []
+        def tick():
+            for i in range(5):
+                ticks.append(i)
+                eventlet.sleep(0.01)
+        gt = eventlet.spawn(tick)
+        self.assertEqual(f.read(10), '')
+        self.assert_(len(ticks) >= 3, ticks)
+        gt.wait()
+
+
+if __name__ == '__main__':
+    main()
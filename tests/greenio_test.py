@@ -393,6 +393,163 @@ class TestGreenIo(LimitedTestCase):
         for bytes in (1000, 10000, 100000, 1000000):
             test_sendall_impl(bytes)
 
+    def test_sendall_partial_writes(self):
+        # every partial write must resume at the right offset
+        payload = ''.join(chr(i % 251) for i in xrange(256 * 1024))
+        listener = eventlet.listen(('127.0.0.1', 0))
+        def sender():
+            sock, addr = listener.accept()
+            bufsized(sock, size=4096)
+            sock.sendall(payload)
+            sock.sendall(buffer(payload, 1000, 1000))
+            sock.close()
+        sender_coro = eventlet.spawn(sender)
+        client = eventlet.connect(listener.getsockname())
+        received = []
+        while True:
+            data = client.recv(3000)
+            if not data:
+                break
+            received.append(data)
+            eventlet.sleep(0)
+        sender_coro.wait()
+        client.close()
+        self.assertEquals(''.join(received), payload + payload[1000:2000])
+
+    def test_sendfile(self):
+        import tempfile
+        from StringIO import StringIO
+        contents = ''.join(chr(i % 251) for i in xrange(200000))
+        f = tempfile.TemporaryFile()
+        f.write(contents)
+        f.flush()
+        listener = eventlet.listen(('127.0.0.1', 0))
+        def sender():
+            sock, addr = listener.accept()
+            bufsized(sock, size=4096)
+            sent = [sock.sendfile(f),
+                    sock.sendfile(f, 10, 100),
+                    sock.sendfile(StringIO(contents), 5, 10)]
+            self.assertEquals(f.tell(), 110)
+            sock.close()
+            return sent
+        sender_coro = eventlet.spawn(sender)
+        client = eventlet.connect(listener.getsockname())
+        received = []
+        while True:
+            data = client.recv(8192)
+            if not data:
+                break
+            received.append(data)
+        self.assertEquals(sender_coro.wait(), [len(contents), 100, 10])
+        self.assertEquals(''.join(received),
+                          contents + contents[10:110] + contents[5:15])
+        client.close()
+        f.close()
+
+    def test_unsent_tail(self):
+        data = 'abcdef'
+        tail = greenio.unsent_tail(data, 2)
+        self.assert_(isinstance(tail, buffer))
+        self.assertEquals(str(tail), 'cdef')
+        self.assertEquals(str(greenio.unsent_tail(buffer(data, 1), 2)), 'def')
+        self.assertEquals(greenio.unsent_tail(u'abc', 1), u'bc')
+
+    def test_socket_file(self):
+        listener = eventlet.listen(('127.0.0.1', 0))
+        client = eventlet.connect(listener.getsockname())
+        server, addr = listener.accept()
+        sent = []
+        orig_sendall = server.sendall
+        def sendall(data):
+            sent.append(data)
+            return orig_sendall(data)
+        server.sendall = sendall
+        wfile = greenio.GreenSocketFile(server, 'wb')
+        wfile.write('first line\r\n')
+        wfile.writelines(['second', ' line\n', '', 'x' * 20000])
+        self.assertEquals(len(sent), 1)
+        wfile.write('\nlast')
+        self.assertEquals(len(sent), 1)
+        wfile.flush()
+        self.assertEquals(len(sent), 2)
+        wfile.close()
+        # closing the file leaves the socket open
+        server.sendall('!')
+        server.close()
+
+        rfile = greenio.GreenSocketFile(client, 'rb', 16)
+        self.assertEquals(rfile.fileno(), client.fileno())
+        self.assertEquals(rfile.readline(), 'first line\r\n')
+        self.assertEquals(rfile.readline(4), 'seco')
+        self.assertEquals(rfile.readline(), 'nd line\n')
+        self.assertEquals(rfile.read(3), 'xxx')
+        self.assertEquals(rfile.readline(), 'x' * 19997 + '\n')
+        self.assertEquals(list(rfile), ['last!'])
+        self.assertEquals(rfile.read(), '')
+        self.assertEquals(rfile.readline(), '')
+        rfile.close()
+        self.assert_(rfile.closed)
+        client.close()
+        listener.close()
+
+    def test_socket_file_coalesce(self):
+        listener = eventlet.listen(('127.0.0.1', 0))
+        client = eventlet.connect(listener.getsockname())
+        server, addr = listener.accept()
+        wfile = greenio.GreenSocketFile(server, 'wb', 0)
+        wfile.coalesce_size = 100
+        wfile.write('a')
+        wfile.writelines(['b', 'c'])
+        self.assertEquals(wfile.sends, 0)
+        # yielding to the hub sends what was written
+        eventlet.sleep(0)
+        self.assertEquals(wfile.sends, 1)
+        self.assertEquals(client.recv(10), 'abc')
+        wfile.write('x' * 60)
+        wfile.write('y' * 60)
+        self.assertEquals(wfile.sends, 2)
+        wfile.write('z')
+        wfile.close()
+        self.assertEquals(wfile.sends, 3)
+        server.close()
+        rfile = greenio.GreenSocketFile(client, 'rb')
+        self.assertEquals(rfile.read(), 'x' * 60 + 'y' * 60 + 'z')
+
+    def test_socket_file_readheaders(self):
+        class Chunks(object):
+            def __init__(self, chunks):
+                self.chunks = list(chunks)
+            def recv(self, size):
+                if self.chunks:
+                    return self.chunks.pop(0)
+                return ''
+        # the blank line arrives split across reads
+        rfile = greenio.GreenSocketFile(
+            Chunks(['A: 1\r\nB: 2\r', '\n\r', '\nbody']), 'rb')
+        self.assertEquals(rfile.readheaders(), 'A: 1\r\nB: 2\r\n\r\n')
+        self.assertEquals(rfile.read(), 'body')
+        rfile = greenio.GreenSocketFile(Chunks(['\r\n', 'next\n\n']), 'rb')
+        self.assertEquals(rfile.readheaders(), '\r\n')
+        self.assertEquals(rfile.readheaders(), 'next\n\n')
+        rfile = greenio.GreenSocketFile(Chunks(['A: 1\r\n', 'B: 2']), 'rb')
+        self.assertEquals(rfile.readheaders(8), 'A: 1\r\nB:')
+        self.assertEquals(rfile.readheaders(), ' 2')
+
+    def test_socket_file_unbuffered(self):
+        listener = eventlet.listen(('127.0.0.1', 0))
+        client = eventlet.connect(listener.getsockname())
+        server, addr = listener.accept()
+        wfile = greenio.GreenSocketFile(server, 'wb', 0)
+        wfile.write('line one\nline two\nrest')
+        rfile = greenio.GreenSocketFile(client, 'rb', 0)
+        self.assertEquals(rfile.readline(), 'line one\n')
+        # nothing past the line was taken off the socket
+        self.assertEquals(client.recv(100), 'line two\nrest')
+        server.close()
+        client.close()
+        listener.close()
+
     def test_wrap_socket(self):
         try:
             import ssl
@@ -1,5 +1,9 @@
-from tests import LimitedTestCase, main
+from nose.plugins.skip import SkipTest
+from tests import LimitedTestCase, main, skip_unless, using_pyevent
+import os
 import time
+import eventlet
+import eventlet.event
 from eventlet import api
 from eventlet import hubs
 from eventlet.green import socket
@@ -30,7 +34,352 @@ class TestScheduleCall(LimitedTestCase):
             api.sleep(DELAY)
         self.assertEquals(lst, [1,2,3])
 
+    def test_not_early_after_busy_callback(self):
+        # the reading cached at the start of the iteration is stale by the
+        # time a callback that ran for a while schedules a timer
+        hub = hubs.get_hub()
+        api.sleep(0)
+        self.assertEquals(hub.now(), hub.now())
+        time.sleep(0.05)
+        self.assert_(hub.now(exact=True) - hub.now() >= 0.05)
+        start = time.time()
+        api.sleep(0.02)
+        self.assert_(time.time() - start >= 0.02, time.time() - start)
+
         
+class TestCallSoon(LimitedTestCase):
+    def test_ordering(self):
+        lst = []
+        hub = hubs.get_hub()
+        for i in xrange(5):
+            hub.call_soon(lst.append, i)
+        api.sleep(0)
+        self.assertEquals(lst, range(5))
+
+    def test_cancel(self):
+        lst = []
+        hub = hubs.get_hub()
+        t = hub.call_soon(lst.append, 1)
+        hub.call_soon(lst.append, 2)
+        t.cancel()
+        api.sleep(0)
+        self.assertEquals(lst, [2])
+
+    def test_skips_timers(self):
+        hub = hubs.get_hub()
+        hub.prepare_timers()
+        timers = len(hub.timers) + len(hub.next_timers)
+        ready = len(hub.ready)
+        lst = []
+        hub.call_soon(lst.append, 1)
+        self.assertEquals(len(hub.timers) + len(hub.next_timers), timers)
+        self.assertEquals(len(hub.ready), ready + 1)
+        api.sleep(0)
+        self.assertEquals(lst, [1])
+
+    def test_reschedule_waits(self):
+        # a callback that reschedules itself must not starve other callbacks
+        hub = hubs.get_hub()
+        lst = []
+        def again(n):
+            lst.append(n)
+            if n:
+                hub.call_soon(again, n - 1)
+        hub.call_soon(again, 2)
+        hub.call_soon(lst.append, 'other')
+        api.sleep(0)
+        self.assertEquals(lst[:2], [2, 'other'])
+
+
+class TestCallbackBudget(LimitedTestCase):
+    def tearDown(self):
+        hubs.get_hub().set_callback_budget(None, None)
+        super(TestCallbackBudget, self).tearDown()
+
+    def set_budget(self, count=None, seconds=None):
+        hub = hubs.get_hub()
+        if using_pyevent(None) or getattr(hub, 'uses_twisted_reactor', None):
+            raise SkipTest('hub ignores callback budgets')
+        hub.set_callback_budget(count, seconds)
+
+    def test_io_between_batches(self):
+        hub = hubs.get_hub()
+        r, w = os.pipe()
+        lst = []
+        def readable(fileno):
+            lst.append('io')
+            os.read(r, 1)
+            hub.remove(listener)
+        listener = hub.add(hub.READ, r, readable)
+        try:
+            os.write(w, 'x')
+            self.set_budget(count=10)
+            hits = hub.budget_hits
+            for i in xrange(50):
+                hub.call_soon(lst.append, i)
+            api.sleep(0.01)
+        finally:
+            os.close(r)
+            os.close(w)
+        self.assertEquals([i for i in lst if i != 'io'], range(50))
+        self.assert_(lst.index('io') <= 10, lst)
+        self.assert_(hub.budget_hits - hits >= 4, hub.budget_hits - hits)
+
+    def test_timers_roll_over(self):
+        hub = hubs.get_hub()
+        self.set_budget(count=3)
+        lst = []
+        for i in xrange(10):
+            hub.schedule_call_global(0, lst.append, i)
+        api.sleep(0.01)
+        self.assertEquals(lst, range(10))
+
+    def test_timers_dont_starve_ready(self):
+        hub = hubs.get_hub()
+        self.set_budget(count=10)
+        lst = []
+        for i in xrange(50):
+            hub.schedule_call_global(0, lst.append, i)
+        for i in xrange(5):
+            hub.call_soon(lst.append, 'ready')
+        api.sleep(0.01)
+        self.assertEquals([i for i in lst if i != 'ready'], range(50))
+        # the ready callbacks get a turn after the first batch of timers,
+        # not after all of them
+        self.assert_(len(lst) - lst[::-1].index('ready') <= 20, lst)
+
+    def test_time_budget(self):
+        hub = hubs.get_hub()
+        self.set_budget(seconds=0.01)
+        hits = hub.budget_hits
+        def slow():
+            time.sleep(0.006)
+        for i in xrange(4):
+            hub.call_soon(slow)
+        api.sleep(0.05)
+        self.assert_(hub.budget_hits > hits)
+
+    def test_invalid(self):
+        hub = hubs.get_hub()
+        self.set_budget()
+        self.assertRaises(ValueError, hub.set_callback_budget, 0)
+        self.assertRaises(ValueError, hub.set_callback_budget, None, -1)
+
+
+class TestCallSoonThreadsafe(LimitedTestCase):
+    def test_from_thread(self):
+        from eventlet import patcher
+        threading = patcher.original('threading')
+        hub = hubs.get_hub()
+        done = eventlet.event.Event()
+        lst = []
+        def add(i):
+            lst.append(i)
+            if i == 99:
+                done.send()
+        def run():
+            for i in xrange(100):
+                hub.call_soon_threadsafe(add, i)
+        api.sleep(0)
+        wakes = hub.waker.wakes
+        t = threading.Thread(target=run)
+        t.start()
+        done.wait()
+        t.join()
+        self.assertEquals(lst, range(100))
+        # a burst of calls is coalesced into far fewer wakeups
+        self.assert_(hub.waker.wakes - wakes < 100, hub.waker.wakes - wakes)
+
+    def test_wakes_sleeping_hub(self):
+        from eventlet import patcher
+        threading = patcher.original('threading')
+        time = patcher.original('time')
+        hub = hubs.get_hub()
+        done = eventlet.event.Event()
+        def run():
+            time.sleep(0.05)
+            hub.call_soon_threadsafe(done.send, 'ok')
+        t = threading.Thread(target=run)
+        t.start()
+        self.assertEquals(done.wait(), 'ok')
+        t.join()
+
+    def test_waker_not_a_reader(self):
+        api.sleep(0)
+        self.assert_(hubs.get_hub().waker is not None)
+        self.assertEquals(hubs.get_hub().get_readers(), [])
+
+    def test_wakes_idle_hub(self):
+        # nothing else is going on, so only the wakeup can end the hub's wait
+        from eventlet import patcher
+        threading = patcher.original('threading')
+        time = patcher.original('time')
+        hub = hubs.get_hub()
+        api.sleep(0)
+        done = eventlet.event.Event()
+        def run():
+            time.sleep(0.2)
+            hub.call_soon_threadsafe(done.send, time.time())
+        # the test's own one second limit would cut the wait short too
+        self.timer.cancel()
+        timeout = eventlet.Timeout(5)
+        start = time.time()
+        t = threading.Thread(target=run)
+        t.start()
+        try:
+            sent = done.wait()
+        finally:
+            timeout.cancel()
+        elapsed = time.time() - start
+        t.join()
+        self.assert_(elapsed < 0.5, elapsed)
+        self.assert_(time.time() - sent < 0.1)
+
+
+class TestTimerWheel(LimitedTestCase):
+    def setUp(self):
+        super(TestTimerWheel, self).setUp()
+        hubs.get_hub().set_timer_backend('wheel')
+
+    def tearDown(self):
+        hubs.get_hub().set_timer_backend('heap')
+        super(TestTimerWheel, self).tearDown()
+
+    def test_ordering(self):
+        lst = []
+        hubs.get_hub().schedule_call_global(DELAY*40, lst.append, 3)
+        hubs.get_hub().schedule_call_global(DELAY*20, lst.append, 1)
+        hubs.get_hub().schedule_call_global(DELAY*20, lst.append, 2)
+        hubs.get_hub().schedule_call_global(0, lst.append, 0)
+        while len(lst) < 4:
+            api.sleep(DELAY)
+        self.assertEquals(lst, [0,1,2,3])
+
+    def test_sleep(self):
+        start = time.time()
+        api.sleep(0.05)
+        delay = time.time() - start
+        assert delay >= 0.05, delay
+
+    def test_same_slot_ordering(self):
+        # a slot holds its timers unordered; the hub fires them straight
+        # from what the wheel hands back
+        hub = hubs.get_hub()
+        lst = []
+        for i in (5, 3, 1, 4, 2):
+            hub.schedule_call_global(0.02 + DELAY*i, lst.append, i)
+        while len(lst) < 5:
+            api.sleep(DELAY)
+        self.assertEquals(lst, [1, 2, 3, 4, 5])
+        self.assertEquals(len(hub.expired), 0)
+
+    def test_cancel_removes(self):
+        hub = hubs.get_hub()
+        hub.prepare_timers()
+        before = len(hub.wheel)
+        timers = [hub.schedule_call_global(30, lambda: None)
+                  for i in xrange(100)]
+        hub.prepare_timers()
+        self.assertEquals(len(hub.wheel), before + 100)
+        for t in timers:
+            t.cancel()
+        self.assertEquals(len(hub.wheel), before)
+
+    def test_switch_backend(self):
+        hub = hubs.get_hub()
+        lst = []
+        hub.schedule_call_global(DELAY*20, lst.append, 1)
+        hub.set_timer_backend('heap')
+        hub.set_timer_backend('wheel')
+        api.sleep(DELAY*40)
+        self.assertEquals(lst, [1])
+
+    def test_unknown_backend(self):
+        self.assertRaises(ValueError, hubs.get_hub().set_timer_backend, 'x')
+
+
+def _persistent_hub(_f):
+    return hasattr(hubs.get_hub(), 'set_persistent')
+
+class TestPersistentRegistration(LimitedTestCase):
+    mode = {}
+
+    def setUp(self):
+        super(TestPersistentRegistration, self).setUp()
+        hub = hubs.get_hub()
+        if self.mode.get('edge_triggered') and \
+           not getattr(hub, 'EDGE_TRIGGERED', None):
+            self.timer.cancel()
+            raise SkipTest()
+        if _persistent_hub(None):
+            hub.set_persistent(True, **self.mode)
+
+    def tearDown(self):
+        if _persistent_hub(None):
+            hubs.get_hub().set_persistent(False)
+        super(TestPersistentRegistration, self).tearDown()
+
+    def _pair(self):
+        server = eventlet.listen(('127.0.0.1', 0))
+        client = eventlet.connect(server.getsockname())
+        conn, addr = server.accept()
+        server.close()
+        return client, conn
+
+    @skip_unless(_persistent_hub)
+    def test_recv_saves_syscalls(self):
+        hub = hubs.get_hub()
+        client, conn = self._pair()
+        def echo():
+            while True:
+                data = conn.recv(10)
+                if not data:
+                    break
+                conn.sendall(data)
+            conn.close()
+        gt = eventlet.spawn(echo)
+        calls = hub.ctl_calls
+        for i in xrange(10):
+            client.sendall('x')
+            self.assertEquals(client.recv(10), 'x')
+        # once both ends are registered, waiting is nearly free; without
+        # persistent registration this takes around 40 calls
+        self.assert_(hub.ctl_calls - calls <= 5, hub.ctl_calls - calls)
+        self.assert_(hub.syscall_stats()['ctl_saved'] >= 20)
+        client.close()
+        gt.wait()
+
+    @skip_unless(_persistent_hub)
+    def test_close_releases(self):
+        hub = hubs.get_hub()
+        client, conn = self._pair()
+        eventlet.spawn(conn.sendall, 'x')
+        self.assertEquals(client.recv(1), 'x')
+        fileno = client.fileno()
+        self.assert_(fileno in hub.registered)
+        client.close()
+        self.assert_(fileno not in hub.registered)
+        conn.close()
+
+    @skip_unless(_persistent_hub)
+    def test_ready_while_nobody_waits(self):
+        client, conn = self._pair()
+        eventlet.spawn(conn.sendall, 'x')
+        self.assertEquals(client.recv(1), 'x')
+        conn.sendall('y')
+        # the data arrives while the client is not waiting; the next wait
+        # must still be woken up
+        eventlet.sleep(0.01)
+        hubs.trampoline(client, read=True, timeout=0.5)
+        self.assertEquals(client.recv(1), 'y')
+        client.close()
+        conn.close()
+
+
+class TestEdgeTriggeredRegistration(TestPersistentRegistration):
+    mode = {'edge_triggered': True}
+
+
 class TestDebug(LimitedTestCase):
     def test_debug_listeners(self):
         hubs.get_hub().set_debug_listeners(True)
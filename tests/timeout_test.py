@@ -1,6 +1,7 @@
 from tests import LimitedTestCase
 from eventlet import timeout
 from eventlet import greenthread
+from eventlet import hubs
 DELAY = 0.01
 
 class TestDirectRaise(LimitedTestCase):
@@ -51,4 +52,58 @@ class TestWithTimeout(LimitedTestCase):
                                         timeout_value='b')
         self.assertRaises(timeout.Timeout,
             timeout.with_timeout, DELAY, longer_timeout)
-        
\ No newline at end of file
+        
+
+class TestLazy(LimitedTestCase):
+    def test_no_timer_without_switch(self):
+        hub = hubs.get_hub()
+        before = hub.get_timers_count()
+        tm = timeout.Timeout(DELAY, lazy=True)
+        self.assert_(tm.pending, repr(tm))
+        self.assertEquals(hub.get_timers_count(), before)
+        tm.cancel()
+        self.assert_(not tm.pending, repr(tm))
+        self.assertEquals(getattr(greenthread.getcurrent(),
+                                  'lazy_timeouts', []), [])
+
+    def test_fires_once_suspended(self):
+        tm = timeout.Timeout(DELAY, lazy=True)
+        try:
+            try:
+                greenthread.sleep(DELAY * 10)
+            except timeout.Timeout, t:
+                self.assert_(t is tm, (t, tm))
+            else:
+                self.fail("lazy timeout did not fire")
+        finally:
+            tm.cancel()
+
+    def test_deadline_counts_from_start(self):
+        # time spent before the first switch still counts
+        import time
+        tm = timeout.Timeout(DELAY * 5, lazy=True)
+        start = time.time()
+        try:
+            time.sleep(DELAY * 4)
+            self.assertRaises(timeout.Timeout, greenthread.sleep, DELAY * 10)
+        finally:
+            tm.cancel()
+        self.assert_(time.time() - start < DELAY * 8, time.time() - start)
+
+    def test_nested(self):
+        outer = timeout.Timeout(DELAY, lazy=True)
+        try:
+            inner = timeout.Timeout(DELAY * 10, lazy=True)
+            try:
+                try:
+                    greenthread.sleep(DELAY * 20)
+                except timeout.Timeout, t:
+                    self.assert_(t is outer, (t, outer))
+                else:
+                    self.fail("outer timeout did not fire")
+            finally:
+                inner.cancel()
+        finally:
+            outer.cancel()
+        # the cancelled inner timeout must not fire later
+        greenthread.sleep(DELAY * 15)
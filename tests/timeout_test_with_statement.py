@@ -114,3 +114,26 @@ class Test(LimitedTestCase):
                 assert t1.pending, t1
                 assert not t2.pending, t2
         assert not t1.pending, t1
+
+    def test_lazy(self):
+        from eventlet import hubs
+        hub = hubs.get_hub()
+        before = hub.get_timers_count()
+        with Timeout(DELAY, lazy=True) as t:
+            assert t.pending, t
+        assert not t.pending, t
+        self.assertEquals(hub.get_timers_count(), before)
+
+        with Timeout(DELAY, False, lazy=True):
+            sleep(DELAY*3)
+            raise AssertionError('should not get there')
+
+        with Timeout(DELAY*2, lazy=True) as t1:
+            with Timeout(DELAY, lazy=True) as t2:
+                try:
+                    sleep(DELAY*3)
+                except Timeout, ex:
+                    assert ex is t2, (ex, t2)
+                assert t1.pending, t1
+                assert not t2.pending, t2
+        assert not t1.pending, t1
@@ -2,7 +2,7 @@ from unittest import TestCase, main
 
 import eventlet
 from eventlet import hubs
-from eventlet.hubs import timer
+from eventlet.hubs import timer, timerwheel
 
 class TestTimer(TestCase):
     def test_copy(self):
@@ -33,5 +33,51 @@ class TestTimer(TestCase):
         assert not hub.running
         
 
+class TestTimerWheel(TestCase):
+    def test_add_due(self):
+        w = timerwheel.TimerWheel(10, resolution=1)
+        self.assert_(not w.add(10.5, 'now'))
+        self.assert_(w.add(11.5, 'later'))
+        self.assertEquals(len(w), 1)
+
+    def test_expire_across_levels(self):
+        # 4 slots per wheel, so timers have to cascade down several levels
+        w = timerwheel.TimerWheel(0, resolution=1, bits=2, levels=3)
+        deadlines = [1.5, 3, 5.25, 17, 40.5, 63, 100, 1000]
+        for when in deadlines:
+            self.assert_(w.add(when, when))
+        expired = []
+        for now in xrange(1, 1001):
+            nd = w.next_deadline()
+            pending = [when for when in deadlines if when not in expired]
+            self.assert_(nd <= min(pending), (now, nd, pending))
+            for when, seq, t in w.expire(now):
+                self.assertEquals(int(when), now)
+                expired.append(when)
+        self.assertEquals(expired, deadlines)
+        self.assertEquals(len(w), 0)
+        self.assertEquals(w.next_deadline(), None)
+
+    def test_expire_jump(self):
+        w = timerwheel.TimerWheel(0, resolution=1, bits=2, levels=3)
+        deadlines = [2, 9, 33, 70]
+        for when in deadlines:
+            w.add(when, when)
+        self.assertEquals(sorted(when for when, seq, t in w.expire(50)),
+                          [2, 9, 33])
+        self.assertEquals([when for when, seq, t in w.expire(70)], [70])
+
+    def test_remove(self):
+        w = timerwheel.TimerWheel(0, resolution=1)
+        for i in xrange(1, 1000):
+            w.add(i, i)
+        for i in xrange(1, 1000, 2):
+            w.remove(i)
+        w.remove('unknown')
+        self.assertEquals(len(w), 499)
+        self.assertEquals(sorted(t for when, seq, t in w.expire(1000)),
+                          range(2, 1000, 2))
+
+
 if __name__ == '__main__':
     main()
@@ -13,10 +13,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import operator
 import random
 from sys import stdout
 import time
 import re
+import thread
 from tests import skipped, skip_with_pyevent, LimitedTestCase, main
 
 from eventlet import tpool, debug
@@ -163,6 +165,155 @@ class TestTpool(LimitedTestCase):
         tpool.killall()
         tpool.setup()
 
+    @skip_with_pyevent
+    def test_autoscaling(self):
+        saved = tpool.stats()
+        tpool.resize(min_threads=1, max_threads=4, idle_timeout=0.1)
+        try:
+            tpool.setup()
+            self.assertEqual(tpool.stats()['threads'], 1)
+            pile = eventlet.GreenPile(6)
+            start = time.time()
+            for i in xrange(6):
+                pile.spawn(tpool.execute, time.sleep, 0.1)
+            eventlet.sleep(0.05)
+            # four at a time, and no more than four threads
+            stats = tpool.stats()
+            self.assertEqual(stats['threads'], 4)
+            self.assertEqual(stats['queued'], 2)
+            list(pile)
+            elapsed = time.time() - start
+            self.assert_(0.2 <= elapsed < 0.3, elapsed)
+            stats = tpool.stats()
+            self.assertEqual(stats['executed'] - saved['executed'], 6)
+            self.assert_(stats['wait_max'] >= 0.09, stats)
+            # the threads above the minimum go away when idle
+            for i in xrange(20):
+                eventlet.sleep(0.05)
+                if tpool.stats()['threads'] == 1:
+                    break
+            self.assertEqual(tpool.stats()['threads'], 1)
+            tpool.resize(min_threads=3)
+            self.assertEqual(tpool.stats()['threads'], 3)
+            self.assertRaises(ValueError, tpool.resize, max_threads=2)
+        finally:
+            tpool.resize(saved['min_threads'], saved['max_threads'], 60)
+
+    @skip_with_pyevent
+    def test_executor_isolation(self):
+        slow = tpool.Executor('slow', size=1)
+        try:
+            blocked = eventlet.spawn(slow.execute, time.sleep, 0.2)
+            queued = eventlet.spawn(slow.execute, lambda: 'queued')
+            eventlet.sleep(0.05)
+            # the default executor isn't held up by the slow one
+            start = time.time()
+            self.assertEqual(tpool.execute(lambda: 'quick'), 'quick')
+            self.assert_(time.time() - start < 0.1)
+            self.assertEqual(slow.stats()['queued'], 1)
+            blocked.wait()
+            self.assertEqual(queued.wait(), 'queued')
+            # proxies, and the proxies they return, use their executor
+            prox = tpool.Proxy(re, autowrap_names=('compile',),
+                               executor=slow)
+            exp = prox.compile('.')
+            self.assert_(isinstance(exp, tpool.Proxy))
+            self.assert_(exp.match('x'))
+            self.assertEqual(slow.stats()['executed'], 4)
+            # from one of its threads, execute() just calls
+            self.assertEqual(slow.execute(tpool.execute, lambda: 'nested'),
+                             'nested')
+        finally:
+            slow.killall()
+
+    @skip_with_pyevent
+    def test_abandoned_calls(self):
+        ex = tpool.Executor('cancel', size=1)
+        try:
+            calls = []
+            blocked = eventlet.spawn(ex.execute, time.sleep, 0.2)
+            eventlet.sleep(0.01)
+            killed = eventlet.spawn(ex.execute, calls.append, 'killed')
+            eventlet.sleep(0.01)
+            killed.kill()
+            self.assertRaises(eventlet.Timeout, ex.execute_with_timeout,
+                              0.05, calls.append, 'timed out')
+            self.assertEqual(ex.execute_with_timeout(
+                0.05, calls.append, 'value', timeout_value='gave up'),
+                'gave up')
+            blocked.wait()
+            self.assertEqual(ex.execute_with_timeout(1, calls.append, 'ok'),
+                             None)
+            self.assertEqual(calls, ['ok'])
+            self.assertEqual(ex.stats()['dropped'], 3)
+            # a call that's already running finishes, and nobody gets the
+            # result
+            self.assertRaises(eventlet.Timeout, ex.execute_with_timeout,
+                              0.05, time.sleep, 0.1)
+            self.assertEqual(ex.stats()['late'], 0)
+            ex.execute(lambda: None)
+            eventlet.sleep(0.01)
+            self.assertEqual(ex.stats()['late'], 1)
+        finally:
+            ex.killall()
+
+    @skip_with_pyevent
+    def test_discard_late_results(self):
+        ex = tpool.Executor('discard', size=1)
+        try:
+            discarded = []
+            def slow(value):
+                time.sleep(0.1)
+                return value
+            def fail():
+                time.sleep(0.1)
+                raise RuntimeError
+            self.assertEqual(ex.execute_with_timeout(
+                0.05, slow, 'late', timeout_value='gave up',
+                discard=discarded.append), 'gave up')
+            eventlet.sleep(0.1)
+            self.assertEqual(discarded, ['late'])
+            self.assertRaises(eventlet.Timeout, ex.execute_with_timeout,
+                              0.05, fail, discard=discarded.append)
+            # results that arrive in time aren't discarded
+            self.assertEqual(ex.execute_with_timeout(
+                1, slow, 'ok', discard=discarded.append), 'ok')
+            self.assertEqual(discarded, ['late'])
+            self.assertEqual(ex.stats()['late'], 2)
+        finally:
+            ex.killall()
+
+    @skip_with_pyevent
+    def test_execute_many(self):
+        self.assertEqual(tpool.execute_many([]), [])
+        calls = [(operator.add, (i, 1)) for i in range(50)]
+        calls.append((dict, (), {'a': 1}))
+        self.assertEqual(tpool.execute_many(calls),
+                         range(1, 51) + [{'a': 1}])
+        self.assertEqual(tpool.execute_many(calls, chunksize=7),
+                         range(1, 51) + [{'a': 1}])
+        self.assertEqual(tpool.map(operator.mul, range(5), range(6)),
+                         [0, 1, 4, 9, 16])
+        self.assertRaises(ZeroDivisionError, tpool.map, operator.div,
+                          [1, 2, 3], [1, 0, 1])
+
+    @skip_with_pyevent
+    def test_execute_many_batches(self):
+        ex = tpool.Executor('batches', size=4)
+        try:
+            idents = ex.map(lambda i: thread.get_ident(), range(100))
+            self.assertEqual(len(idents), 100)
+            self.assert_(thread.get_ident() not in idents)
+            self.assertEqual(ex.stats()['executed'], 4)
+            self.assertEqual(ex.map(thread.get_ident, chunksize=100), [])
+            ex.map(lambda i: i, range(100), chunksize=100)
+            self.assertEqual(ex.stats()['executed'], 5)
+            # from one of the pool's threads, the calls are just made
+            self.assertEqual(ex.execute(ex.map, abs, [-1, -2]), [1, 2])
+            self.assertEqual(ex.stats()['executed'], 6)
+        finally:
+            ex.killall()
+
     @skip_with_pyevent
     def test_autowrap(self):
         x = tpool.Proxy({'a':1, 'b':2}, autowrap=(int,))
@@ -3,8 +3,10 @@ from eventlet import greenthread
 import eventlet
 import errno
 import os
+import signal
 import socket
 import sys
+import time
 from tests import skipped, LimitedTestCase
 from unittest import main
 
@@ -90,8 +92,11 @@ class ConnectionClosed(Exception):
     pass
 
 
-def read_http(sock):
-    fd = sock.makefile()
+def read_http(sock, fd=None):
+    # pass the same fd to read pipelined responses, which may have been
+    # buffered by a previous call
+    if fd is None:
+        fd = sock.makefile()
     try:
         response_line = fd.readline()
     except socket.error, exc:
@@ -794,7 +799,664 @@ class TestHttpd(LimitedTestCase):
         # should only be one chunk of zero size with two blank lines
         # (one terminates the chunk, one terminates the body)
         self.assertEqual(response, ['0', '', ''])
-        
+
+    def test_file_wrapper(self):
+        import tempfile
+        contents = ''.join(chr(i % 251) for i in xrange(100000))
+        fileno, path = tempfile.mkstemp()
+        os.write(fileno, contents)
+        os.close(fileno)
+        def file_app(env, start_response):
+            start_response('200 OK', [('Content-type', 'text/plain')])
+            f = open(path, 'rb')
+            f.seek(int(env['QUERY_STRING'] or 0))
+            return env['wsgi.file_wrapper'](f, 4096)
+
+        calls = []
+        orig_sendfile = greenio._sendfile
+        if orig_sendfile is not None:
+            def sendfile(*args):
+                calls.append(args)
+                return orig_sendfile(*args)
+            greenio._sendfile = sendfile
+        self.site.application = file_app
+        try:
+            sock = eventlet.connect(('localhost', self.port))
+            fd = sock.makefile()
+            fd.write('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            fd.flush()
+            response_line, headers, body = read_http(sock)
+            self.assertEqual(headers['content-length'], str(len(contents)))
+            self.assert_('transfer-encoding' not in headers)
+            self.assertEqual(body, contents)
+            # keep-alive still works, and the file position is honoured
+            fd.write('GET /?1000 HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            fd.flush()
+            response_line, headers, body = read_http(sock)
+            self.assertEqual(body, contents[1000:])
+            fd.close()
+        finally:
+            greenio._sendfile = orig_sendfile
+            os.unlink(path)
+        if orig_sendfile is not None:
+            self.assert_(calls)
+
+    def test_file_wrapper_not_a_file(self):
+        # file-like objects without a descriptor are iterated over
+        def file_app(env, start_response):
+            start_response('200 OK', [('Content-type', 'text/plain')])
+            return env['wsgi.file_wrapper'](StringIO('x' * 10000), 4096)
+
+        self.site.application = file_app
+        sock = eventlet.connect(('localhost', self.port))
+        fd = sock.makefile()
+        fd.write('GET / HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n')
+        fd.flush()
+        result = fd.read()
+        self.assert_('Transfer-Encoding: chunked' in result, result)
+        self.assertEqual(''.join(result.split('\r\n\r\n', 1)[1].split('\r\n')[1::2]), 'x' * 10000)
+
+    def test_file_wrapper_content_length(self):
+        import tempfile
+        f = tempfile.TemporaryFile()
+        f.write('abcdefghij')
+        f.flush()
+        f.seek(0)
+        def file_app(env, start_response):
+            start_response('200 OK', [('Content-type', 'text/plain'),
+                                      ('Content-Length', '4')])
+            return env['wsgi.file_wrapper'](f)
+
+        self.site.application = file_app
+        sock = eventlet.connect(('localhost', self.port))
+        fd = sock.makefile()
+        fd.write('GET / HTTP/1.0\r\nHost: localhost\r\n\r\n')
+        fd.flush()
+        response_line, headers, body = read_http(sock)
+        self.assertEqual(headers['content-length'], '4')
+        self.assertEqual(body, 'abcd')
+        fd.close()
+        f.close()
+
+    def test_file_wrapper_bad_content_length(self):
+        import tempfile
+        f = tempfile.TemporaryFile()
+        f.write('abcdefghij')
+        f.flush()
+        f.seek(0)
+        def file_app(env, start_response):
+            start_response('200 OK', [('Content-type', 'text/plain'),
+                                      ('Content-Length', 'bogus')])
+            return env['wsgi.file_wrapper'](f)
+
+        self.site.application = file_app
+        sock = eventlet.connect(('localhost', self.port))
+        fd = sock.makefile()
+        fd.write('GET / HTTP/1.0\r\nHost: localhost\r\n\r\n')
+        fd.flush()
+        result = fd.read()
+        self.assert_(result.startswith('HTTP/1.1 200 OK\r\n'), result)
+        self.assertEqual(result.split('\r\n\r\n', 1)[1], 'abcdefghij')
+        fd.close()
+        f.close()
+
+    def test_connection_files_not_duped(self):
+        filenos = []
+        def fileno_app(env, start_response):
+            rfile = env['eventlet.input'].rfile
+            self.assert_(isinstance(rfile, greenio.GreenSocketFile))
+            filenos.append(rfile.fileno())
+            start_response('200 OK', [('Content-type', 'text/plain')])
+            return ['ok']
+
+        self.site.application = fileno_app
+        sock = eventlet.connect(('localhost', self.port))
+        fd = sock.makefile()
+        for i in xrange(2):
+            fd.write('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            fd.flush()
+            response_line, headers, body = read_http(sock)
+            self.assertEqual(body, 'ok')
+        fd.close()
+        sock.close()
+        self.assertEqual(len(filenos), 2)
+        self.assertEqual(filenos[0], filenos[1])
+
+    def test_keepalive_timeout(self):
+        self.spawn_server(keepalive_timeout=0.05)
+        sock = eventlet.connect(('localhost', self.port))
+        fd = sock.makefile()
+        fd.write('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        fd.flush()
+        response_line, headers, body = read_http(sock)
+        self.assertEqual(body, 'hello world')
+        fd.write('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        fd.flush()
+        response_line, headers, body = read_http(sock)
+        self.assertEqual(body, 'hello world')
+        eventlet.sleep(0.1)
+        self.assertEqual(sock.recv(1024), '')
+        fd.close()
+        sock.close()
+
+    def test_max_requests_per_connection(self):
+        self.spawn_server(max_requests_per_connection=2)
+        sock = eventlet.connect(('localhost', self.port))
+        fd = sock.makefile()
+        fd.write('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        fd.flush()
+        response_line, headers, body = read_http(sock)
+        self.assert_('connection' not in headers)
+        fd.write('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        fd.flush()
+        response_line, headers, body = read_http(sock)
+        self.assertEqual(headers['connection'], 'close')
+        self.assertEqual(body, 'hello world')
+        fd.write('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        fd.flush()
+        self.assertRaises(ConnectionClosed, read_http, sock)
+        fd.close()
+        sock.close()
+
+    def test_idle_connections_free_pool(self):
+        pool = eventlet.GreenPool(1)
+        self.spawn_server(custom_pool=pool, park_idle=True)
+        socks = []
+        for i in xrange(3):
+            sock = eventlet.connect(('localhost', self.port))
+            socks.append(sock)
+            sock.sendall('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            response_line, headers, body = read_http(sock)
+            self.assertEqual(body, 'hello world')
+        self.assertEqual(pool.running(), 0)
+        # the parked connections still work
+        for sock in socks:
+            sock.sendall('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            response_line, headers, body = read_http(sock)
+            self.assertEqual(body, 'hello world')
+            sock.close()
+
+    def test_parking_off(self):
+        class SpawnOnlyPool(object):
+            # has spawn_n but no free(), so connections can't be parked
+            def __init__(self):
+                self.pool = eventlet.GreenPool()
+            def spawn_n(self, func, *args):
+                self.pool.spawn_n(func, *args)
+        for kwargs in ({},
+                       {'custom_pool': SpawnOnlyPool(), 'park_idle': True}):
+            self.spawn_server(**kwargs)
+            sock = eventlet.connect(('localhost', self.port))
+            for i in xrange(3):
+                sock.sendall('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+                response_line, headers, body = read_http(sock)
+                self.assertEqual(body, 'hello world')
+                self.assertEqual(self.parked(), [])
+            sock.close()
+
+    def test_close_idle(self):
+        from eventlet import event
+        started = event.Event()
+        self.spawn_server(server_event=started, park_idle=True)
+        serv = started.wait()
+        sock = eventlet.connect(('localhost', self.port))
+        sock.sendall('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        response_line, headers, body = read_http(sock)
+        eventlet.sleep(0)
+        self.assertEqual(len(serv.parked_connections), 1)
+        serv.close_idle()
+        eventlet.sleep(0)
+        self.assertEqual(serv.parked_connections, set())
+        self.assertEqual(self.parked(), [])
+        self.assertEqual(sock.recv(1), '')
+        sock.close()
+
+    def parked(self):
+        from eventlet import hubs
+        hub = hubs.get_hub()
+        found = []
+        for listeners in hub.listeners[hub.READ].values():
+            for listener in listeners:
+                owner = getattr(listener.cb, 'im_self', None)
+                if isinstance(owner, wsgi.ParkedConnection):
+                    found.append(owner)
+        return found
+
+    def test_parked_connection_watched_by_hub(self):
+        self.spawn_server(park_idle=True)
+        parked = self.parked
+        sock = eventlet.connect(('localhost', self.port))
+        for i in xrange(2):
+            sock.sendall('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            response_line, headers, body = read_http(sock)
+            self.assertEqual(body, 'hello world')
+            eventlet.sleep(0)
+            found = parked()
+            self.assertEqual(len(found), 1)
+            self.assert_(found[0].proto.parked)
+            self.assertEqual(found[0].proto.environ, None)
+        sock.close()
+        eventlet.sleep(0.01)
+        self.assertEqual(parked(), [])
+
+    def test_pipelined_responses_batched(self):
+        sends = []
+        orig_sendall = greenio.GreenSocket.sendall
+        def sendall(sock, data, *args):
+            sends.append((sock, data))
+            return orig_sendall(sock, data, *args)
+        sock = eventlet.connect(('localhost', self.port))
+        greenio.GreenSocket.sendall = sendall
+        try:
+            sock.sendall('GET /a HTTP/1.1\r\nHost: localhost\r\n\r\n'
+                         'GET /b HTTP/1.1\r\nHost: localhost\r\n\r\n'
+                         'GET /c HTTP/1.1\r\nHost: localhost\r\n'
+                         'Connection: close\r\n\r\n')
+            fd = sock.makefile()
+            for i in xrange(3):
+                response_line, headers, body = read_http(sock, fd)
+                self.assertEqual(body, 'hello world')
+            self.assertRaises(ConnectionClosed, read_http, sock, fd)
+            fd.close()
+        finally:
+            greenio.GreenSocket.sendall = orig_sendall
+        server_sends = [data for s, data in sends if s is not sock]
+        self.assertEqual(len(server_sends), 1)
+        self.assertEqual(server_sends[0].count('hello world'), 3)
+        sock.close()
+
+    def test_response_writes_coalesced(self):
+        from eventlet import event
+        proceed = event.Event()
+        def writing_app(env, start_response):
+            write = start_response('200 OK', [('Content-type', 'text/plain')])
+            for i in xrange(20):
+                write('line %d\n' % i)
+            if env['PATH_INFO'] == '/stream':
+                # waiting sends what was written so far
+                proceed.wait()
+                write('more\n')
+            return []
+        self.site.application = writing_app
+        sends = []
+        orig_sendall = greenio.GreenSocket.sendall
+        def sendall(sock, data, *args):
+            sends.append((sock, data))
+            return orig_sendall(sock, data, *args)
+        sock = eventlet.connect(('localhost', self.port))
+        greenio.GreenSocket.sendall = sendall
+        try:
+            fd = sock.makefile()
+            fd.write('GET / HTTP/1.1\r\nHost: localhost\r\n'
+                     'Connection: close\r\n\r\n')
+            fd.flush()
+            response_line, headers, body = read_http(sock, fd)
+            self.assertEqual(body.count('line'), 20)
+            # the client's makefile() writes through a dup of its socket
+            server_sends = [data for s, data in sends
+                            if s is not sock and s is not fd._sock]
+            self.assertEqual(len(server_sends), 1)
+            fd.close()
+            sock.close()
+
+            sock = eventlet.connect(('localhost', self.port))
+            fd = sock.makefile()
+            fd.write('GET /stream HTTP/1.1\r\nHost: localhost\r\n'
+                     'Connection: close\r\n\r\n')
+            fd.flush()
+            while fd.readline() != '\r\n':
+                pass
+            self.assertEqual(fd.readline().strip(), '7')
+            self.assertEqual(fd.readline(), 'line 0\n')
+            proceed.send()
+            self.assert_('more\n' in fd.read())
+            fd.close()
+        finally:
+            greenio.GreenSocket.sendall = orig_sendall
+        sock.close()
+
+    def test_pipelined_post(self):
+        self.site.application = chunked_post
+        sock = eventlet.connect(('localhost', self.port))
+        sock.sendall('POST /a HTTP/1.1\r\nHost: localhost\r\n'
+                     'Content-Length: 5\r\n\r\nhello'
+                     'POST /a HTTP/1.1\r\nHost: localhost\r\n'
+                     'Transfer-Encoding: chunked\r\n\r\n'
+                     '5\r\nthere\r\n0\r\n\r\n'
+                     'GET /a HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        fd = sock.makefile()
+        bodies = []
+        for i in xrange(3):
+            response_line, headers, body = read_http(sock, fd)
+            bodies.append(body)
+        self.assertEqual(bodies, ['hello', 'there', ''])
+        fd.close()
+        sock.close()
+
+    def test_admission_queue(self):
+        from eventlet import event
+        release = event.Event()
+        def blocking_app(env, start_response):
+            if env['PATH_INFO'] == '/block':
+                release.wait()
+            start_response('200 OK', [('Content-type', 'text/plain')])
+            return ['done']
+        self.site.application = blocking_app
+        admission = wsgi.AdmissionQueue(max_queued=1)
+        self.spawn_server(custom_pool=eventlet.GreenPool(1),
+                          admission=admission)
+        a = eventlet.connect(('localhost', self.port))
+        # without parking, a kept-alive connection would keep the pool full
+        a.sendall('GET /block HTTP/1.1\r\nHost: localhost\r\n'
+                  'Connection: close\r\n\r\n')
+        eventlet.sleep(0.01)
+        b = eventlet.connect(('localhost', self.port))
+        b.sendall('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        eventlet.sleep(0.01)
+        self.assertEqual(admission.stats()['queued'], 1)
+        c = eventlet.connect(('localhost', self.port))
+        c.sendall('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        response_line, headers, body = read_http(c)
+        self.assert_(response_line.startswith('HTTP/1.1 503'), response_line)
+        self.assertEqual(headers['connection'], 'close')
+        release.send()
+        response_line, headers, body = read_http(a)
+        self.assertEqual(body, 'done')
+        response_line, headers, body = read_http(b)
+        self.assertEqual(body, 'done')
+        stats = admission.stats()
+        self.assertEqual(stats['queued'], 0)
+        self.assertEqual(stats['peak_queued'], 1)
+        self.assertEqual(stats['admitted'], 1)
+        self.assertEqual(stats['shed'], 1)
+        self.assert_(0 < stats['wait_max'] < 1, stats)
+        for sock in a, b, c:
+            sock.close()
+
+    def test_admission_max_wait(self):
+        from eventlet import event
+        release = event.Event()
+        def blocking_app(env, start_response):
+            release.wait()
+            start_response('200 OK', [('Content-type', 'text/plain')])
+            return ['done']
+        self.site.application = blocking_app
+        admission = wsgi.AdmissionQueue(max_queued=10, max_wait=0.05)
+        self.spawn_server(custom_pool=eventlet.GreenPool(1),
+                          admission=admission)
+        a = eventlet.connect(('localhost', self.port))
+        a.sendall('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        eventlet.sleep(0.01)
+        b = eventlet.connect(('localhost', self.port))
+        b.sendall('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        response_line, headers, body = read_http(b)
+        self.assert_(response_line.startswith('HTTP/1.1 503'), response_line)
+        self.assertEqual(admission.stats()['shed'], 1)
+        self.assertEqual(admission.stats()['queued'], 0)
+        release.send()
+        response_line, headers, body = read_http(a)
+        self.assertEqual(body, 'done')
+        a.close()
+        b.close()
+
+    def test_reuse_port_unsupported(self):
+        # serve_multi falls back to a shared socket when this returns None
+        option = greensocket.__dict__.pop('SO_REUSEPORT', None)
+        platform = sys.platform
+        sys.platform = 'sunos5'
+        try:
+            self.assertEqual(
+                wsgi._reuse_port_socket(('127.0.0.1', 0), socket.AF_INET),
+                None)
+        finally:
+            sys.platform = platform
+            if option is not None:
+                greensocket.SO_REUSEPORT = option
+
+    def test_serve_multi(self):
+        # the supervisor throttles restarts and the workers drain their
+        # requests, which takes longer than the usual test timeout
+        self.timer.cancel()
+        def pid_app(env, start_response):
+            if env['PATH_INFO'] == '/slow':
+                eventlet.sleep(0.2)
+            start_response('200 OK', [('Content-type', 'text/plain')])
+            return [str(os.getpid())]
+        listener = eventlet.listen(('127.0.0.1', 0))
+        addr = listener.getsockname()
+        listener.close()
+        supervisor = os.fork()
+        if not supervisor:
+            try:
+                wsgi.serve_multi(addr, pid_app, workers=1,
+                                 log=self.logfile)
+            finally:
+                os._exit(0)
+
+        def request(path='/'):
+            for i in xrange(100):
+                try:
+                    sock = eventlet.connect(addr)
+                    break
+                except socket.error:
+                    eventlet.sleep(0.05)
+            sock.sendall('GET %s HTTP/1.1\r\nHost: localhost\r\n'
+                         'Connection: close\r\n\r\n' % path)
+            return sock
+
+        try:
+            worker = int(read_http(request())[2])
+            self.assertNotEqual(worker, supervisor)
+            os.kill(worker, signal.SIGKILL)
+            for i in xrange(100):
+                replacement = int(read_http(request())[2])
+                if replacement != worker:
+                    break
+            self.assertNotEqual(replacement, worker)
+            # a request in progress when the supervisor is told to stop is
+            # still answered
+            sock = request('/slow')
+            eventlet.sleep(0.05)
+            os.kill(supervisor, signal.SIGTERM)
+            response_line, headers, body = read_http(sock)
+            self.assert_(response_line.startswith('HTTP/1.1 200'))
+            self.assertEqual(int(body), replacement)
+            self.assertEqual(os.waitpid(supervisor, 0), (supervisor, 0))
+            self.assertRaises(socket.error, eventlet.connect, addr)
+        finally:
+            try:
+                os.kill(supervisor, signal.SIGKILL)
+                os.waitpid(supervisor, 0)
+            except OSError:
+                pass
+
+    def test_async_log(self):
+        log = wsgi.AsyncLog(self.logfile)
+        self.spawn_server(log=log)
+        sock = eventlet.connect(('localhost', self.port))
+        fd = sock.makefile()
+        for i in xrange(3):
+            fd.write('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            fd.flush()
+            read_http(sock, fd)
+        fd.close()
+        log.flush()
+        lines = [line for line in self.logfile.getvalue().splitlines()
+                 if 'GET' in line]
+        self.assertEqual(len(lines), 3)
+        self.assert_('"GET / HTTP/1.1" 200' in lines[-1], lines[-1])
+        # the requests and the "starting up" line
+        self.assertEqual(log.stats()['written'], 4)
+        self.assertEqual(log.stats()['buffered'], 0)
+
+    def test_async_log_slow_file(self):
+        from eventlet import patcher
+        sleep = patcher.original('time').sleep
+        class SlowLog(object):
+            def __init__(self):
+                self.data = []
+            def write(self, data):
+                sleep(0.1)
+                self.data.append(data)
+        slow = SlowLog()
+        log = wsgi.AsyncLog(slow, max_buffered=20)
+        start = time.time()
+        log.write('a' * 8 + '\n')
+        eventlet.sleep(0)
+        # these go in the next batch, or don't fit at all
+        log.write('b' * 8 + '\n')
+        log.write('c' * 8 + '\n')
+        self.assert_(time.time() - start < 0.05)
+        self.assertEqual(log.stats()['dropped'], 1)
+        log.flush()
+        self.assertEqual(slow.data, ['a' * 8 + '\n', 'b' * 8 + '\n'])
+        self.assertEqual(log.stats()['batches'], 2)
+
+    def test_input_lines(self):
+        def lines_app(env, start_response):
+            input = env['wsgi.input']
+            first = input.readline(3)
+            rest = list(input)
+            start_response('200 OK', [('Content-type', 'text/plain')])
+            return [repr([first] + rest)]
+        self.site.application = lines_app
+        sock = eventlet.connect(('localhost', self.port))
+        fd = sock.makefile()
+        fd.write('POST / HTTP/1.1\r\nHost: localhost\r\n'
+                 'Content-Length: 17\r\n\r\nline1\nline2\nline3')
+        fd.flush()
+        response_line, headers, body = read_http(sock, fd)
+        self.assertEqual(body, repr(['lin', 'e1\n', 'line2\n', 'line3']))
+        # a line that spans chunks, and a chunk extension and trailer
+        fd.write('POST / HTTP/1.1\r\nHost: localhost\r\n'
+                 'Transfer-Encoding: chunked\r\n\r\n'
+                 '5\r\nab\ncd\r\n4;x=y\r\ne\nfg\r\n0\r\n'
+                 'X-Trailer: 1\r\n\r\n')
+        fd.flush()
+        response_line, headers, body = read_http(sock, fd)
+        self.assertEqual(body, repr(['ab\n', 'cde\n', 'fg']))
+        # the connection is still in step after the trailer
+        fd.write('GET / HTTP/1.1\r\nHost: localhost\r\n'
+                 'Connection: close\r\n\r\n')
+        fd.flush()
+        response_line, headers, body = read_http(sock, fd)
+        self.assert_(response_line.startswith('HTTP/1.1 200'))
+
+    def test_input_spool(self):
+        spooled = []
+        def spool_app(env, start_response):
+            body = env['wsgi.input'].spool(threshold=1000)
+            spooled.append(body)
+            body.seek(-5, 2)
+            tail = body.read()
+            body.seek(0)
+            start_response('200 OK', [('Content-type', 'text/plain')])
+            return [tail, str(len(body.read()))]
+        self.site.application = spool_app
+        sock = eventlet.connect(('localhost', self.port))
+        fd = sock.makefile()
+        for body in ('x' * 500 + 'small', 'y' * 100000 + 'large'):
+            fd.write('POST / HTTP/1.1\r\nHost: localhost\r\n'
+                     'Content-Length: %d\r\n\r\n%s' % (len(body), body))
+            fd.flush()
+            response_line, headers, result = read_http(sock, fd)
+            self.assertEqual(result, body[-5:] + str(len(body)))
+        # only the body over the threshold went to a file
+        self.assert_(not hasattr(spooled[0], 'fileno'))
+        self.assert_(hasattr(spooled[1], 'fileno'))
+
+    def test_header_block_too_large(self):
+        sock = eventlet.connect(('localhost', self.port))
+        fd = sock.makefile()
+        fd.write('GET / HTTP/1.1\r\nHost: localhost\r\n')
+        for i in xrange(wsgi.MAX_HEADERS_SIZE // 20):
+            fd.write('X-Filler-%06d: xx\r\n' % i)
+        fd.write('\r\n')
+        fd.flush()
+        result = fd.read()
+        fd.close()
+        self.assert_(result.startswith('HTTP/1.0 400 Bad Request'), result)
+
+    def test_request_headers_environ(self):
+        environs = []
+        def environ_app(env, start_response):
+            environs.append(env)
+            start_response('200 OK', [('content-TYPE', 'text/plain'),
+                                      ('x-thing', 'yes')])
+            return ['ok']
+
+        self.site.application = environ_app
+        sock = eventlet.connect(('localhost', self.port))
+        fd = sock.makefile()
+        fd.write('POST /a%20b?c=d HTTP/1.1\r\n'
+                 'Host: localhost\r\n'
+                 'X-Folded: first\r\n'
+                 '  second\r\n'
+                 'X-Repeated: 1\r\n'
+                 'X-Repeated: 2\r\n'
+                 'Content-Type: application/x-www-form-urlencoded\r\n'
+                 'Content-Length: 0\r\n'
+                 '\r\n')
+        fd.flush()
+        response_line, headers, body = read_http(sock)
+        self.assertEqual(headers['content-type'], 'text/plain')
+        self.assertEqual(headers['x-thing'], 'yes')
+        self.assert_('date' in headers)
+        fd.close()
+        env = environs[0]
+        self.assertEqual(env['REQUEST_METHOD'], 'POST')
+        self.assertEqual(env['PATH_INFO'], '/a b')
+        self.assertEqual(env['QUERY_STRING'], 'c=d')
+        self.assertEqual(env['HTTP_HOST'], 'localhost')
+        self.assertEqual(env['HTTP_X_FOLDED'], 'first second')
+        self.assertEqual(env['HTTP_X_REPEATED'], '1,2')
+        self.assertEqual(env['CONTENT_TYPE'],
+                         'application/x-www-form-urlencoded')
+        self.assertEqual(env['CONTENT_LENGTH'], '0')
+        self.assert_('HTTP_CONTENT_TYPE' not in env)
+        self.assert_('HTTP_CONTENT_LENGTH' not in env)
+
+    def test_parse_headers(self):
+        headers = wsgi.parse_headers('Host: example.com\r\n'
+                                     'Content-Type: text/html; charset=utf-8\r\n'
+                                     'Accept: a\r\n'
+                                     'Accept: b\r\n'
+                                     'junk\r\n'
+                                     '\r\n'
+                                     'After: blank\r\n')
+        self.assertEqual(headers.getheader('host'), 'example.com')
+        self.assertEqual(headers['HOST'], 'example.com')
+        self.assertEqual(headers.get('missing', 'x'), 'x')
+        self.assert_('accept' in headers)
+        self.assert_('after' not in headers)
+        self.assertEqual(headers['accept'], 'b')
+        self.assertEqual(headers.getheaders('Accept'), ['a', 'b'])
+        self.assertEqual(headers.typeheader, 'text/html; charset=utf-8')
+        self.assertEqual(headers.type, 'text/html')
+        self.assertEqual(len(headers.headers), 4)
+        self.assertEqual(wsgi.parse_headers('').type, 'text/plain')
+
+    def test_date_header(self):
+        orig_time = wsgi.time
+        class FakeTime(object):
+            now = 1234567890.25
+            gmtime = staticmethod(orig_time.gmtime)
+            def time(self):
+                return self.now
+        wsgi.time = fake = FakeTime()
+        try:
+            line = wsgi.date_header()
+            self.assertEqual(line, 'Date: Fri, 13 Feb 2009 23:31:30 GMT\r\n')
+            fake.now += 0.5
+            self.assert_(wsgi.date_header() is line)
+            fake.now += 1
+            self.assertEqual(wsgi.date_header(),
+                             'Date: Fri, 13 Feb 2009 23:31:31 GMT\r\n')
+        finally:
+            wsgi.time = orig_time
+        self.assertEqual(wsgi.capitalize_header('x-forwarded-FOR'),
+                         'X-Forwarded-For')
+
 
 if __name__ == '__main__':
     main()